@@ -16,8 +16,7 @@ from reversion.admin import VersionAdmin
 from sorl.thumbnail.admin import AdminInlineImageMixin
 
 from . import models, forms
-from .properties.schema import sync_layer_schema, sync_ui_schema, clean_properties_not_in_schema_or_null, \
-    sync_properties_in_tiles
+from .properties.schema import sync_layer_schema, sync_ui_schema, sync_properties_in_tiles
 
 
 @admin_thumbnails.thumbnail('pictogram')
@@ -81,6 +80,24 @@ class RoutingSettingsInLine(NestedTabularInline):
     form = forms.RoutingSettingsForm
 
 
+class BackgroundJobInline(NestedTabularInline):
+    classes = ('collapse', )
+    verbose_name = _("Background job")
+    verbose_name_plural = _("Background jobs")
+    model = models.BackgroundJob
+    extra = 0
+    max_num = 0
+    can_delete = False
+    fields = ('action', 'owner', 'state', 'progress_display', 'created_at', 'updated_at', 'error')
+    readonly_fields = fields
+
+    def progress_display(self, obj):
+        progress = obj.progress
+        return f"{progress}% ({obj.done}/{obj.total})" if progress is not None else "-"
+
+    progress_display.short_description = _("Progress")
+
+
 @admin_thumbnails.thumbnail('pictogram')
 class CrudViewAdmin(OrderableAdmin, DjangoObjectActions, VersionAdmin, NestedModelAdmin):
     ordering_field = "order"
@@ -89,12 +106,13 @@ class CrudViewAdmin(OrderableAdmin, DjangoObjectActions, VersionAdmin, NestedMod
     form = forms.CrudViewForm
     list_display = ['name', 'group', 'order', 'pictogram_thumbnail']
     list_filter = ['group', ]
-    inlines = [FeatureDisplayGroupTabularInline, CrudPropertyInline, ExtraLayerStyleInLine, RoutingSettingsInLine]
+    inlines = [FeatureDisplayGroupTabularInline, CrudPropertyInline, ExtraLayerStyleInLine, RoutingSettingsInLine,
+               BackgroundJobInline]
     readonly_fields = ('ui_schema', )
     fieldsets = (
         (None, {'fields': (('name', 'object_name', 'object_name_plural', 'layer'), ('group', 'order', 'pictogram', 'pictogram_thumbnail'))}),
         (_('UI schema & properties'), {
-            'fields': ('default_list_properties', 'feature_title_property', 'ui_schema'),
+            'fields': ('default_list_properties', 'feature_title_property', 'search_config', 'ui_schema'),
             'classes': ('collapse', )
         }),
         (_("Document generation"), {
@@ -128,8 +146,9 @@ class CrudViewAdmin(OrderableAdmin, DjangoObjectActions, VersionAdmin, NestedMod
     sync_schemas.short_description = _("Sync layer schema and crud view ui schema with defined properties.")
 
     def clean_feature_properties(self, request, obj):
-        clean_properties_not_in_schema_or_null(obj)
-        messages.success(request, _("Feature properties has been cleaned."))
+        models.BackgroundJob.objects.create(crud_view=obj, action=models.BackgroundJob.CLEAN_FEATURE_PROPERTIES,
+                                            owner=request.user)
+        messages.success(request, _("Feature properties cleaning has been started. Follow its progress in jobs."))
 
     clean_feature_properties.label = _("Clean features with schema")
     clean_feature_properties.short_description = _("Clean feature properties not in generated layer schema.")
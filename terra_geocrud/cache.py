@@ -0,0 +1,40 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+from . import settings as app_settings
+
+
+class LocalLRUCache:
+    """ Thread safe least recently used cache, local to process. Size is read in TERRA_GEOCRUD[size_setting] """
+
+    def __init__(self, size_setting):
+        self.size_setting = size_setting
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > app_settings.TERRA_GEOCRUD[self.size_setting]:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def get_cache(alias_setting):
+    """ Django cache named in TERRA_GEOCRUD[alias_setting], or default cache if this alias is not configured """
+    alias = app_settings.TERRA_GEOCRUD[alias_setting]
+    return caches[alias if alias in settings.CACHES else DEFAULT_CACHE_ALIAS]
@@ -0,0 +1,152 @@
+import logging
+import mimetypes
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+from tempfile import TemporaryFile
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.template.loader import get_template
+from django.utils import formats, timezone
+from django.utils.text import slugify
+from geostore.models import Feature
+
+from . import settings as app_settings
+from .models import BackgroundJob
+from .properties.files import get_storage
+from .tasks import start_background_job
+from .threads import map_in_threads
+
+logger = logging.getLogger(__name__)
+
+
+def get_document_content_type(template):
+    """ Content type and suffix of documents generated by template. Templates with pdf suffix render pdf """
+    content_type, _encoding = mimetypes.guess_type(template.template_file.name)
+    path = Path(template.template_file.name)
+    suffix = path.suffix
+    for path_suffix in path.suffixes:
+        if 'pdf' in path_suffix:
+            content_type = "application/pdf"
+            suffix = ".pdf"
+    return content_type, suffix
+
+
+def get_document_name(template, feature):
+    _content_type, suffix = get_document_content_type(template)
+    feature_name = feature.layer.crud_view.get_feature_title(feature)
+    date_formatted = formats.date_format(timezone.localtime(), "SHORT_DATETIME_FORMAT")
+    return f"{template.name}_{feature_name}_{date_formatted}{suffix}"
+
+
+def get_documents_workers():
+    # rendering threads use their own database connection, not able to read data of current transaction
+    # (synchronous jobs in admin, tests)
+    return 1 if connection.in_atomic_block else app_settings.TERRA_GEOCRUD['JOBS_MAX_WORKERS']
+
+
+def render_features_documents(template, features, workers):
+    """
+    Render template for each feature, in parallel threads as documents mostly wait for map renders.
+    Template is loaded once. Yield (feature, content, error) in features order.
+    """
+    loaded_template = get_template(template.template_file.name)
+
+    def render(feature):
+        try:
+            return feature, loaded_template.render({'object': feature}), None
+        except Exception as exc:
+            logger.exception("Unable to generate document of feature %s", feature.pk)
+            return feature, None, str(exc)
+
+    yield from map_in_threads(render, features, workers)
+
+
+def generate_documents(job):
+    """
+    Background job generating a template document for each selected feature, in a zip stored in storage.
+    Documents are written in a temporary file as soon as they are rendered.
+    """
+    crud_view = job.crud_view
+    template = crud_view.templates.get(pk=job.params['template'])
+    features = list(crud_view.layer.features.filter(pk__in=job.params['features'])
+                    .select_related('layer__crud_view').prefetch_related('extra_geometries').order_by('pk'))
+    job.set_progress(0, len(features))
+    errors = {}
+    names = set()
+    with TemporaryFile() as tmp_file:
+        with zipfile.ZipFile(tmp_file, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            documents = render_features_documents(template, features, get_documents_workers())
+            for done, (feature, content, error) in enumerate(documents, start=1):
+                if error:
+                    errors[str(feature.identifier)] = error
+                else:
+                    # dates and titles can contain slashes, read as folders in zip
+                    name = get_document_name(template, feature).replace('/', '-')
+                    if name in names:
+                        path = Path(name)
+                        name = f"{path.stem}_{feature.identifier}{path.suffix}"
+                    names.add(name)
+                    archive.writestr(name, content)
+                job.set_progress(done)
+        tmp_file.seek(0)
+        path = get_storage().save(f'terra_geocrud/documents/{job.pk}/{slugify(template.name)}.zip', File(tmp_file))
+    job.result.update({'path': path, 'documents': len(names), 'errors': errors})
+
+
+def generate_document(job):
+    """ Background job generating template document of a feature, stored in storage """
+    crud_view = job.crud_view
+    template = crud_view.templates.get(pk=job.params['template'])
+    feature = crud_view.layer.features.select_related('layer__crud_view').get(pk=job.params['feature'])
+    job.set_progress(0, 1)
+    content = get_template(template.template_file.name).render({'object': feature})
+    name = get_document_name(template, feature).replace('/', '-')
+    job.result['path'] = get_storage().save(f'terra_geocrud/documents/{job.pk}/{name}', ContentFile(content))
+    job.set_progress(1)
+
+
+def request_document_generation(crud_view, template, feature, owner=None):
+    """
+    Job generating template document of feature, for owner. A job of owner with same template and feature version
+    is reused if it is waiting, running, or if its document is not expired.
+    """
+    owner = owner if owner is not None and owner.is_authenticated else None
+    params = {'template': template.pk, 'feature': feature.pk, 'updated_at': feature.updated_at.isoformat()}
+    expiration = timedelta(seconds=app_settings.TERRA_GEOCRUD['DOCUMENTS_EXPIRATION'])
+    created = False
+    with transaction.atomic():
+        # concurrent requests for same feature wait for lock, then reuse created job
+        list(Feature.objects.select_for_update().filter(pk=feature.pk).values_list('pk', flat=True))
+        job = crud_view.jobs.filter(
+            action=BackgroundJob.GENERATE_DOCUMENT, owner=owner, params=params,
+            state__in=(BackgroundJob.PENDING, BackgroundJob.RUNNING, BackgroundJob.SUCCESS),
+            updated_at__gte=timezone.now() - expiration,
+        ).first()
+        if job is None:
+            # bulk_create does not send post_save : job is started once feature lock is released
+            job, = BackgroundJob.objects.bulk_create([BackgroundJob(
+                crud_view=crud_view, action=BackgroundJob.GENERATE_DOCUMENT, owner=owner, params=params
+            )])
+            created = True
+    if created:
+        start_background_job(job)
+    job.refresh_from_db()
+    return job
+
+
+def purge_expired_documents():
+    """ Delete expired document jobs and their files. Return number of deleted jobs """
+    expiration = timedelta(seconds=app_settings.TERRA_GEOCRUD['DOCUMENTS_EXPIRATION'])
+    jobs = BackgroundJob.objects.filter(action__in=BackgroundJob.DOCUMENT_ACTIONS,
+                                        updated_at__lt=timezone.now() - expiration)
+    storage = get_storage()
+    deleted = 0
+    for job in jobs:
+        if job.result.get('path'):
+            storage.delete(job.result['path'])
+        job.delete()
+        deleted += 1
+    return deleted
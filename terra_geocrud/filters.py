@@ -0,0 +1,173 @@
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import BooleanField, DecimalField, F, TextField
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.translation import gettext_lazy as _
+from geostore.filters import JSONFieldOrderingFilter
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .properties.indexes import get_property_value_expression, get_property_value_type
+from .properties.search import get_search_text_sql, get_searchable_properties
+
+PROPERTY_PREFIX = 'property__'
+LOOKUPS = ('exact', 'in', 'gt', 'gte', 'lt', 'lte', 'contains', 'isnull')
+HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxFragments=3'
+OUTPUT_FIELDS = {
+    'numeric': DecimalField,
+    'boolean': BooleanField,
+    'text': TextField,
+}
+
+
+def get_list_properties(view):
+    """ json schema of properties available in feature list, by key """
+    if not hasattr(view, '_list_properties'):
+        crud_view = getattr(view.get_layer(), 'crud_view', None)
+        view._list_properties = {
+            prop.key: prop.json_schema for prop in crud_view.list_available_properties
+        } if crud_view else {}
+    return view._list_properties
+
+
+def get_property_expression(queryset, key, json_schema):
+    """ Typed property value, with same expression as property index """
+    value_type = get_property_value_type(json_schema)
+    column = f'{queryset.model._meta.db_table}.properties'
+    return RawSQL(get_property_value_expression(key, value_type, column=column), (),
+                  output_field=OUTPUT_FIELDS[value_type]())
+
+
+def get_property_not_null_expression(queryset, key):
+    """ True if property is set and not json null """
+    column = f'{queryset.model._meta.db_table}.properties'
+    return RawSQL(f"COALESCE(jsonb_typeof({column} -> %s), 'null') <> 'null'", (key, ), output_field=BooleanField())
+
+
+def parse_value(value, json_schema):
+    value_type = json_schema.get('type')
+    try:
+        if value_type in ('integer', 'number'):
+            return Decimal(value)
+        if value_type == 'boolean':
+            if value.lower() not in ('true', 'false', '1', '0'):
+                raise ValueError
+            return value.lower() in ('true', '1')
+        if json_schema.get('format') == 'date' and not parse_date(value):
+            raise ValueError
+        if json_schema.get('format') == 'date-time' and not parse_datetime(value):
+            raise ValueError
+    except (ValueError, InvalidOperation):
+        raise ValidationError({'detail': _("Invalid value %(value)s for %(type)s property")
+                               % {'value': value, 'type': value_type}})
+    return value
+
+
+def parse_array_item(value, json_schema):
+    """ Array item as stored in json, to check array containment """
+    value = parse_value(value, json_schema.get('items', {}))
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+class CrudPropertyFilterBackend(BaseFilterBackend):
+    """
+    Filter features with property__<key>__<lookup>=value query params.
+    Lookups : exact (default), in (comma separated values), gt, gte, lt, lte, contains, isnull.
+    Values are casted according property type, for properties available in list.
+    """
+    def get_filters(self, request):
+        for param, value in request.query_params.items():
+            if param.startswith(PROPERTY_PREFIX):
+                key, _sep, lookup = param[len(PROPERTY_PREFIX):].partition('__')
+                yield key, lookup or 'exact', value
+
+    def filter_queryset(self, request, queryset, view):
+        filters = list(self.get_filters(request))
+        if not filters:
+            return queryset
+        properties = get_list_properties(view)
+        for key, lookup, value in filters:
+            if key not in properties or lookup not in LOOKUPS:
+                raise ValidationError({'detail': _("Unable to filter on %(key)s with %(lookup)s")
+                                       % {'key': key, 'lookup': lookup}})
+            json_schema = properties[key]
+            if lookup == 'isnull':
+                # json null values are considered as null too
+                alias = f'_property_{key.replace("-", "_")}_not_null'
+                queryset = queryset.annotate(**{alias: get_property_not_null_expression(queryset, key)})\
+                    .filter(**{alias: value.lower() in ('false', '0')})
+            elif json_schema.get('type') == 'array':
+                if lookup != 'contains':
+                    raise ValidationError({'detail': _("Array property %(key)s can only be filtered with contains")
+                                           % {'key': key}})
+                queryset = queryset.filter(**{f'properties__{key}__contains': [parse_array_item(value, json_schema)]})
+            elif json_schema.get('type') == 'object':
+                raise ValidationError({'detail': _("Unable to filter on %(key)s") % {'key': key}})
+            else:
+                alias = f'_property_{key.replace("-", "_")}'
+                if lookup == 'in':
+                    value = [parse_value(item, json_schema) for item in value.split(',')]
+                elif lookup == 'contains':
+                    lookup = 'icontains'
+                else:
+                    value = parse_value(value, json_schema)
+                queryset = queryset.annotate(**{alias: get_property_expression(queryset, key, json_schema)})\
+                    .filter(**{f'{alias}__{lookup}': value})
+        return queryset
+
+
+class CrudPropertyOrderingFilter(JSONFieldOrderingFilter):
+    """ Add typed property ordering with ordering=property__<key>,-property__<key2>. Null values are last """
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if not params or PROPERTY_PREFIX not in params:
+            return super().get_ordering(request, queryset, view)
+
+        fields = [param.strip() for param in params.split(',')]
+        properties = get_list_properties(view)
+        valid_fields = self.remove_invalid_fields(
+            queryset, [field for field in fields if PROPERTY_PREFIX not in field], view, request
+        )
+        ordering = []
+        for field in fields:
+            key = field.lstrip('-')[len(PROPERTY_PREFIX):]
+            if field.lstrip('-').startswith(PROPERTY_PREFIX) and key in properties \
+                    and properties[key].get('type') not in ('array', 'object'):
+                expression = get_property_expression(queryset, key, properties[key])
+                ordering.append(expression.desc(nulls_last=True) if field.startswith('-')
+                                else expression.asc(nulls_last=True))
+            elif field in valid_fields:
+                ordering.append(field)
+        if not ordering:
+            return self.get_default_ordering(view)
+        # keep same order between pages
+        return ordering + ['pk']
+
+
+class CrudFullTextSearchFilter(BaseFilterBackend):
+    """ Full text search in searchable properties with q query param. Results are ranked, with highlighted matches """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not terms:
+            return queryset
+        crud_view = getattr(view.get_layer(), 'crud_view', None)
+        properties = get_searchable_properties(crud_view) if crud_view else []
+        if not properties:
+            raise ValidationError({'detail': _("No searchable property in this layer")})
+        config = crud_view.search_config
+        query = SearchQuery(terms, config=config)
+        text_sql = get_search_text_sql(properties, column=f'{queryset.model._meta.db_table}.properties')
+        queryset = queryset.filter(search__vector=query).annotate(
+            search_rank=SearchRank(F('search__vector'), query),
+            search_headline=RawSQL(f"ts_headline(%s::regconfig, {text_sql}, plainto_tsquery(%s::regconfig, %s), %s)",
+                                   (config, config, terms, HEADLINE_OPTIONS), output_field=TextField()),
+        )
+        if not request.query_params.get('ordering'):
+            queryset = queryset.order_by('-search_rank', 'pk')
+        return queryset
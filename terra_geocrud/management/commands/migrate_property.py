@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import BackgroundJob, CrudView
+from ...properties.operations import OPERATIONS
+from ...tasks import start_background_job
+
+
+class Command(BaseCommand):
+    help = 'Rename, cast, map values, split or merge crud view properties in background job'
+
+    def add_arguments(self, parser):
+        parser.add_argument('crud_view', type=int, nargs='?', help="Crud view id")
+        parser.add_argument('operation', nargs='?', choices=OPERATIONS.keys())
+        parser.add_argument('--key', help="Property key (rename, cast, map_values, split)")
+        parser.add_argument('--new-key', help="New property key (rename, merge)")
+        parser.add_argument('--keys', nargs='+', default=[], help="Merged property keys (merge)")
+        parser.add_argument('--new-keys', nargs='+', default=[], help="Split property keys (split)")
+        parser.add_argument('--type', help="New json schema type (cast)")
+        parser.add_argument('--mapping', type=json.loads, help="JSON dict {old value: new value} (map_values)")
+        parser.add_argument('--separator', help="Separator (split, merge)")
+        parser.add_argument('--drop-invalid', action='store_true', help="Remove values that can't be casted")
+        parser.add_argument('--dry-run', action='store_true', help="Only compute statistics")
+        parser.add_argument('--resume', type=int, help="Resume failed job with this id")
+
+    def get_job(self, options):
+        if options['resume']:
+            try:
+                job = BackgroundJob.objects.get(pk=options['resume'], action=BackgroundJob.MIGRATE_PROPERTY,
+                                                state=BackgroundJob.FAILURE)
+            except BackgroundJob.DoesNotExist:
+                raise CommandError(f"No failed property migration job {options['resume']}")
+            job.state = BackgroundJob.PENDING
+            job.error = ''
+            job.save()
+            start_background_job(job)
+            return job
+
+        if not options['crud_view'] or not options['operation']:
+            raise CommandError("crud_view and operation are required")
+        try:
+            crud_view = CrudView.objects.get(pk=options['crud_view'])
+        except CrudView.DoesNotExist:
+            raise CommandError(f"Crud view {options['crud_view']} does not exist")
+        params = {
+            key: options[key] for key in ('operation', 'key', 'new_key', 'keys', 'new_keys', 'type', 'mapping',
+                                          'separator', 'drop_invalid', 'dry_run')
+            if options[key]
+        }
+        return BackgroundJob.objects.create(crud_view=crud_view, action=BackgroundJob.MIGRATE_PROPERTY, params=params)
+
+    def handle(self, *args, **options):
+        job = self.get_job(options)
+        job.refresh_from_db()
+        self.stdout.write(f"Job {job.pk}: {job.get_state_display()} {json.dumps(job.result)}")
+        if job.state == BackgroundJob.FAILURE:
+            raise CommandError(job.error)
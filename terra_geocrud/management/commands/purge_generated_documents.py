@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...documents import purge_expired_documents
+
+
+class Command(BaseCommand):
+    help = 'Delete documents generated by background jobs after DOCUMENTS_EXPIRATION. Schedule it daily'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_documents()
+        self.stdout.write(f"{deleted} expired document jobs deleted")
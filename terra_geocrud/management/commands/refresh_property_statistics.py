@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from ...models import CrudView
+from ...properties.statistics import request_statistics_refresh
+
+
+class Command(BaseCommand):
+    help = 'Refresh outdated statistics of numeric and date properties in background jobs. Schedule it after imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('crud_views', type=int, nargs='*', help="Crud view ids, all by default")
+
+    def handle(self, *args, **options):
+        crud_views = CrudView.objects.all()
+        if options['crud_views']:
+            crud_views = crud_views.filter(pk__in=options['crud_views'])
+        for crud_view in crud_views:
+            if request_statistics_refresh(crud_view):
+                self.stdout.write(f"{crud_view}: statistics refresh requested")
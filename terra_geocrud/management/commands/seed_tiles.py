@@ -0,0 +1,61 @@
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import settings as app_settings
+from ...map.tiles import get_tiles_extent, get_zoom_range, seed_tiles, tile_cache_enabled
+from ...models import CrudView
+
+
+class Command(BaseCommand):
+    help = ('Render vector tiles of crud views in TILE_CACHE, within their data extent. Run it after deploys. '
+            'Tiles already cached are not rendered again, so an interrupted seeding is resumed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('crud_views', type=int, nargs='*', help="Crud view ids, all by default")
+        parser.add_argument('--min-zoom', type=int, help="Layer tiles minzoom by default")
+        parser.add_argument('--max-zoom', type=int, help="Layer tiles maxzoom by default")
+        parser.add_argument('--workers', type=int, help="Number of rendering threads, JOBS_MAX_WORKERS by default")
+
+    def handle(self, *args, **options):
+        if not tile_cache_enabled():
+            raise CommandError("Tile cache is disabled (TILE_CACHE_TIMEOUT)")
+        workers = options['workers'] or app_settings.TERRA_GEOCRUD['JOBS_MAX_WORKERS']
+        crud_views = CrudView.objects.select_related('layer')
+        if options['crud_views']:
+            crud_views = crud_views.filter(pk__in=options['crud_views'])
+        for crud_view in crud_views:
+            # main layer, extra geometries and relations features
+            extent = get_tiles_extent(crud_view)
+            if extent is None:
+                self.stdout.write(f"{crud_view}: no features")
+                continue
+            minzoom, maxzoom = get_zoom_range(crud_view.layer)
+            if options['min_zoom'] is not None:
+                minzoom = max(minzoom, options['min_zoom'])
+            if options['max_zoom'] is not None:
+                maxzoom = min(maxzoom, options['max_zoom'])
+            self.seed(crud_view, minzoom, maxzoom, extent, workers, options['verbosity'])
+
+    def seed(self, crud_view, minzoom, maxzoom, extent, workers, verbosity):
+        # tiles, rendered, empty, size by zoom
+        zooms = defaultdict(lambda: [0, 0, 0, 0])
+        start = time.perf_counter()
+        for z, _x, _y, size, rendered in seed_tiles(crud_view, minzoom, maxzoom, extent, workers):
+            stats = zooms[z]
+            stats[0] += 1
+            stats[1] += rendered
+            stats[2] += not size
+            stats[3] += size
+        duration = max(time.perf_counter() - start, 0.001)
+
+        if verbosity >= 2:
+            for z, (tiles, rendered, empty, size) in sorted(zooms.items()):
+                self.stdout.write(f"  zoom {z}: {tiles} tiles, {rendered} rendered, {empty} empty, {size / 1024:.1f} KB")
+        tiles, rendered, empty, size = (sum(stats[i] for stats in zooms.values()) for i in range(4))
+        self.stdout.write(
+            f"{crud_view}: {tiles} tiles from zoom {minzoom} to {maxzoom}, {rendered} rendered, "
+            f"{tiles - rendered} already cached, {empty} empty, in {duration:.1f}s ({rendered / duration:.1f} tiles/s), "
+            f"{size / 1024:.1f} KB in cache"
+        )
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from copy import deepcopy
+
+import requests
+from django.core.cache import cache
+from mapbox_baselayer.models import MapBaseLayer
+from requests.adapters import HTTPAdapter
+
+from terra_geocrud import settings as app_settings
+from terra_geocrud.map.styles import DEFAULT_MBGL_RENDERER_STYLE
+
+logger = logging.getLogger(__name__)
+
+# changed when base layers change, to invalidate all resolved styles
+BASE_STYLES_VERSION_KEY = 'terra_geocrud_base_styles_version'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """ requests session shared in process, to reuse pooled connections """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=app_settings.TERRA_GEOCRUD['HTTP_POOL_SIZE'])
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                # shared once mounted
+                _session = session
+    return _session
+
+
+def invalidate_base_styles():
+    cache.set(BASE_STYLES_VERSION_KEY, time.time(), None)
+
+
+def fetch_mapbox_style(url, cached=None):
+    """ Fetch mapbox style, revalidated with ETag if a previous version is known. Return (style, etag) or None """
+    headers = {'If-None-Match': cached['etag']} if cached and cached.get('etag') else {}
+    try:
+        response = get_http_session().get(
+            url.replace("mapbox://styles", "https://api.mapbox.com/styles/v1"),
+            params={"access_token": app_settings.TERRA_GEOCRUD.get('map', {}).get('mapbox_access_token')},
+            headers=headers, timeout=app_settings.TERRA_GEOCRUD['HTTP_TIMEOUT'],
+        )
+    except requests.RequestException:
+        logger.warning("Mapbox style %s is not reachable", url, exc_info=True)
+        return None
+    if response.status_code == 304 and cached:
+        return cached['style'], cached['etag']
+    if response.status_code == 200:
+        return response.json(), response.headers.get('ETag')
+    return None
+
+
+def resolve_base_layer_style(base_layer, cached=None):
+    """
+    Style of base layer slug, first base layer if not found, default style if none.
+    Return (style, etag, cacheable). Previous style is kept if mapbox is not reachable.
+    """
+    try:
+        map_base_layer = MapBaseLayer.objects.get(slug=base_layer)
+    except MapBaseLayer.DoesNotExist:
+        logger.warning(f"MapBaseLayer with slug '{base_layer}' was not found. Try to get another map base layer.")
+        map_base_layer = MapBaseLayer.objects.first()
+
+    if map_base_layer:
+        if map_base_layer.base_layer_type == 'mapbox':
+            result = fetch_mapbox_style(map_base_layer.map_box_url, cached)
+            if result:
+                return (*result, True)
+            if cached:
+                return cached['style'], cached['etag'], True
+            return deepcopy(DEFAULT_MBGL_RENDERER_STYLE), None, False
+        return map_base_layer.tilejson, None, True
+    return deepcopy(DEFAULT_MBGL_RENDERER_STYLE), None, True
+
+
+def get_base_layer_style(base_layer):
+    """
+    Resolved base layer style, kept in cache and revalidated with ETag after BASE_STYLE_CACHE_TIMEOUT.
+    A copy is returned, as style is completed by caller.
+    """
+    timeout = app_settings.TERRA_GEOCRUD['BASE_STYLE_CACHE_TIMEOUT']
+    if not timeout:
+        return resolve_base_layer_style(base_layer)[0]
+
+    cache_key = f'terra_geocrud_base_style_{cache.get_or_set(BASE_STYLES_VERSION_KEY, time.time, None)}_{base_layer}'
+    cached = cache.get(cache_key)
+    if cached and cached['expires'] > time.time():
+        return deepcopy(cached['style'])
+    style, etag, cacheable = resolve_base_layer_style(base_layer, cached)
+    if cacheable:
+        # kept longer than timeout, to be revalidated with etag
+        cache.set(cache_key, {'style': style, 'etag': etag, 'expires': time.time() + timeout}, timeout * 24)
+    return deepcopy(style)
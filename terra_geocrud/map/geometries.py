@@ -0,0 +1,114 @@
+import math
+from json import loads
+
+from django.db import connection
+from geostore.models import Feature
+from geostore.settings import INTERNAL_GEOMETRY_SRID
+
+from terra_geocrud import settings as app_settings
+
+# mbglrenderer tile size, used to compute zoom
+TILE_SIZE = 512
+EARTH_CIRCUMFERENCE = 2 * math.pi * 6378137
+
+
+def get_pixel_size(zoom):
+    """ Web mercator meters by pixel at zoom """
+    return EARTH_CIRCUMFERENCE / (TILE_SIZE * 2 ** zoom)
+
+
+def get_zoom(width, height, extent):
+    """ Max zoom showing web mercator extent (xmin, ymin, xmax, ymax) in a width x height pixels map """
+    length_x = extent[2] - extent[0]
+    length_y = extent[3] - extent[1]
+    # Max zoom in most of the maps is 22.
+    zoom_width = 22
+    zoom_height = 22
+    if length_x:
+        zoom_width = math.log(EARTH_CIRCUMFERENCE / (TILE_SIZE * length_x / width), 2)
+    if length_y:
+        zoom_height = math.log(EARTH_CIRCUMFERENCE / (TILE_SIZE * length_y / height), 2)
+    return math.floor(min(zoom_width, zoom_height))
+
+
+def get_render_extent(feature, feature_included, extras_included):
+    """
+    Extent of feature and selected extra geometries, computed in database with a single query.
+    Return None without geometry, else a dict with geometries count, extent, web mercator extent,
+    and if all geometries are points.
+    """
+    queries = []
+    if feature_included:
+        queries.append(Feature.objects.filter(pk=feature.pk).values('geom').query.sql_with_params())
+    if extras_included:
+        queries.append(feature.extra_geometries.filter(layer_extra_geom__slug__in=extras_included)
+                       .values('geom').query.sql_with_params())
+    if not queries:
+        return None
+    geometries_sql = ' UNION ALL '.join(f'({sql})' for sql, _params in queries)
+    params = [param for _sql, query_params in queries for param in query_params]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count, points, ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent), "
+            "ST_XMin(mercator), ST_YMin(mercator), ST_XMax(mercator), ST_YMax(mercator) "
+            "FROM (SELECT count(*) AS count, bool_and(GeometryType(geom) = 'POINT') AS points, "
+            "ST_Extent(geom) AS extent, ST_Extent(ST_Transform(geom, 3857)) AS mercator "
+            f"FROM ({geometries_sql}) AS geometries) AS extents", params)
+        row = cursor.fetchone()
+    if not row[0]:
+        return None
+    return {'count': row[0], 'points': row[1], 'extent': row[2:6], 'mercator': row[6:10]}
+
+
+def get_coordinates_precision(zoom):
+    """ Decimals of coordinates in degrees, to keep a tenth of pixel precision at zoom """
+    degrees_per_pixel = 360 / (TILE_SIZE * 2 ** zoom)
+    return max(0, math.ceil(-math.log10(degrees_per_pixel))) + 1
+
+
+def quantize_coordinates(coordinates, precision):
+    if isinstance(coordinates, (list, tuple)):
+        return [quantize_coordinates(coordinate, precision) for coordinate in coordinates]
+    return round(coordinates, precision)
+
+
+def quantize_geojson(geojson, precision):
+    if geojson.get('type') == 'GeometryCollection':
+        geojson['geometries'] = [quantize_geojson(geometry, precision) for geometry in geojson['geometries']]
+    else:
+        geojson['coordinates'] = quantize_coordinates(geojson['coordinates'], precision)
+    return geojson
+
+
+def get_render_geojson(geom, zoom=None):
+    """
+    GeoJSON of geometry sent to map renderer, simplified with MAP_SIMPLIFY_TOLERANCE pixels tolerance at zoom,
+    and with coordinates quantized to zoom precision. Full precision GeoJSON if zoom is not known.
+    """
+    tolerance = app_settings.TERRA_GEOCRUD['MAP_SIMPLIFY_TOLERANCE']
+    if zoom is None or not tolerance:
+        return loads(geom.geojson)
+    if geom.dims > 0:
+        # simplified in web mercator, to get a tolerance in pixels
+        simplified = geom.transform(3857, clone=True).simplify(tolerance * get_pixel_size(zoom),
+                                                               preserve_topology=True)
+        if not simplified.empty:
+            simplified.transform(INTERNAL_GEOMETRY_SRID)
+            geom = simplified
+    return quantize_geojson(loads(geom.geojson), get_coordinates_precision(zoom))
+
+
+def count_vertices(style):
+    """ Number of vertices in GeoJSON sources of style """
+    def count(coordinates):
+        if coordinates and isinstance(coordinates[0], (list, tuple)):
+            return sum(count(coordinate) for coordinate in coordinates)
+        return 1
+
+    total = 0
+    for source in style.get('sources', {}).values():
+        data = source.get('data') if source.get('type') == 'geojson' else None
+        if data:
+            for geometry in data.get('geometries', [data]):
+                total += count(geometry.get('coordinates', []))
+    return total
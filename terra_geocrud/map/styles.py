@@ -1,8 +1,10 @@
+import json
 from copy import deepcopy
 
 from django.utils.functional import cached_property
 
 from terra_geocrud import settings as app_settings
+from terra_geocrud.properties.statistics import STATISTICS_PREFIX, apply_statistics
 
 DEFAULT_MBGL_RENDERER_STYLE = {
     'version': 8,
@@ -23,8 +25,14 @@ class MapStyleModelMixin:
     def map_style_with_default(self):
         response = get_default_style(self.get_layer())
         style = self.map_style
+        if style and STATISTICS_PREFIX in json.dumps(style):
+            # style uses stored property statistics, as "$stats.<key>.max"
+            return apply_statistics(style, self.get_property_statistics())
         return deepcopy(style) if style else response
 
+    def get_property_statistics(self):
+        return {}
+
 
 def get_default_style(layer):
     style_settings = app_settings.TERRA_GEOCRUD.get('STYLES', {})
@@ -0,0 +1,304 @@
+import time
+
+import mercantile
+from django.contrib.gis.db.models import Extent
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+from django.db.models import Q
+from django.utils.text import slugify
+from geostore.models import Feature, FeatureExtraGeom, FeatureRelation, LayerRelation
+
+from terra_geocrud import settings as app_settings
+from terra_geocrud.cache import get_cache
+from terra_geocrud.map.geometries import EARTH_CIRCUMFERENCE, TILE_SIZE, get_pixel_size
+from terra_geocrud.models import CrudView
+from terra_geocrud.threads import map_in_threads
+
+TILE_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+# number of tile units per pixel, as geostore tiles
+EXTENT_RATIO = 8
+# web mercator latitude limit
+MAX_LATITUDE = 85.0511287798066
+
+
+def get_tile_cache():
+    return get_cache('TILE_CACHE')
+
+
+def tile_cache_enabled():
+    return bool(app_settings.TERRA_GEOCRUD['TILE_CACHE_TIMEOUT'])
+
+
+def get_zoom_range(layer):
+    """ (minzoom, maxzoom) of layer tiles settings """
+    return (layer.layer_settings_with_default('tiles', 'minzoom'),
+            int(layer.layer_settings_with_default('tiles', 'maxzoom')))
+
+
+def get_tile_properties(crud_view):
+    """ Property keys included in crud view tiles, None to include all properties as geostore tiles """
+    return list(crud_view.properties.filter(include_in_tile=True).values_list('key', flat=True)) or None
+
+
+def get_tile_sources(crud_view):
+    """ (name, queryset, property keys) of each crud view tile layer, named as id_layer_vt of map layers """
+    layer = crud_view.layer
+    sources = [(layer.name, layer.features.all(), get_tile_properties(crud_view))]
+    for relation in layer.relations_as_origin.select_related('destination__crud_view'):
+        destination_crud_view = getattr(relation.destination, 'crud_view', None)
+        if destination_crud_view:
+            destinations = FeatureRelation.objects.filter(relation=relation).values('destination_id')
+            sources.append((f'relation-{slugify(layer.name)}-{slugify(relation.name)}',
+                            Feature.objects.filter(pk__in=destinations),
+                            get_tile_properties(destination_crud_view)))
+    for extra_layer in layer.extra_geometries.all():
+        sources.append((extra_layer.name, FeatureExtraGeom.objects.filter(layer_extra_geom=extra_layer), None))
+    return sources
+
+
+def get_tile_envelope(bbox, pixel_buffer):
+    """ Web mercator polygon of tile bbox, extended by pixel buffer """
+    margin = (bbox[2] - bbox[0]) / TILE_SIZE * pixel_buffer
+    envelope = Polygon.from_bbox((bbox[0] - margin, bbox[1] - margin, bbox[2] + margin, bbox[3] + margin))
+    envelope.srid = 3857
+    return envelope
+
+
+def get_source_sql(name, queryset, keys, bbox, pixel_buffer):
+    """ SQL and params building MVT layer of source features intersecting web mercator bbox """
+    pixel_width = (bbox[2] - bbox[0]) / TILE_SIZE
+    envelope = get_tile_envelope(bbox, pixel_buffer)
+    features_sql, features_params = queryset.filter(geom__intersects=envelope)\
+        .values('identifier', 'properties', 'geom').query.sql_with_params()
+    if keys is None:
+        properties, properties_params = "properties", []
+    elif keys:
+        properties = ("(SELECT coalesce(jsonb_object_agg(key, value), '{}'::jsonb) "
+                      "FROM jsonb_each(properties) WHERE key = ANY(%s))")
+        properties_params = [keys]
+    else:
+        properties, properties_params = "'{}'::jsonb", []
+    sql = (
+        f"SELECT ST_AsMVT(tilegeom, %s, {TILE_SIZE * EXTENT_RATIO}, 'geometry') FROM ("
+        f"SELECT {properties} || jsonb_build_object('_id', identifier) AS properties, "
+        "ST_AsMVTGeom(ST_SimplifyPreserveTopology(ST_Transform(geom, 3857), %s), "
+        f"ST_MakeEnvelope(%s, %s, %s, %s, 3857), {TILE_SIZE * EXTENT_RATIO}, %s, true) AS geometry "
+        f"FROM ({features_sql}) AS features) AS tilegeom WHERE geometry IS NOT NULL"
+    )
+    # geometries are simplified to half pixel
+    params = [name, *properties_params, pixel_width / 2, *bbox, pixel_buffer * EXTENT_RATIO, *features_params]
+    return sql, params
+
+
+def render_tile(crud_view, z, x, y):
+    """ Vector tile of crud view layers, rendered by a single query. Empty bytes if no feature in tile """
+    bbox = tuple(mercantile.xy_bounds(x, y, z))
+    pixel_buffer = crud_view.layer.layer_settings_with_default('tiles', 'pixel_buffer')
+    queries = [get_source_sql(*source, bbox, pixel_buffer) for source in get_tile_sources(crud_view)]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT " + " || ".join(f"coalesce(({sql}), ''::bytea)" for sql, _params in queries),
+                       [param for _sql, params in queries for param in params])
+        return bytes(cursor.fetchone()[0])
+
+
+def get_tiles_version_key(crud_view_id):
+    return f'terra_geocrud_tiles_version_{crud_view_id}'
+
+
+def get_tile_cache_key(crud_view, z, x, y, version=None):
+    if version is None:
+        version = get_tile_cache().get_or_set(get_tiles_version_key(crud_view.pk), time.time, None)
+    return f'terra_geocrud_tile_{crud_view.pk}_{crud_view.schema_version}_{version}_{z}_{x}_{y}'
+
+
+def load_tile(crud_view, z, x, y):
+    """ Tile from TILE_CACHE, rendered and cached if missing. Return (tile, rendered) """
+    cache = get_tile_cache()
+    cache_key = get_tile_cache_key(crud_view, z, x, y)
+    tile = cache.get(cache_key)
+    if tile is not None:
+        return tile, False
+    tile = render_tile(crud_view, z, x, y)
+    cache.set(cache_key, tile, app_settings.TERRA_GEOCRUD['TILE_CACHE_TIMEOUT'])
+    return tile, True
+
+
+def get_tile(crud_view, z, x, y):
+    """ Vector tile of crud view, kept in TILE_CACHE. Empty out of layer zoom range """
+    minzoom, maxzoom = get_zoom_range(crud_view.layer)
+    if not minzoom <= z <= maxzoom:
+        return b''
+    if not tile_cache_enabled():
+        return render_tile(crud_view, z, x, y)
+    return load_tile(crud_view, z, x, y)[0]
+
+
+def tile_has_features(sources, z, x, y, pixel_buffer):
+    """ True if a source feature intersects tile with its buffer, even if too small to be drawn at zoom """
+    envelope = get_tile_envelope(tuple(mercantile.xy_bounds(x, y, z)), pixel_buffer)
+    return any(queryset.filter(geom__intersects=envelope).exists() for _name, queryset, _keys in sources)
+
+
+def get_tiles_extent(crud_view):
+    """ Extent (4326) of features of all crud view tile layers, None without features """
+    extents = [extent for extent in (get_queryset_extent(queryset) for _name, queryset, _keys
+                                     in get_tile_sources(crud_view)) if extent]
+    if not extents:
+        return None
+    return (min(extent[0] for extent in extents), min(extent[1] for extent in extents),
+            max(extent[2] for extent in extents), max(extent[3] for extent in extents))
+
+
+def seed_tiles(crud_view, minzoom, maxzoom, extent, workers=1):
+    """
+    Render missing tiles of crud view in TILE_CACHE, from minzoom to maxzoom within extent (4326).
+    Only children of tiles intersecting features are visited (quadtree descent). Cached tiles are not
+    rendered again, so an interrupted seeding is resumed. Yield (z, x, y, size, rendered) for each visited tile.
+    """
+    pixel_buffer = crud_view.layer.layer_settings_with_default('tiles', 'pixel_buffer')
+    sources = get_tile_sources(crud_view)
+    xmin, ymin, xmax, ymax = get_tiles_range(extent, minzoom, pixel_buffer)
+    level = [(minzoom, x, y) for x in range(xmin, xmax + 1) for y in range(ymin, ymax + 1)]
+    # seeding threads use their own database connection, not able to read data of current transaction
+    workers = 1 if connection.in_atomic_block else workers
+
+    def load(tile):
+        content, rendered = load_tile(crud_view, *tile)
+        # small geometries are not drawn at low zoom, children are visited if tile intersects features
+        descend = tile[0] < maxzoom and tile_has_features(sources, *tile, pixel_buffer)
+        return (*tile, len(content), rendered, descend)
+
+    for zoom in range(minzoom, maxzoom + 1):
+        children = []
+        if zoom < maxzoom:
+            xmin, ymin, xmax, ymax = get_tiles_range(extent, zoom + 1, pixel_buffer)
+        for z, x, y, size, rendered, descend in map_in_threads(load, level, workers):
+            yield z, x, y, size, rendered
+            if descend:
+                # as tile buffer contains buffers of its children, children of tile without features are empty
+                children.extend((z + 1, child_x, child_y)
+                                for child_x in (2 * x, 2 * x + 1) for child_y in (2 * y, 2 * y + 1)
+                                if xmin <= child_x <= xmax and ymin <= child_y <= ymax)
+        level = children
+
+
+def get_tiles_range(extent, zoom, buffer=0):
+    """ Indexes (xmin, ymin, xmax, ymax) of tiles at zoom intersecting extent (4326), extended by buffer pixels """
+    def clamp(lng, lat):
+        return max(-180, min(180, lng)), max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+
+    xmin, ymin = mercantile.xy(*clamp(extent[0], extent[1]))
+    xmax, ymax = mercantile.xy(*clamp(extent[2], extent[3]))
+    margin = buffer * get_pixel_size(zoom)
+    origin = EARTH_CIRCUMFERENCE / 2
+    tile_length = EARTH_CIRCUMFERENCE / 2 ** zoom
+
+    def index(value):
+        return max(0, min(2 ** zoom - 1, int(value // tile_length)))
+
+    return (index(origin + xmin - margin), index(origin - ymax - margin),
+            index(origin + xmax + margin), index(origin - ymin + margin))
+
+
+def get_extents_tiles(crud_view, extents):
+    """ Tiles (z, x, y) of crud view zoom range intersecting extents. None if more than TILE_CACHE_MAX_INVALIDATED """
+    layer = crud_view.layer
+    minzoom, maxzoom = get_zoom_range(layer)
+    pixel_buffer = layer.layer_settings_with_default('tiles', 'pixel_buffer')
+    limit = app_settings.TERRA_GEOCRUD['TILE_CACHE_MAX_INVALIDATED']
+    tiles = set()
+    for extent in extents:
+        for zoom in range(minzoom, maxzoom + 1):
+            xmin, ymin, xmax, ymax = get_tiles_range(extent, zoom, pixel_buffer)
+            if len(tiles) + (xmax - xmin + 1) * (ymax - ymin + 1) > limit:
+                return None
+            tiles.update((zoom, x, y) for x in range(xmin, xmax + 1) for y in range(ymin, ymax + 1))
+    return tiles
+
+
+def invalidate_tiles(crud_view, extents=None):
+    """
+    Delete cached tiles of crud view intersecting extents (4326 xmin, ymin, xmax, ymax).
+    All tiles are invalidated without extents, or if too many tiles intersect them.
+    """
+    if not tile_cache_enabled():
+        return
+    cache = get_tile_cache()
+    if extents is not None:
+        extents = [extent for extent in extents if extent]
+        version = cache.get(get_tiles_version_key(crud_view.pk))
+        if not extents or version is None:
+            # nothing to invalidate, or no cached tiles
+            return
+        tiles = get_extents_tiles(crud_view, extents)
+        if tiles is not None:
+            cache.delete_many([get_tile_cache_key(crud_view, *tile, version=version) for tile in tiles])
+            return
+    cache.set(get_tiles_version_key(crud_view.pk), time.time(), None)
+
+
+def get_tiles_crud_views_key(layer_id):
+    return f'terra_geocrud_tiles_crud_views_{layer_id}'
+
+
+def get_tiles_crud_view_ids(layer_id):
+    """
+    Ids of crud views with layer features in their tiles : layer crud view and crud views with relation to layer.
+    Kept in TILE_CACHE, reset by crud view and layer relation changes.
+    """
+    cache = get_tile_cache()
+    ids = cache.get(get_tiles_crud_views_key(layer_id))
+    if ids is None:
+        ids = list(CrudView.objects.filter(Q(layer_id=layer_id) | Q(layer__relations_as_origin__destination_id=layer_id))
+                   .distinct().values_list('pk', flat=True))
+        cache.set(get_tiles_crud_views_key(layer_id), ids, None)
+    return ids
+
+
+def reset_tiles_crud_views(*layer_ids):
+    get_tile_cache().delete_many([get_tiles_crud_views_key(layer_id) for layer_id in layer_ids])
+
+
+def get_cached_tiles_crud_view_ids(layer_id):
+    """ Ids of crud views with layer features in their tiles, and with cached tiles. No database query once known """
+    if not tile_cache_enabled():
+        return []
+    ids = get_tiles_crud_view_ids(layer_id)
+    # tiles are cached with their crud view tiles version
+    versions = get_tile_cache().get_many([get_tiles_version_key(crud_view_id) for crud_view_id in ids])
+    return [crud_view_id for crud_view_id in ids if get_tiles_version_key(crud_view_id) in versions]
+
+
+def invalidate_layer_tiles(layer_id, extents=None):
+    """ Invalidate cached tiles showing features of layer, in extents or all """
+    crud_view_ids = get_cached_tiles_crud_view_ids(layer_id)
+    if crud_view_ids:
+        for crud_view in CrudView.objects.filter(pk__in=crud_view_ids).select_related('layer'):
+            invalidate_tiles(crud_view, extents)
+
+
+def get_geometry_extent(geom):
+    """ Extent (4326) of geometry, None if empty """
+    if geom is None or geom.empty:
+        return None
+    if geom.srid and geom.srid != 4326:
+        geom = geom.transform(4326, clone=True)
+    return geom.extent
+
+
+def get_queryset_extent(queryset):
+    return queryset.aggregate(extent=Extent('geom'))['extent']
+
+
+def invalidate_relation_tiles(feature):
+    """ Invalidate tiles of feature relation destinations, as automatic relations are created without signals """
+    if get_cached_tiles_crud_view_ids(feature.layer_id):
+        invalidate_layer_tiles(feature.layer_id,
+                               [get_queryset_extent(Feature.objects.filter(relations_as_destination__origin=feature))])
+
+
+def invalidate_feature_relation_tiles(relation_id, destination_id):
+    """ Invalidate tiles of relation origin crud view around destination feature """
+    origin_id = LayerRelation.objects.filter(pk=relation_id).values_list('origin_id', flat=True).first()
+    if origin_id and get_cached_tiles_crud_view_ids(origin_id):
+        invalidate_layer_tiles(origin_id, [get_queryset_extent(Feature.objects.filter(pk=destination_id))])
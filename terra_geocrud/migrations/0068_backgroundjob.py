@@ -0,0 +1,38 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:12
+try:
+    from django.db.models import JSONField
+except ImportError:  # TODO: Remove when dropping Django releases < 3.1
+    from django.contrib.postgres.fields import JSONField
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terra_geocrud', '0067_crudviewproperty_table_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('action', models.CharField(choices=[('purge_property_files', 'Purge property files')], max_length=50)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('success', 'Success'), ('failure', 'Failure')], db_index=True, default='pending', max_length=10)),
+                ('params', JSONField(blank=True, default=dict)),
+                ('result', JSONField(blank=True, default=dict)),
+                ('done', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('crud_view', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='terra_geocrud.crudview')),
+            ],
+            options={
+                'verbose_name': 'Background job',
+                'verbose_name_plural': 'Background jobs',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
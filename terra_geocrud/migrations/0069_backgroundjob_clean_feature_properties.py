@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-19 10:02
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terra_geocrud', '0068_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='backgroundjob',
+            name='action',
+            field=models.CharField(choices=[('purge_property_files', 'Purge property files'), ('clean_feature_properties', 'Clean feature properties')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.16 on 2026-10-19 12:05
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terra_geocrud', '0071_backgroundjob_migrate_property'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crudviewproperty',
+            name='filterable',
+            field=models.BooleanField(db_index=True, default=False, help_text='Filter and sort features with this property, a database index is created in background job.'),
+        ),
+        migrations.AlterField(
+            model_name='backgroundjob',
+            name='action',
+            field=models.CharField(choices=[('purge_property_files', 'Purge property files'), ('clean_feature_properties', 'Clean feature properties'), ('migrate_property', 'Migrate property'), ('sync_property_indexes', 'Sync property indexes')], max_length=50),
+        ),
+    ]
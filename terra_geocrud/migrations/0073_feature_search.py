@@ -0,0 +1,43 @@
+# Generated by Django 3.2.16 on 2026-10-19 14:20
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+import terra_geocrud.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geostore', '0044_auto_20201106_1638'),
+        ('terra_geocrud', '0072_crudviewproperty_filterable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crudview',
+            name='search_config',
+            field=models.CharField(default='simple', help_text='PostgreSQL text search configuration used in feature full text search (simple, english, french...)', max_length=50, validators=[terra_geocrud.validators.validate_search_config], verbose_name='Search language'),
+        ),
+        migrations.AddField(
+            model_name='crudviewproperty',
+            name='search_weight',
+            field=models.CharField(blank=True, choices=[('A', 'Highest'), ('B', 'High'), ('C', 'Low'), ('D', 'Lowest')], help_text='Weight in feature full text search. Let empty if not searchable.', max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='backgroundjob',
+            name='action',
+            field=models.CharField(choices=[('purge_property_files', 'Purge property files'), ('clean_feature_properties', 'Clean feature properties'), ('migrate_property', 'Migrate property'), ('sync_property_indexes', 'Sync property indexes'), ('rebuild_features_search', 'Rebuild features search')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='FeatureSearch',
+            fields=[
+                ('feature', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='geostore.feature')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['vector'], name='feature_search_vector_index')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-19 15:02
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terra_geocrud', '0073_feature_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crudview',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
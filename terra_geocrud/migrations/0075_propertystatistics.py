@@ -0,0 +1,37 @@
+# Generated by Django 3.2.16 on 2026-10-19 15:40
+try:
+    from django.db.models import JSONField
+except ImportError:  # TODO: Remove when dropping Django releases < 3.1
+    from django.contrib.postgres.fields import JSONField
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terra_geocrud', '0074_crudview_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_version', models.PositiveIntegerField(default=0)),
+                ('values', JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('crud_view', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='terra_geocrud.crudview')),
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='terra_geocrud.crudviewproperty')),
+            ],
+            options={
+                'verbose_name': 'Property statistics',
+                'verbose_name_plural': 'Property statistics',
+            },
+        ),
+        migrations.AlterField(
+            model_name='backgroundjob',
+            name='action',
+            field=models.CharField(choices=[('purge_property_files', 'Purge property files'), ('clean_feature_properties', 'Clean feature properties'), ('migrate_property', 'Migrate property'), ('sync_property_indexes', 'Sync property indexes'), ('rebuild_features_search', 'Rebuild features search'), ('refresh_property_statistics', 'Refresh property statistics')], max_length=50),
+        ),
+    ]
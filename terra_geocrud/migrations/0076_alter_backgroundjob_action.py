@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terra_geocrud', '0075_propertystatistics'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='backgroundjob',
+            name='action',
+            field=models.CharField(choices=[('purge_property_files', 'Purge property files'), ('clean_feature_properties', 'Clean feature properties'), ('migrate_property', 'Migrate property'), ('sync_property_indexes', 'Sync property indexes'), ('rebuild_features_search', 'Rebuild features search'), ('refresh_property_statistics', 'Refresh property statistics'), ('generate_documents', 'Generate documents')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.16 on 2026-10-19 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('terra_geocrud', '0077_alter_backgroundjob_action'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='terra_geocrud_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,18 +1,22 @@
+import logging
 from copy import deepcopy
+from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.gis.db.models import Extent
 from django.core.exceptions import ValidationError
-from django.db.models import FloatField, CharField, IntegerField
-from django.db.models.functions import Cast
 
 try:
     from django.db.models import JSONField
 except ImportError:  # TODO: Remove when dropping Django releases < 3.1
     from django.contrib.postgres.fields import JSONField
 from django.contrib.postgres.indexes import GinIndex
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connection, models, transaction
 from django.db.models import CheckConstraint, UniqueConstraint, Q
+from django.utils import timezone
 from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from geostore.db.mixins import BaseUpdatableModel
@@ -20,11 +24,14 @@ from sorl.thumbnail import default, ImageField, get_thumbnail
 from sorl.thumbnail.images import ImageFile
 
 from terra_geocrud.map.styles import MapStyleModelMixin
-from terra_geocrud.properties.files import delete_old_picture_property
 from . import settings as app_settings
 from .properties.files import get_storage
+from .properties.indexes import request_property_indexes_sync
 from .properties.schema import FormSchemaMixin
-from .validators import validate_schema_property, validate_function_path
+from .properties.search import request_features_search_rebuild
+from .validators import validate_schema_property, validate_function_path, validate_search_config
+
+logger = logging.getLogger(__name__)
 
 
 class CrudModelMixin(models.Model):
@@ -86,6 +93,23 @@ class CrudView(FormSchemaMixin, MapStyleModelMixin, CrudModelMixin):
                                                help_text=_("Schema property used to define feature title."),
                                                related_name='used_by_title', blank=True)
     visible = models.BooleanField(default=True, db_index=True, help_text=_("Keep visible if ungrouped."))
+    # incremented each time layer schema or ui schema is synced with changes, and after commit of layer, properties
+    # or groups changes. Use it in cache keys
+    schema_version = models.PositiveIntegerField(default=0, editable=False)
+    # incremented each time layer features change. Use it in cache keys of computed data
+    data_version = models.PositiveIntegerField(default=0, editable=False)
+    search_config = models.CharField(max_length=50, default='simple', validators=[validate_search_config],
+                                     verbose_name=_("Search language"),
+                                     help_text=_("PostgreSQL text search configuration used in feature full text "
+                                                 "search (simple, english, french...)"))
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # versions are only changed by atomic increments, never overwrite them with outdated values
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in ('schema_version',
+                                                                                       'data_version')]
+        super().save(*args, **kwargs)
 
     @cached_property
     def extent(self):
@@ -120,6 +144,13 @@ class CrudView(FormSchemaMixin, MapStyleModelMixin, CrudModelMixin):
     def get_layer(self):
         return self.layer
 
+    def get_property_statistics(self):
+        """ Stored statistics of numeric and date properties, by key """
+        return {
+            statistics.property.key: statistics.values
+            for statistics in self.statistics.select_related('property')
+        }
+
     def get_feature_title(self, feature):
         """ Get feature title base on title field. Return identifier if empty or None """
         data = feature.properties.get(self.feature_title_property.key, '')\
@@ -145,12 +176,12 @@ class FeaturePropertyDisplayGroup(models.Model):
 
     @cached_property
     def form_schema(self):
-        original_schema = deepcopy(self.crud_view.layer.schema)
+        original_schema = self.crud_view.layer.schema
         properties = {}
         required = []
 
         for prop in self.group_properties.all():
-            properties[prop.key] = original_schema.get('properties', {}).get(prop.key)
+            properties[prop.key] = deepcopy(original_schema.get('properties', {}).get(prop.key))
 
             if prop.key in original_schema.get('required', []):
                 required.append(prop.key)
@@ -273,6 +304,17 @@ class CrudViewProperty(models.Model):
     json_schema = JSONField(blank=False, null=False, default=dict, validators=[validate_schema_property])
     ui_schema = JSONField(blank=True, null=False, default=dict)
     include_in_tile = models.BooleanField(default=False, db_index=True)
+    filterable = models.BooleanField(default=False, db_index=True,
+                                     help_text=_("Filter and sort features with this property, "
+                                                 "a database index is created in background job."))
+    SEARCH_WEIGHTS = (
+        ('A', _("Highest")),
+        ('B', _("High")),
+        ('C', _("Low")),
+        ('D', _("Lowest")),
+    )
+    search_weight = models.CharField(max_length=1, choices=SEARCH_WEIGHTS, blank=True,
+                                     help_text=_("Weight in feature full text search. Let empty if not searchable."))
     required = models.BooleanField(default=False, db_index=True)
     order = models.PositiveSmallIntegerField(default=0, db_index=True)
 
@@ -317,37 +359,44 @@ class CrudViewProperty(models.Model):
                                                        self.key.capitalize()))
 
     def delete(self, *args, **kwargs):
-        """ Delete file at deletion """
+        """ Delete files and index at deletion, in background jobs as layer can contain many features """
         if self.json_schema.get('format') == "data-url":
-            features = self.view.layer.features.all()
-            for feature in features:
-                delete_old_picture_property(self.key, feature.properties)
-        super().delete(*args, **kwargs)
+            BackgroundJob.objects.create(crud_view=self.view,
+                                         action=BackgroundJob.PURGE_PROPERTY_FILES,
+                                         params={'key': self.key})
+        result = super().delete(*args, **kwargs)
+        if self.filterable:
+            request_property_indexes_sync(self.view)
+        if self.search_weight:
+            request_features_search_rebuild(self.view)
+        return result
 
     @cached_property
     def full_json_schema(self):
         """
         Generate full json schema by adding custom conf to store schema.
         All keys defined in json_schema column are kept if already present.
+        Enum values are read from self.values, prefetch them to generate several schemas.
         """
-        output_field = CharField()
+        cast = str
         if self.json_schema.get("type") == "number" or (
                 self.json_schema.get("type") == "array" and self.json_schema.get("items").get("type") == "number"):
             # final values should be float
-            output_field = FloatField()
+            cast = float
         elif self.json_schema.get("type") == "integer" or (
                 self.json_schema.get("type") == "array" and self.json_schema.get("items").get("type") == "integer"):
             # final values should be integer
-            output_field = IntegerField()
-        values = self.values.all().annotate(final_value=Cast('value', output_field=output_field))
+            cast = int
+        # keep creation order, to get same schema at each generation
+        values = [cast(enum.value) for enum in sorted(self.values.all(), key=lambda enum: enum.pk)]
         if values:
             json_schema = deepcopy(self.json_schema)
             if self.json_schema.get('type') != "array":
                 # in non array properties, enum are defined in enum key
-                json_schema.setdefault('enum', list(values.values_list('final_value', flat=True)))
+                json_schema.setdefault('enum', values)
             else:
                 # in array, enum values are defined in 'items__enum' key
-                json_schema['items'].setdefault('enum', list(values.values_list('final_value', flat=True)))
+                json_schema['items'].setdefault('enum', values)
             return json_schema
         return self.json_schema
 
@@ -448,3 +497,136 @@ class RoutingInformations(models.Model):
 
     def __str__(self):
         return f"Routing infos : {self.feature.identifier}"
+
+
+class BackgroundJob(BaseUpdatableModel):
+    """ Long running operation on crud view features, executed by celery or synchronously (see JOBS_CELERY_ASYNC) """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCESS = 'success'
+    FAILURE = 'failure'
+    STATES = (
+        (PENDING, _("Pending")),
+        (RUNNING, _("Running")),
+        (SUCCESS, _("Success")),
+        (FAILURE, _("Failure")),
+    )
+    PURGE_PROPERTY_FILES = 'purge_property_files'
+    CLEAN_FEATURE_PROPERTIES = 'clean_feature_properties'
+    MIGRATE_PROPERTY = 'migrate_property'
+    SYNC_PROPERTY_INDEXES = 'sync_property_indexes'
+    REBUILD_FEATURES_SEARCH = 'rebuild_features_search'
+    REFRESH_PROPERTY_STATISTICS = 'refresh_property_statistics'
+    GENERATE_DOCUMENTS = 'generate_documents'
+    GENERATE_DOCUMENT = 'generate_document'
+    ACTIONS = (
+        (PURGE_PROPERTY_FILES, _("Purge property files")),
+        (CLEAN_FEATURE_PROPERTIES, _("Clean feature properties")),
+        (MIGRATE_PROPERTY, _("Migrate property")),
+        (SYNC_PROPERTY_INDEXES, _("Sync property indexes")),
+        (REBUILD_FEATURES_SEARCH, _("Rebuild features search")),
+        (REFRESH_PROPERTY_STATISTICS, _("Refresh property statistics")),
+        (GENERATE_DOCUMENTS, _("Generate documents")),
+        (GENERATE_DOCUMENT, _("Generate document")),
+    )
+    # function executed for each action. It receives job as argument
+    HANDLERS = {
+        PURGE_PROPERTY_FILES: 'terra_geocrud.properties.files.purge_property_files',
+        CLEAN_FEATURE_PROPERTIES: 'terra_geocrud.tasks.clean_feature_properties',
+        MIGRATE_PROPERTY: 'terra_geocrud.properties.operations.migrate_property',
+        SYNC_PROPERTY_INDEXES: 'terra_geocrud.properties.indexes.sync_property_indexes',
+        REBUILD_FEATURES_SEARCH: 'terra_geocrud.properties.search.rebuild_features_search',
+        REFRESH_PROPERTY_STATISTICS: 'terra_geocrud.properties.statistics.refresh_property_statistics',
+        GENERATE_DOCUMENTS: 'terra_geocrud.documents.generate_documents',
+        GENERATE_DOCUMENT: 'terra_geocrud.documents.generate_document',
+    }
+    # actions storing generated files, removed after DOCUMENTS_EXPIRATION
+    DOCUMENT_ACTIONS = (GENERATE_DOCUMENTS, GENERATE_DOCUMENT)
+    crud_view = models.ForeignKey(CrudView, related_name='jobs', on_delete=models.CASCADE)
+    # user who requested job, only one able to read it in api with staff members
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, related_name='terra_geocrud_jobs',
+                              on_delete=models.SET_NULL)
+    action = models.CharField(max_length=50, choices=ACTIONS)
+    state = models.CharField(max_length=10, choices=STATES, default=PENDING, db_index=True)
+    params = JSONField(default=dict, blank=True)
+    result = JSONField(default=dict, blank=True)
+    done = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.get_action_display()} - {self.crud_view} ({self.get_state_display()})"
+
+    @property
+    def progress(self):
+        """ Progression in percent, None if total is not known yet """
+        if not self.total:
+            return 100 if self.state == self.SUCCESS else None
+        return min(100, int(self.done * 100 / self.total))
+
+    @property
+    def expired(self):
+        """ Generated file is not available anymore """
+        if self.action not in self.DOCUMENT_ACTIONS:
+            return False
+        expiration = timedelta(seconds=app_settings.TERRA_GEOCRUD['DOCUMENTS_EXPIRATION'])
+        return self.updated_at < timezone.now() - expiration
+
+    def set_progress(self, done, total=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        # result is saved too, handlers can store their resume state in it
+        self.save(update_fields=['done', 'total', 'result', 'updated_at'])
+
+    def run(self):
+        self.state = self.RUNNING
+        self.save(update_fields=['state', 'updated_at'])
+        try:
+            if connection.in_atomic_block:
+                # job started in caller transaction (synchronous mode), keep it usable after a database error
+                with transaction.atomic():
+                    import_string(self.HANDLERS[self.action])(self)
+            else:
+                import_string(self.HANDLERS[self.action])(self)
+        except Exception as exc:
+            logger.exception("Background job %s failed", self.pk)
+            self.state = self.FAILURE
+            self.error = str(exc)
+        else:
+            self.state = self.SUCCESS
+        self.save(update_fields=['state', 'error', 'result', 'updated_at'])
+
+    class Meta:
+        verbose_name = _("Background job")
+        verbose_name_plural = _("Background jobs")
+        ordering = ('-created_at', )
+
+
+class FeatureSearch(models.Model):
+    """ Full text search vector of feature searchable properties, maintained at feature save and by background jobs """
+    feature = models.OneToOneField('geostore.Feature', on_delete=models.CASCADE, primary_key=True,
+                                   related_name='search')
+    vector = SearchVectorField(null=True)
+
+    class Meta:
+        indexes = (
+            GinIndex(name='feature_search_vector_index', fields=['vector']),
+        )
+
+
+class PropertyStatistics(models.Model):
+    """ Statistics of numeric and date property values, computed in background job """
+    crud_view = models.ForeignKey(CrudView, on_delete=models.CASCADE, related_name='statistics')
+    property = models.OneToOneField(CrudViewProperty, on_delete=models.CASCADE, related_name='statistics')
+    # crud view data version when statistics were computed
+    data_version = models.PositiveIntegerField(default=0)
+    values = JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.property} statistics"
+
+    class Meta:
+        verbose_name = _("Property statistics")
+        verbose_name_plural = _("Property statistics")
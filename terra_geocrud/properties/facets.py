@@ -0,0 +1,90 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import connection
+
+from .. import settings as app_settings
+
+
+def get_facet_values(json_schema):
+    """ Expected values of enum and boolean properties, None for other properties """
+    if json_schema.get('type') == 'boolean':
+        return [True, False]
+    if json_schema.get('type') == 'array':
+        return json_schema.get('items', {}).get('enum')
+    return json_schema.get('enum')
+
+
+def get_value_key(value):
+    """ Comparable key of json value, as enum values and stored values can be integer or float """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = float(value)
+    return json.dumps(value)
+
+
+def get_facet_properties(crud_view):
+    """ Full json schema of properties with facets, by key """
+    properties = crud_view.properties.prefetch_related('values')
+    return {
+        prop.key: prop.full_json_schema for prop in properties if get_facet_values(prop.full_json_schema) is not None
+    }
+
+
+def count_values(queryset, properties):
+    """
+    Count values of each property in features, with a single grouped query. Array items are counted.
+    Return (value, count) by value key for each property.
+    """
+    if not properties:
+        return {}
+    sql, params = queryset.order_by().values('properties').query.sql_with_params()
+    facets_sql = ' UNION ALL '.join(
+        "SELECT %s AS key, jsonb_array_elements(CASE WHEN jsonb_typeof(feature.properties -> %s) = 'array' "
+        "THEN feature.properties -> %s ELSE '[]'::jsonb END) AS value"
+        if json_schema.get('type') == 'array' else
+        "SELECT %s AS key, feature.properties -> %s AS value"
+        for json_schema in properties.values()
+    )
+    facets_params = []
+    for key, json_schema in properties.items():
+        facets_params.extend([key, key, key] if json_schema.get('type') == 'array' else [key, key])
+    with connection.cursor() as cursor:
+        # values are fetched as text, jsonb decoding depends on django version
+        cursor.execute(f"SELECT facet.key, facet.value::text, count(*) FROM ({sql}) AS feature "
+                       f"CROSS JOIN LATERAL ({facets_sql}) AS facet "
+                       f"WHERE facet.value IS NOT NULL AND facet.value <> 'null'::jsonb "
+                       f"GROUP BY facet.key, facet.value", [*params, *facets_params])
+        counts = {key: {} for key in properties}
+        for key, value, count in cursor.fetchall():
+            value = json.loads(value)
+            value_key = get_value_key(value)
+            counts[key][value_key] = (value, counts[key].get(value_key, (value, 0))[1] + count)
+    return counts
+
+
+def get_facets(crud_view, queryset, properties, filters):
+    """
+    Value counts of properties in filtered features, enum values first.
+    Kept in cache for current filters and crud view data and schema versions.
+    """
+    if not properties:
+        return {}
+    timeout = app_settings.TERRA_GEOCRUD['FACETS_CACHE_TIMEOUT']
+    filters_hash = hashlib.md5(json.dumps([sorted(properties), sorted(filters.items())]).encode()).hexdigest()
+    cache_key = f'terra_geocrud_facets_{crud_view.pk}_{crud_view.schema_version}_{crud_view.data_version}_' \
+                f'{filters_hash}'
+    facets = cache.get(cache_key) if timeout else None
+    if facets is None:
+        counts = count_values(queryset, properties)
+        facets = {}
+        for key, json_schema in properties.items():
+            values = {get_value_key(value): value for value in get_facet_values(json_schema)}
+            # values not in enum are returned too, to show invalid data
+            values.update({value_key: value for value_key, (value, _count) in counts[key].items()
+                           if value_key not in values})
+            facets[key] = [{'value': value, 'count': counts[key].get(value_key, (value, 0))[1]}
+                           for value_key, value in values.items()]
+        if timeout:
+            cache.set(cache_key, facets, timeout)
+    return facets
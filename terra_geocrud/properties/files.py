@@ -1,9 +1,17 @@
 import base64
+import hashlib
 import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import unquote
 
+from django.core.cache import cache
 from django.core.files.base import ContentFile
 from django.core.files.storage import get_storage_class
+try:
+    from django.db.models.fields.json import KeyTextTransform
+except ImportError:  # TODO: Remove when dropping Django releases < 3.1
+    from django.contrib.postgres.fields.jsonb import KeyTextTransform
 
 from terra_geocrud import settings as app_settings
 
@@ -19,10 +27,31 @@ def get_info_content(value):
         return None, None
 
 
+_storages = {}
+_storages_lock = threading.Lock()
+
+
 def get_storage():
-    """ Get media storage for feature data element, using settings """
-    StorageClass = get_storage_class(import_path=app_settings.TERRA_GEOCRUD['DATA_FILE_STORAGE_CLASS'])
-    return StorageClass()
+    """
+    Get media storage for feature data element, using settings.
+    Instances are shared in process to keep clients and connection pools of remote storages.
+    """
+    import_path = app_settings.TERRA_GEOCRUD['DATA_FILE_STORAGE_CLASS']
+    storage = _storages.get(import_path)
+    if storage is None:
+        with _storages_lock:
+            # another thread could have instantiated storage while waiting for lock
+            storage = _storages.get(import_path)
+            if storage is None:
+                StorageClass = get_storage_class(import_path=import_path)
+                storage = _storages[import_path] = StorageClass()
+    return storage
+
+
+def reset_storages():
+    """ Drop shared storage instances. Next get_storage() call will instantiate a new one """
+    with _storages_lock:
+        _storages.clear()
 
 
 def generate_storage_file_path(prop, value, feature):
@@ -42,19 +71,65 @@ def generate_storage_file_path(prop, value, feature):
         # some file_name can be uri encoded
         file_name = unquote(file_name)
 
-        # build name in storage
-        return f'terra_geocrud/features/{feature.pk}/data_file/{prop}/{file_name}'
+        # build name in storage. Content hash folder : stored value changes with file content, and identifies it
+        content_hash = hashlib.md5((file_content or '').encode()).hexdigest()[:12]
+        return f'terra_geocrud/features/{feature.pk}/data_file/{prop}/{content_hash}/{file_name}'
+
+
+def get_old_storage_file_path(value):
+    """ Get storage path from stored value, even if value has no file info """
+    return value.split(';name=')[-1].split(';')[0] if value else None
 
 
 def delete_old_picture_property(file_prop, old_properties):
-    old_value = old_properties.get(file_prop)
-    old_storage_file_path = old_value.split(';name=')[-1].split(';')[0] if old_value else None
+    old_storage_file_path = get_old_storage_file_path(old_properties.get(file_prop))
     if old_storage_file_path:
         image_file = ImageFile(old_storage_file_path, storage=get_storage())
         image_file.delete()
         default.kvstore.delete(image_file)
 
 
+def get_property_files_paths(layer, file_prop):
+    """ List storage paths of a data-url property in all layer features, with one jsonb query """
+    values = layer.features.annotate(
+        file_value=KeyTextTransform(file_prop, 'properties')
+    ).filter(file_value__isnull=False).exclude(file_value='').values_list('file_value', flat=True)
+    return values
+
+
+def purge_property_files(job):
+    """
+    Background job deleting files of a removed data-url property.
+    Files are deleted in parallel by chunks, references and thumbnails are cleaned in kvstore.
+    """
+    chunk_size = app_settings.TERRA_GEOCRUD['JOBS_CHUNK_SIZE']
+    values = get_property_files_paths(job.crud_view.layer, job.params['key'])
+    job.set_progress(0, values.count())
+    storage = get_storage()
+    done = 0
+    chunk = []
+
+    def delete_chunk(image_files):
+        with ThreadPoolExecutor(max_workers=app_settings.TERRA_GEOCRUD['JOBS_MAX_WORKERS']) as executor:
+            # storage deletions are done in parallel, kvstore (database) in current thread
+            list(executor.map(lambda image_file: image_file.delete(), image_files))
+        for image_file in image_files:
+            default.kvstore.delete(image_file)
+
+    for value in values.iterator(chunk_size=chunk_size):
+        chunk.append(ImageFile(get_old_storage_file_path(value), storage=storage))
+        if len(chunk) >= chunk_size:
+            delete_chunk(chunk)
+            done += len(chunk)
+            chunk = []
+            job.set_progress(done)
+    if chunk:
+        delete_chunk(chunk)
+        done += len(chunk)
+    job.set_progress(done)
+    job.result['deleted'] = done
+
+
 def get_files_properties(feature):
     files_properties = [
         key for key, value in feature.layer.schema['properties'].items()
@@ -95,11 +170,71 @@ def store_feature_files(feature, old_properties=None):
                 delete_old_picture_property(file_prop, old_properties)
 
 
-def get_storage_file_url(storage_file_path):
-    # check if there is file in storage, else store it
+def get_url_cache_timeout(storage):
+    """ Keep urls in cache, but signed ones (as S3 querystring auth) have to expire before their signature """
+    timeout = app_settings.TERRA_GEOCRUD['FILE_URL_CACHE_TIMEOUT']
+    if getattr(storage, 'querystring_auth', False) and getattr(storage, 'querystring_expire', None):
+        timeout = min(timeout, storage.querystring_expire - app_settings.TERRA_GEOCRUD['FILE_URL_CACHE_MARGIN'])
+    return max(timeout, 0)
+
+
+# storage attributes changing urls, for django and django-storages backends
+STORAGE_URL_ATTRIBUTES = ('base_url', 'location', 'bucket_name', 'custom_domain', 'endpoint_url', 'azure_container')
+
+
+def get_storage_config_hash(storage):
+    """ Hash of storage class and of its configuration used to build urls """
+    storage_class = storage.__class__
+    config = [f'{storage_class.__module__}.{storage_class.__qualname__}']
+    config += [str(getattr(storage, attribute, None)) for attribute in STORAGE_URL_ATTRIBUTES]
+    if hasattr(storage, 'deconstruct'):
+        config.append(repr(sorted(storage.deconstruct()[2].items())))
+    return hashlib.md5('|'.join(config).encode()).hexdigest()
+
+
+def get_url_cache_key(storage, storage_file_path):
+    """ Url cache key, urls are cached by storage configuration as several storages can store the same path """
+    path_hash = hashlib.md5(storage_file_path.encode()).hexdigest()
+    return f'terra_geocrud_url_{get_storage_config_hash(storage)}_{path_hash}'
+
+
+class StorageUrlResolver:
+    """
+    Resolve storage file urls, for a request / serialization.
+    Urls are memoized, and shared in django cache until shortly before they expire.
+    Prefetch urls to get them from cache in one call.
+    """
+    def __init__(self):
+        self.urls = {}
+
+    def prefetch(self, storage_file_paths, storage=None):
+        storage = storage or get_storage()
+        keys = {
+            get_url_cache_key(storage, path): path
+            for path in set(storage_file_paths) if path and (storage, path) not in self.urls
+        }
+        if not keys:
+            return
+        timeout = get_url_cache_timeout(storage)
+        cached_urls = cache.get_many(keys.keys()) if timeout else {}
+        new_urls = {key: storage.url(path) for key, path in keys.items() if key not in cached_urls}
+        if new_urls and timeout:
+            cache.set_many(new_urls, timeout)
+        for key, url in {**cached_urls, **new_urls}.items():
+            self.urls[(storage, keys[key])] = url
+
+    def url(self, storage_file_path, storage=None):
+        if not storage_file_path:
+            return None
+        storage = storage or get_storage()
+        self.prefetch([storage_file_path], storage)
+        return self.urls[(storage, storage_file_path)]
+
+
+def get_storage_file_url(storage_file_path, url_resolver=None):
     if storage_file_path:
-        storage = get_storage()
-        return storage.url(storage_file_path)
+        url_resolver = url_resolver or StorageUrlResolver()
+        return url_resolver.url(storage_file_path)
 
 
 def get_storage_path_from_infos(infos):
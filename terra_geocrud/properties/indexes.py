@@ -0,0 +1,125 @@
+import hashlib
+
+from django.db import connection, transaction
+
+INDEX_PREFIX = 'terra_geocrud_prop'
+
+
+def get_property_value_type(json_schema):
+    """ Database type used to filter and sort property values : numeric, boolean or text """
+    if json_schema.get('type') in ('integer', 'number'):
+        return 'numeric'
+    if json_schema.get('type') == 'boolean':
+        return 'boolean'
+    return 'text'
+
+
+def get_property_value_expression(key, value_type, column='properties'):
+    """
+    SQL expression of typed property value, null if json type doesn't match.
+    Queries should use the same expression to use property index.
+    """
+    # keys are slugs, quote them anyway
+    key = "'{}'".format(key.replace("'", "''"))
+    if value_type == 'numeric':
+        return f"(CASE WHEN jsonb_typeof({column} -> {key}) = 'number' THEN ({column} ->> {key})::numeric END)"
+    if value_type == 'boolean':
+        return f"(CASE WHEN jsonb_typeof({column} -> {key}) = 'boolean' THEN ({column} ->> {key})::boolean END)"
+    return f"({column} ->> {key})"
+
+
+def get_index_prefix(layer_id):
+    return f'{INDEX_PREFIX}_{layer_id}_'
+
+
+def get_index_name(layer_id, key, value_type):
+    # name should stay under 63 chars, and change with value type
+    return f'{get_index_prefix(layer_id)}{hashlib.md5(f"{key}-{value_type}".encode()).hexdigest()[:16]}'
+
+
+def get_expected_indexes(crud_view):
+    """ Index name and creation SQL (without CREATE INDEX) for each filterable property """
+    table = connection.ops.quote_name(crud_view.layer.features.model._meta.db_table)
+    indexes = {}
+    for prop in crud_view.properties.filter(filterable=True):
+        value_type = get_property_value_type(prop.json_schema)
+        name = get_index_name(crud_view.layer_id, prop.key, value_type)
+        expression = get_property_value_expression(prop.key, value_type)
+        indexes[name] = f"{connection.ops.quote_name(name)} ON {table} ({expression}) " \
+                        f"WHERE layer_id = {int(crud_view.layer_id)}"
+    return indexes
+
+
+def get_existing_indexes(layer_id):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND indexname LIKE %s",
+                       [f'{INDEX_PREFIX}%'])
+        names = [row[0] for row in cursor.fetchall()]
+    # LIKE "_" matches any char, prefix is checked here
+    return {name for name in names if name.startswith(get_index_prefix(layer_id))}
+
+
+def get_property_indexes_diff(crud_view):
+    """ Indexes to create and indexes to drop, to match filterable properties """
+    expected = get_expected_indexes(crud_view)
+    existing = get_existing_indexes(crud_view.layer_id)
+    to_create = {name: sql for name, sql in expected.items() if name not in existing}
+    to_drop = sorted(existing - expected.keys())
+    return to_create, to_drop
+
+
+def get_property_index_state(prop):
+    """ Property fields defining its index, indexes are synced only when they change """
+    return prop.key, prop.filterable, get_property_value_type(prop.json_schema)
+
+
+def request_property_indexes_sync(crud_view):
+    """
+    Create sync job once committed, if indexes don't match filterable properties.
+    Job started out of transaction can create and drop indexes concurrently.
+    """
+    def request():
+        BackgroundJob = crud_view.jobs.model
+        if crud_view.jobs.filter(action=BackgroundJob.SYNC_PROPERTY_INDEXES, state=BackgroundJob.PENDING).exists():
+            # pending job will compute indexes to create or drop when started. A running job may have computed them
+            # before this change, a new job is required
+            return
+        if any(get_property_indexes_diff(crud_view)):
+            BackgroundJob.objects.create(crud_view=crud_view, action=BackgroundJob.SYNC_PROPERTY_INDEXES)
+
+    transaction.on_commit(request)
+
+
+def get_concurrently():
+    # concurrent operations can't be executed in transaction (synchronous jobs in admin, tests)
+    return '' if connection.in_atomic_block else 'CONCURRENTLY '
+
+
+def sync_property_indexes(job):
+    """ Background job creating and dropping property indexes, without locking feature table if possible """
+    to_create, to_drop = get_property_indexes_diff(job.crud_view)
+    job.set_progress(0, len(to_create) + len(to_drop))
+    job.result.update({'created': [], 'dropped': []})
+    with connection.cursor() as cursor:
+        for name in to_drop:
+            cursor.execute(f"DROP INDEX {get_concurrently()}IF EXISTS {connection.ops.quote_name(name)}")
+            job.result['dropped'].append(name)
+            job.set_progress(job.done + 1)
+        for name, sql in to_create.items():
+            concurrently = get_concurrently()
+            try:
+                cursor.execute(f"CREATE INDEX {concurrently}IF NOT EXISTS {sql}")
+            except Exception:
+                if concurrently:
+                    # a failed concurrent creation leaves an invalid index
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {connection.ops.quote_name(name)}")
+                raise
+            job.result['created'].append(name)
+            job.set_progress(job.done + 1)
+
+
+def drop_property_indexes(layer_id):
+    """ Drop all property indexes of a layer, in current transaction """
+    with connection.cursor() as cursor:
+        for name in get_existing_indexes(layer_id):
+            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(name)}")
@@ -0,0 +1,349 @@
+import json
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from terra_geocrud import settings as app_settings
+from terra_geocrud.map.tiles import invalidate_layer_tiles
+from terra_geocrud.properties.schema import (bump_data_version, sync_layer_schema, sync_ui_schema,
+                                             sync_properties_in_tiles)
+from terra_geocrud.properties.search import update_features_search
+
+# values that can be casted to each json schema type, checked with case insensitive regex
+CAST_PATTERNS = {
+    'string': r'',
+    'integer': r'^\s*[-+]?\d+(\.0*)?\s*$',
+    'number': r'^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$',
+    'boolean': r'^\s*(true|false|t|f|yes|no|y|n|on|off|1|0)\s*$',
+}
+CAST_EXPRESSIONS = {
+    'string': "to_jsonb(properties ->> %(key)s)",
+    'integer': "to_jsonb((properties ->> %(key)s)::numeric::bigint)",
+    'number': "to_jsonb((properties ->> %(key)s)::numeric)",
+    'boolean': "to_jsonb(trim(properties ->> %(key)s)::boolean)",
+}
+JSON_TYPES = {
+    'string': 'string',
+    'integer': 'number',
+    'number': 'number',
+    'boolean': 'boolean',
+}
+
+
+class PropertyOperation:
+    """
+    Data operation on feature properties, executed in SQL.
+    expression is the new properties value, condition selects features to update,
+    invalid_condition selects features with values that can't be converted.
+    """
+    name = None
+    invalid_condition = None
+
+    def __init__(self, crud_view, params):
+        self.crud_view = crud_view
+        self.params = params
+
+    def get_property(self, key):
+        try:
+            return self.crud_view.properties.get(key=key)
+        except self.crud_view.properties.model.DoesNotExist:
+            raise ValueError(f"Property {key} does not exist")
+
+    def validate(self):
+        pass
+
+    def get_sql_params(self):
+        return {}
+
+    def update_schema(self):
+        pass
+
+
+class RenameOperation(PropertyOperation):
+    """ Rename property key. Stored data-url file paths keep old key in their folder, and stay valid """
+    name = 'rename'
+    condition = "properties ? %(key)s"
+    expression = "(properties - %(key)s) || jsonb_build_object(%(new_key)s::text, properties -> %(key)s)"
+
+    def validate(self):
+        self.property = self.get_property(self.params['key'])
+        new_key = self.params['new_key']
+        if slugify(new_key) != new_key:
+            raise ValueError(f"{new_key} is not a valid key")
+        if self.crud_view.properties.filter(key=new_key).exists():
+            raise ValueError(f"Property {new_key} already exists")
+
+    def get_sql_params(self):
+        return {'key': self.params['key'], 'new_key': self.params['new_key']}
+
+    def update_schema(self):
+        self.property.key = self.params['new_key']
+        self.property.save()
+        if self.property.include_in_tile:
+            sync_properties_in_tiles(self.crud_view)
+
+
+class CastOperation(PropertyOperation):
+    """ Cast property values to another json schema type. Invalid values are removed only with drop_invalid """
+    name = 'cast'
+    condition = "properties ? %(key)s AND jsonb_typeof(properties -> %(key)s) <> 'null' " \
+                "AND NOT (jsonb_typeof(properties -> %(key)s) = %(json_type)s AND properties ->> %(key)s ~* %(pattern)s)"
+    invalid_condition = "properties ? %(key)s AND jsonb_typeof(properties -> %(key)s) <> 'null' " \
+                        "AND NOT properties ->> %(key)s ~* %(pattern)s"
+
+    @property
+    def expression(self):
+        return "CASE WHEN properties ->> %(key)s ~* %(pattern)s " \
+               f"THEN jsonb_set(properties, ARRAY[%(key)s], {CAST_EXPRESSIONS[self.params['type']]}) " \
+               "ELSE properties - %(key)s END"
+
+    def validate(self):
+        self.property = self.get_property(self.params['key'])
+        if self.params['type'] not in CAST_PATTERNS:
+            raise ValueError(f"Type should be one of {', '.join(CAST_PATTERNS)}")
+        if self.property.json_schema.get('type') in ('array', 'object') \
+                or self.property.json_schema.get('format') == 'data-url':
+            raise ValueError("Only simple properties can be casted")
+        self.enums = []
+        for enum in self.property.values.all():
+            value = self.cast_enum_value(enum.value)
+            if value is None and not self.params.get('drop_invalid'):
+                raise ValueError(f"Enum value {enum.value} can't be casted to {self.params['type']}")
+            self.enums.append((enum, value))
+
+    def cast_enum_value(self, value):
+        try:
+            if self.params['type'] == 'integer':
+                number = float(value)
+                return str(int(number)) if number.is_integer() else None
+            elif self.params['type'] == 'number':
+                return str(float(value))
+        except ValueError:
+            return None
+        return value
+
+    def get_sql_params(self):
+        return {
+            'key': self.params['key'],
+            'pattern': CAST_PATTERNS[self.params['type']],
+            'json_type': JSON_TYPES[self.params['type']]
+        }
+
+    def update_schema(self):
+        self.property.json_schema['type'] = self.params['type']
+        self.property.save()
+        for enum, value in self.enums:
+            if value is None:
+                enum.delete()
+            elif value != enum.value:
+                enum.value = value
+                enum.save()
+
+
+class MapValuesOperation(PropertyOperation):
+    """ Replace values according mapping {old value: new value}. Array items are mapped one by one """
+    name = 'map_values'
+
+    @property
+    def is_array(self):
+        return self.property.json_schema.get('type') == 'array'
+
+    @property
+    def condition(self):
+        if self.is_array:
+            return "jsonb_typeof(properties -> %(key)s) = 'array' AND EXISTS (" \
+                   "SELECT 1 FROM jsonb_array_elements(properties -> %(key)s) AS item " \
+                   "WHERE %(mapping)s::jsonb ? (item #>> '{}'))"
+        return "jsonb_typeof(properties -> %(key)s) IN ('string', 'number', 'boolean') " \
+               "AND %(mapping)s::jsonb ? (properties ->> %(key)s)"
+
+    @property
+    def expression(self):
+        if self.is_array:
+            return "jsonb_set(properties, ARRAY[%(key)s], (" \
+                   "SELECT jsonb_agg(COALESCE(%(mapping)s::jsonb -> (item #>> '{}'), item)) " \
+                   "FROM jsonb_array_elements(properties -> %(key)s) AS item))"
+        return "jsonb_set(properties, ARRAY[%(key)s], %(mapping)s::jsonb -> (properties ->> %(key)s))"
+
+    def validate(self):
+        self.property = self.get_property(self.params['key'])
+        if not isinstance(self.params.get('mapping'), dict) or not self.params['mapping']:
+            raise ValueError("Mapping should be a non empty dict")
+
+    def get_sql_params(self):
+        mapping = {str(key): value for key, value in self.params['mapping'].items()}
+        return {'key': self.params['key'], 'mapping': json.dumps(mapping)}
+
+    def update_schema(self):
+        mapping = {str(key): str(value) for key, value in self.params['mapping'].items()}
+        existing_values = set(self.property.values.values_list('value', flat=True))
+        for enum in self.property.values.filter(value__in=mapping.keys()):
+            new_value = mapping[enum.value]
+            if new_value in existing_values:
+                # merged in another enum value
+                enum.delete()
+            else:
+                existing_values.discard(enum.value)
+                existing_values.add(new_value)
+                enum.value = new_value
+                enum.save()
+
+
+class SplitOperation(PropertyOperation):
+    """
+    Split string property in several existing properties, with separator. Last one receives remaining parts.
+    Source property is deleted.
+    """
+    name = 'split'
+    condition = "jsonb_typeof(properties -> %(key)s) = 'string'"
+
+    @property
+    def expression(self):
+        parts = []
+        last = len(self.params['new_keys'])
+        for index, new_key in enumerate(self.params['new_keys'], 1):
+            if index < last:
+                value = f"(string_to_array(properties ->> %(key)s, %(separator)s))[{index}]"
+            else:
+                value = f"array_to_string((string_to_array(properties ->> %(key)s, %(separator)s))[{index}:], " \
+                        "%(separator)s)"
+            parts.append(f"%(new_key_{index})s::text, NULLIF(trim({value}), '')")
+        return f"(properties - %(key)s) || jsonb_strip_nulls(jsonb_build_object({', '.join(parts)}))"
+
+    def validate(self):
+        self.property = self.get_property(self.params['key'])
+        if len(self.params.get('new_keys', [])) < 2 or not self.params.get('separator'):
+            raise ValueError("At least two new keys and a separator are required")
+        for new_key in self.params['new_keys']:
+            self.get_property(new_key)
+
+    def get_sql_params(self):
+        params = {'key': self.params['key'], 'separator': self.params['separator']}
+        params.update({f'new_key_{index}': key for index, key in enumerate(self.params['new_keys'], 1)})
+        return params
+
+    def update_schema(self):
+        if self.property.key not in self.params['new_keys']:
+            self.property.delete()
+
+
+class MergeOperation(PropertyOperation):
+    """ Merge several properties in an existing one, joined with separator. Source properties are deleted """
+    name = 'merge'
+    condition = "properties ?| %(keys)s"
+
+    @property
+    def expression(self):
+        values = ', '.join(f"properties ->> %(key_{index})s" for index in range(len(self.params['keys'])))
+        return "(properties - %(keys)s::text[]) || jsonb_strip_nulls(jsonb_build_object(" \
+               f"%(new_key)s::text, NULLIF(concat_ws(%(separator)s, {values}), '')))"
+
+    def validate(self):
+        self.properties = [self.get_property(key) for key in self.params.get('keys', [])]
+        if len(self.properties) < 2:
+            raise ValueError("At least two keys are required")
+        self.get_property(self.params['new_key'])
+
+    def get_sql_params(self):
+        params = {
+            'keys': self.params['keys'],
+            'new_key': self.params['new_key'],
+            'separator': self.params.get('separator', ' '),
+        }
+        params.update({f'key_{index}': key for index, key in enumerate(self.params['keys'])})
+        return params
+
+    def update_schema(self):
+        for prop in self.properties:
+            if prop.key != self.params['new_key']:
+                prop.delete()
+
+
+OPERATIONS = {
+    operation.name: operation
+    for operation in (RenameOperation, CastOperation, MapValuesOperation, SplitOperation, MergeOperation)
+}
+
+
+def get_operation(crud_view, params):
+    try:
+        operation = OPERATIONS[params['operation']](crud_view, params)
+    except KeyError:
+        raise ValueError(f"Operation should be one of {', '.join(OPERATIONS)}")
+    operation.validate()
+    return operation
+
+
+def get_operation_stats(operation):
+    """ Dry run statistics : number of features, features to update, and features with invalid values """
+    table = connection.ops.quote_name(operation.crud_view.layer.features.model._meta.db_table)
+    params = operation.get_sql_params()
+    params['layer'] = operation.crud_view.layer_id
+    invalid_condition = operation.invalid_condition or 'false'
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*), count(*) FILTER (WHERE {operation.condition}), "
+                       f"count(*) FILTER (WHERE {invalid_condition}) FROM {table} WHERE layer_id = %(layer)s",
+                       params)
+        features, to_update, invalid = cursor.fetchone()
+    return {'features': features, 'to_update': to_update, 'invalid': invalid}
+
+
+def migrate_property(job):
+    """
+    Background job applying a property operation (job.params['operation']) with chunked UPDATE.
+    Progress is saved after each chunk, so a failed job resumes after the last updated feature.
+    Features saved since job start are skipped by chunks, and updated with schema in a final sweep.
+    Use dry_run param to get statistics only.
+    """
+    crud_view = job.crud_view
+    operation = get_operation(crud_view, job.params)
+    stats = get_operation_stats(operation)
+    if job.params.get('dry_run'):
+        job.result.update(stats)
+        return
+    if stats['invalid'] and not job.params.get('drop_invalid'):
+        raise ValueError(f"{stats['invalid']} feature values can't be converted. Use drop_invalid to remove them.")
+
+    table = connection.ops.quote_name(crud_view.layer.features.model._meta.db_table)
+    sql = f"UPDATE {table} SET properties = {operation.expression} " \
+          f"WHERE id = ANY(%(ids)s) AND updated_at < %(started)s AND {operation.condition}"
+    sweep_sql = f"UPDATE {table} SET properties = {operation.expression} " \
+                f"WHERE layer_id = %(layer)s AND updated_at >= %(started)s AND {operation.condition} RETURNING id"
+    # UPDATE doesn't change updated_at : features updated by chunks are not updated again by sweep
+    started = parse_datetime(job.result.setdefault('started', timezone.now().isoformat()))
+    params = dict(operation.get_sql_params(), started=started)
+    chunk_size = app_settings.TERRA_GEOCRUD['JOBS_CHUNK_SIZE']
+    throttle = app_settings.TERRA_GEOCRUD['JOBS_THROTTLE']
+    features = crud_view.layer.features.order_by('pk').values_list('pk', flat=True)
+    job.result.setdefault('updated', 0)
+    job.set_progress(job.done, stats['features'])
+
+    while True:
+        ids = list(features.filter(pk__gt=job.result.get('last_id', 0))[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, dict(params, ids=ids))
+            job.result['updated'] += cursor.rowcount
+            job.result['last_id'] = ids[-1]
+            update_features_search(crud_view, ids)
+            job.set_progress(job.done + len(ids))
+        if throttle:
+            # let other queries access table between chunks
+            time.sleep(throttle)
+
+    with transaction.atomic():
+        # features saved during chunks (or between job runs) may contain values to migrate
+        with connection.cursor() as cursor:
+            cursor.execute(sweep_sql, dict(params, layer=crud_view.layer_id))
+            ids = [row[0] for row in cursor.fetchall()]
+        job.result['updated'] += len(ids)
+        update_features_search(crud_view, ids)
+        operation.update_schema()
+        sync_layer_schema(crud_view)
+        sync_ui_schema(crud_view)
+        bump_data_version(crud_view)
+        transaction.on_commit(lambda: invalidate_layer_tiles(crud_view.layer_id))
@@ -1,14 +1,65 @@
+import threading
 from copy import deepcopy
 
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
 from django.utils.functional import cached_property
 
+from terra_geocrud import settings as app_settings
+from terra_geocrud.cache import LocalLRUCache
+
+# keep only properties in schema and not null, for features with at least one property to remove
+CLEAN_PROPERTIES_SQL = """
+UPDATE {table} SET properties = COALESCE((
+    SELECT jsonb_object_agg(props.key, props.value) FROM jsonb_each({table}.properties) AS props
+    WHERE props.key = ANY(%(keys)s) AND jsonb_typeof(props.value) <> 'null'
+), '{{}}'::jsonb)
+WHERE {table}.id = ANY(%(ids)s) AND EXISTS (
+    SELECT 1 FROM jsonb_each({table}.properties) AS props
+    WHERE NOT props.key = ANY(%(keys)s) OR jsonb_typeof(props.value) = 'null'
+)
+RETURNING {table}.id
+"""
+
+
+_grouped_schemas = LocalLRUCache('SCHEMA_CACHE_SIZE')
+# versions waiting for commit in each thread, by crud view pk and version field
+_pending_versions = threading.local()
+
 
 class FormSchemaMixin:
     @cached_property
     def grouped_form_schema(self):
-        original_schema = deepcopy(self.layer.schema)
-        generated_schema = deepcopy(original_schema)
-        groups = self.feature_display_groups.all()
+        return self.get_grouped_schemas()['form_schema']
+
+    @cached_property
+    def grouped_ui_schema(self):
+        return self.get_grouped_schemas()['ui_schema']
+
+    def get_grouped_schemas(self):
+        """
+        Grouped form and ui schemas, kept in process and in django cache for each crud view schema version.
+        Returned schemas are shared, don't modify them.
+        """
+        timeout = app_settings.TERRA_GEOCRUD['SCHEMA_CACHE_TIMEOUT']
+        if not self.pk or not timeout:
+            return {'form_schema': self.get_grouped_form_schema(), 'ui_schema': self.get_grouped_ui_schema()}
+
+        cache_key = f'terra_geocrud_grouped_schemas_{self.pk}_{self.schema_version}'
+        schemas = _grouped_schemas.get(cache_key)
+        if schemas is None:
+            schemas = cache.get(cache_key)
+            if schemas is None:
+                schemas = {'form_schema': self.get_grouped_form_schema(), 'ui_schema': self.get_grouped_ui_schema()}
+                cache.set(cache_key, schemas, timeout)
+            _grouped_schemas.set(cache_key, schemas)
+        return schemas
+
+    def get_grouped_form_schema(self):
+        original_schema = self.layer.schema
+        generated_schema = {key: deepcopy(value) for key, value in original_schema.items() if key != 'properties'}
+        groups = self.feature_display_groups.all().prefetch_related('group_properties')
         generated_schema['properties'] = {}
 
         for group in groups:
@@ -22,12 +73,11 @@ class FormSchemaMixin:
         # add default other properties
         remained_properties = list(self.properties.filter(group__isnull=True).values_list('key', flat=True))
         for prop in remained_properties:
-            generated_schema['properties'][prop] = original_schema.get('properties', {}).get(prop)
+            generated_schema['properties'][prop] = deepcopy(original_schema.get('properties', {}).get(prop))
 
         return generated_schema
 
-    @cached_property
-    def grouped_ui_schema(self):
+    def get_grouped_ui_schema(self):
         """
         Original ui_schema is recomposed with grouped properties
         """
@@ -51,49 +101,155 @@ class FormSchemaMixin:
             # finish by adding '*' in all cases (security)
             ui_schema[group.slug]['ui:order'] += ['*']
         if groups:
-            ui_schema['ui:order'] = list(groups.values_list('slug', flat=True)) + ['*']
+            ui_schema['ui:order'] = [group.slug for group in groups] + ['*']
         return ui_schema
 
 
-def sync_layer_schema(crud_view):
-    """ sync layer schema with properties defined by crud view properties """
-    properties = crud_view.properties.all().prefetch_related('values')
-    crud_view.layer.schema = {
+def reset_grouped_schemas():
+    """ Drop grouped schemas kept in process. Django cache entries expire with schema version """
+    _grouped_schemas.clear()
+
+
+def get_layer_schema(crud_view):
+    """ Generate layer schema from crud view properties. Enum values are loaded in one query """
+    properties = list(crud_view.properties.all().prefetch_related('values'))
+    return {
         "properties": {
             prop.key: prop.full_json_schema for prop in properties
         },
         # required fields
-        'required': list(properties.filter(required=True).values_list('key', flat=True))
+        'required': [prop.key for prop in properties if prop.required]
     }
 
-    crud_view.layer.save()
+
+def get_schema_diff(old_schema, new_schema):
+    """ Property keys added, removed or changed between two layer schemas """
+    old_properties = (old_schema or {}).get('properties', {})
+    new_properties = new_schema.get('properties', {})
+    return {
+        'added': sorted(new_properties.keys() - old_properties.keys()),
+        'removed': sorted(old_properties.keys() - new_properties.keys()),
+        'changed': sorted(key for key in new_properties.keys() & old_properties.keys()
+                          if new_properties[key] != old_properties[key]),
+    }
+
+
+def bump_version(crud_view, field):
+    queryset = crud_view._meta.model.objects.filter(pk=crud_view.pk)
+    queryset.update(**{field: F(field) + 1})
+    version = queryset.values_list(field, flat=True).first()
+    if version is not None:
+        setattr(crud_view, field, version)
+
+
+def bump_version_on_commit(crud_view, field):
+    """
+    Bump version once when current transaction is committed. Crud view row is not locked by transactions
+    writing its features or schema sources, and transactions with many changes bump it once.
+    """
+    if not connection.in_atomic_block:
+        bump_version(crud_view, field)
+        return
+    batches = getattr(_pending_versions, 'batches', None)
+    if batches is None:
+        batches = _pending_versions.batches = {}
+    key = (crud_view.pk, field)
+    # batch left by a rolled back transaction is reused by next one
+    batch = batches.setdefault(key, {'done': False})
+
+    def bump():
+        # first committed callback of batch bumps version, others are ignored
+        if batch['done']:
+            return
+        batch['done'] = True
+        if batches.get(key) is batch:
+            del batches[key]
+        bump_version(crud_view, field)
+
+    transaction.on_commit(bump)
+
+
+def bump_schema_version_on_commit(crud_view):
+    """ Invalidate caches keyed on crud view schema version, once committed. Called by signals of schema sources """
+    bump_version_on_commit(crud_view, 'schema_version')
+
+
+def bump_data_version(crud_view):
+    """ Invalidate caches keyed on crud view data version. Called when layer features change """
+    bump_version(crud_view, 'data_version')
+
+
+def bump_data_version_on_commit(crud_view):
+    """ Invalidate caches keyed on crud view data version, once committed. Called by feature signals """
+    bump_version_on_commit(crud_view, 'data_version')
+
+
+def sync_layer_schema(crud_view):
+    """
+    sync layer schema with properties defined by crud view properties.
+    Layer is saved only if schema changed, its save signal bumps crud view schema version once committed.
+    Return diff with previous schema.
+    """
+    layer = crud_view.layer
+    schema = get_layer_schema(crud_view)
+    diff = get_schema_diff(layer.schema, schema)
+    if schema != layer.schema:
+        layer.schema = schema
+        layer.save()
+    return diff
 
 
 def sync_ui_schema(crud_view):
-    """ sync ui schema with properties defined by crud view properties """
-    crud_view.ui_schema = {
+    """
+    sync ui schema with properties defined by crud view properties.
+    Crud view is saved only if ui schema changed, its save signal bumps schema version once committed.
+    """
+    ui_schema = {
         prop.key: prop.ui_schema
         for prop in crud_view.properties.exclude(ui_schema={})
     }
-    crud_view.save()
+    if ui_schema != crud_view.ui_schema:
+        crud_view.ui_schema = ui_schema
+        crud_view.save()
 
 
-def clean_properties_not_in_schema_or_null(crud_view):
-    """ Clean properties not in layer schema to avoid schema validation """
+def clean_properties_not_in_schema_or_null(crud_view, progress=None):
+    """
+    Clean properties not in layer schema to avoid schema validation.
+    Features are updated by chunks in SQL, without save signals. Return updated feature ids.
+    """
     layer = crud_view.layer
-    features = layer.features.all()
-    if layer.schema:
-        schema_keys = layer.schema.get('properties').keys()
-
-        for feat in features:
-            properties = deepcopy(feat.properties)
-            keys = feat.properties.keys()
-            props_not_in_schema = keys - schema_keys
-            for prop in keys:
-                if prop in props_not_in_schema or feat.properties.get(prop) is None:
-                    properties.pop(prop, 0)
-            feat.properties = properties
-            feat.save()
+    updated_ids = []
+    if not layer.schema:
+        return updated_ids
+
+    schema_keys = list(layer.schema.get('properties', {}).keys())
+    chunk_size = app_settings.TERRA_GEOCRUD['JOBS_CHUNK_SIZE']
+    sql = CLEAN_PROPERTIES_SQL.format(table=connection.ops.quote_name(layer.features.model._meta.db_table))
+    feature_ids = layer.features.order_by('pk').values_list('pk', flat=True)
+    total = feature_ids.count()
+    done = 0
+    chunk = []
+
+    def clean_chunk():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'keys': schema_keys, 'ids': chunk})
+            updated_ids.extend(row[0] for row in cursor.fetchall())
+
+    for feature_id in feature_ids.iterator(chunk_size=chunk_size):
+        chunk.append(feature_id)
+        if len(chunk) >= chunk_size:
+            clean_chunk()
+            done += len(chunk)
+            chunk = []
+            if progress:
+                progress(done, total)
+    if chunk:
+        clean_chunk()
+        done += len(chunk)
+    if progress:
+        progress(done, total)
+    return updated_ids
 
 
 def sync_properties_in_tiles(crud_view):
@@ -0,0 +1,111 @@
+import hashlib
+
+from django.apps import apps
+from django.db import connection
+
+from .. import settings as app_settings
+
+
+def quote_key(key):
+    return "'{}'".format(key.replace("'", "''"))
+
+
+def get_searchable_properties(crud_view):
+    """ (key, weight) of searchable properties, ordered by weight """
+    return list(crud_view.properties.exclude(search_weight='')
+                .order_by('search_weight', 'key').values_list('key', 'search_weight'))
+
+
+def get_search_signature(crud_view):
+    """ Changes with search configuration, empty if nothing is searchable """
+    properties = get_searchable_properties(crud_view)
+    if not properties:
+        return ''
+    return hashlib.md5(f"{crud_view.search_config}-{properties}".encode()).hexdigest()
+
+
+def request_features_search_rebuild(crud_view):
+    """ Create rebuild job if search configuration changed since last one """
+    signature = get_search_signature(crud_view)
+    BackgroundJob = crud_view.jobs.model
+    last_job = crud_view.jobs.filter(action=BackgroundJob.REBUILD_FEATURES_SEARCH,
+                                     state__in=(BackgroundJob.PENDING, BackgroundJob.RUNNING, BackgroundJob.SUCCESS))\
+        .first()
+    if (last_job.params.get('signature', '') if last_job else '') != signature:
+        BackgroundJob.objects.create(crud_view=crud_view, action=BackgroundJob.REBUILD_FEATURES_SEARCH,
+                                     params={'signature': signature})
+
+
+def get_search_vector_sql(properties, column='properties'):
+    """ Weighted tsvector SQL expression, with text search configuration as %(config)s parameter """
+    return ' || '.join(
+        f"setweight(to_tsvector(%(config)s::regconfig, coalesce({column} ->> {quote_key(key)}, '')), '{weight}')"
+        for key, weight in properties
+    )
+
+
+def get_search_text_sql(properties, column='properties'):
+    """ Searchable property values concatenated, to highlight matches """
+    return "concat_ws(' ', {})".format(', '.join(f"{column} ->> {quote_key(key)}" for key, _weight in properties))
+
+
+def get_search_tables():
+    """ Quoted feature search and feature tables """
+    # models are not imported, as models module uses this one
+    feature_search = apps.get_model('terra_geocrud', 'FeatureSearch')
+    feature = apps.get_model('geostore', 'Feature')
+    return connection.ops.quote_name(feature_search._meta.db_table), connection.ops.quote_name(feature._meta.db_table)
+
+
+def get_upsert_sql(properties, where):
+    search_table, feature_table = get_search_tables()
+    return f"""
+        INSERT INTO {search_table} (feature_id, vector)
+        SELECT id, {get_search_vector_sql(properties)} FROM {feature_table}
+        WHERE {where}
+        ORDER BY id
+        LIMIT %(limit)s
+        ON CONFLICT (feature_id) DO UPDATE SET vector = EXCLUDED.vector
+        RETURNING feature_id
+    """
+
+
+def update_features_search(crud_view, features_id):
+    """ Update search vectors of some features, after their save """
+    properties = get_searchable_properties(crud_view)
+    if not properties:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(get_upsert_sql(properties, "layer_id = %(layer)s AND id = ANY(%(ids)s)"), {
+            'config': crud_view.search_config, 'layer': crud_view.layer_id,
+            'ids': list(features_id), 'limit': len(features_id),
+        })
+
+
+def delete_features_search(layer_id):
+    search_table, feature_table = get_search_tables()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {search_table} WHERE feature_id IN "
+                       f"(SELECT id FROM {feature_table} WHERE layer_id = %s)", [layer_id])
+
+
+def rebuild_features_search(job):
+    """ Background job rebuilding search vectors of all layer features by chunks, after configuration change """
+    crud_view = job.crud_view
+    properties = get_searchable_properties(crud_view)
+    if not properties:
+        delete_features_search(crud_view.layer_id)
+        return
+    job.set_progress(0, crud_view.layer.features.count())
+    last_id = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(get_upsert_sql(properties, "layer_id = %(layer)s AND id > %(last_id)s"), {
+                'config': crud_view.search_config, 'layer': crud_view.layer_id,
+                'last_id': last_id, 'limit': app_settings.TERRA_GEOCRUD['JOBS_CHUNK_SIZE'],
+            })
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            last_id = max(ids)
+            job.set_progress(job.done + len(ids))
@@ -0,0 +1,139 @@
+from django.db import connection
+
+from .. import settings as app_settings
+from .indexes import get_property_value_expression
+
+STATISTICS_PREFIX = '$stats.'
+
+
+def get_statistics_type(json_schema):
+    """ numeric, date (ISO strings, compared as text) or None if no statistics """
+    if json_schema.get('type') in ('integer', 'number'):
+        return 'numeric'
+    if json_schema.get('type') == 'string' and json_schema.get('format') in ('date', 'date-time'):
+        return 'date'
+    return None
+
+
+def get_quantiles():
+    buckets = app_settings.TERRA_GEOCRUD['STATISTICS_BUCKETS']
+    return [round(i / buckets, 4) for i in range(1, buckets)]
+
+
+def fetch_dict(cursor):
+    columns = [column[0] for column in cursor.description]
+    row = cursor.fetchone()
+    return dict(zip(columns, row))
+
+
+def to_json_value(value):
+    return float(value) if value is not None and not isinstance(value, str) else value
+
+
+def compute_numeric_statistics(cursor, values_sql, params):
+    cursor.execute(f"SELECT count(value) AS count, min(value) AS min, max(value) AS max, avg(value) AS mean, "
+                   f"percentile_cont(%(quantiles)s::float8[]) WITHIN GROUP (ORDER BY value) AS quantiles "
+                   f"FROM ({values_sql}) AS feature WHERE value IS NOT NULL", params)
+    statistics = fetch_dict(cursor)
+    if not statistics['count']:
+        return {'count': 0}
+    histogram = []
+    if statistics['min'] == statistics['max']:
+        histogram.append({'min': statistics['min'], 'max': statistics['max'], 'count': statistics['count']})
+    else:
+        buckets = app_settings.TERRA_GEOCRUD['STATISTICS_BUCKETS']
+        width = (statistics['max'] - statistics['min']) / buckets
+        # max value is in last bucket, not in an overflow bucket
+        cursor.execute(f"SELECT least(width_bucket(value, %(min)s, %(max)s, %(buckets)s), %(buckets)s), count(*) "
+                       f"FROM ({values_sql}) AS feature WHERE value IS NOT NULL GROUP BY 1",
+                       dict(params, min=statistics['min'], max=statistics['max'], buckets=buckets))
+        counts = dict(cursor.fetchall())
+        for bucket in range(1, buckets + 1):
+            histogram.append({'min': statistics['min'] + width * (bucket - 1),
+                              'max': statistics['min'] + width * bucket,
+                              'count': counts.get(bucket, 0)})
+    return {
+        'count': statistics['count'],
+        'min': to_json_value(statistics['min']),
+        'max': to_json_value(statistics['max']),
+        'mean': to_json_value(statistics['mean']),
+        'quantiles': [to_json_value(value) for value in statistics['quantiles']],
+        'histogram': [{key: to_json_value(value) if key != 'count' else value for key, value in bucket.items()}
+                      for bucket in histogram],
+    }
+
+
+def compute_date_statistics(cursor, values_sql, params):
+    cursor.execute(f"SELECT count(value) AS count, min(value) AS min, max(value) AS max, "
+                   f"percentile_disc(%(quantiles)s::float8[]) WITHIN GROUP (ORDER BY value) AS quantiles "
+                   f"FROM ({values_sql}) AS feature WHERE value IS NOT NULL", params)
+    statistics = fetch_dict(cursor)
+    if not statistics['count']:
+        return {'count': 0}
+    # histogram by month
+    cursor.execute(f"SELECT left(value, 7) AS month, count(*) FROM ({values_sql}) AS feature "
+                   f"WHERE value IS NOT NULL GROUP BY 1 ORDER BY 1", params)
+    statistics['histogram'] = [{'min': month, 'max': month, 'count': count} for month, count in cursor.fetchall()]
+    return statistics
+
+
+def compute_property_statistics(crud_view, key, json_schema):
+    """ Count, min, max, mean (numeric), quantiles and histogram of property values in layer features """
+    statistics_type = get_statistics_type(json_schema)
+    table = connection.ops.quote_name(crud_view.layer.features.model._meta.db_table)
+    value_type = 'numeric' if statistics_type == 'numeric' else 'text'
+    values_sql = f"SELECT {get_property_value_expression(key, value_type)} AS value FROM {table} " \
+                 f"WHERE layer_id = %(layer)s"
+    params = {'layer': crud_view.layer_id, 'quantiles': get_quantiles()}
+    with connection.cursor() as cursor:
+        if statistics_type == 'numeric':
+            return compute_numeric_statistics(cursor, values_sql, params)
+        return compute_date_statistics(cursor, values_sql, params)
+
+
+def refresh_property_statistics(job):
+    """ Background job computing statistics of numeric and date properties, for current crud view data version """
+    crud_view = job.crud_view
+    data_version = crud_view._meta.model.objects.filter(pk=crud_view.pk).values_list('data_version', flat=True)[0]
+    properties = [prop for prop in crud_view.properties.all() if get_statistics_type(prop.json_schema)]
+    crud_view.statistics.exclude(property__in=properties).delete()
+    job.set_progress(0, len(properties))
+    for prop in properties:
+        crud_view.statistics.update_or_create(property=prop, defaults={
+            'data_version': data_version,
+            'values': compute_property_statistics(crud_view, prop.key, prop.json_schema),
+        })
+        job.set_progress(job.done + 1)
+
+
+def request_statistics_refresh(crud_view):
+    """ Create refresh job if statistics are missing or outdated, and no refresh is waiting. Return True if outdated """
+    BackgroundJob = crud_view.jobs.model
+    properties = [prop for prop in crud_view.properties.all() if get_statistics_type(prop.json_schema)]
+    up_to_date = crud_view.statistics.filter(property__in=properties, data_version=crud_view.data_version).count()
+    if up_to_date == len(properties):
+        return False
+    if not crud_view.jobs.filter(action=BackgroundJob.REFRESH_PROPERTY_STATISTICS,
+                                 state__in=(BackgroundJob.PENDING, BackgroundJob.RUNNING)).exists():
+        BackgroundJob.objects.create(crud_view=crud_view, action=BackgroundJob.REFRESH_PROPERTY_STATISTICS)
+    return True
+
+
+def apply_statistics(value, statistics):
+    """
+    Replace "$stats.<key>.<name>" strings in map style by stored statistics,
+    as "$stats.age.max" or "$stats.age.quantiles.4". Unknown statistics are replaced by None.
+    """
+    if isinstance(value, dict):
+        return {key: apply_statistics(item, statistics) for key, item in value.items()}
+    if isinstance(value, list):
+        return [apply_statistics(item, statistics) for item in value]
+    if isinstance(value, str) and value.startswith(STATISTICS_PREFIX):
+        result = statistics
+        for part in value[len(STATISTICS_PREFIX):].split('.'):
+            try:
+                result = result[int(part)] if isinstance(result, list) else result[part]
+            except (KeyError, IndexError, ValueError, TypeError):
+                return None
+        return result
+    return value
@@ -3,30 +3,33 @@ from datetime import datetime
 from django.core.exceptions import ObjectDoesNotExist
 from django.template.defaultfilters import date
 
-from terra_geocrud.properties.files import get_info_content, get_storage_path_from_infos, get_storage_file_url
+from terra_geocrud.properties.files import get_info_content, get_storage_path_from_infos, get_storage_file_url, \
+    StorageUrlResolver
 from terra_geocrud.thumbnail_backends import ThumbnailDataFileBackend
 
 thumbnail_backend = ThumbnailDataFileBackend()
 
 
-def generate_thumbnail_from_image(value, data, data_type):
+def generate_thumbnail_from_image(value, data, data_type, url_resolver=None):
     # generate / get thumbnail for image
     if not value:
         return data, data_type
+    url_resolver = url_resolver or StorageUrlResolver()
     try:
         # try to get file info from "data:image/png;xxxxxxxxxxxxx" data
         infos, content = get_info_content(value)
         storage_file_path = get_storage_path_from_infos(infos)
-        data['url'] = get_storage_file_url(storage_file_path)
+        data['url'] = get_storage_file_url(storage_file_path, url_resolver)
 
         if infos and infos.split(';')[0].split(':')[1].split('/')[0] == 'image':
             # apply special cases for images
             data_type = 'image'
             try:
+                thumbnail = thumbnail_backend.get_thumbnail(storage_file_path, "500x500", upscale=False)
                 data.update({
-                    "thumbnail": thumbnail_backend.get_thumbnail(storage_file_path,
-                                                                 "500x500",
-                                                                 upscale=False).url
+                    # dummy thumbnails have no storage
+                    "thumbnail": url_resolver.url(thumbnail.name, thumbnail.storage)
+                    if hasattr(thumbnail, 'storage') else thumbnail.url
                 })
             except ValueError:
                 pass
@@ -35,12 +38,12 @@ def generate_thumbnail_from_image(value, data, data_type):
     return data, data_type
 
 
-def get_data_url_date(value, data_format):
+def get_data_url_date(value, data_format, url_resolver=None):
     if data_format == 'data-url':
         # apply special cases for files
         data_type = 'file'
         data = {"url": None}
-        return generate_thumbnail_from_image(value, data, data_type)
+        return generate_thumbnail_from_image(value, data, data_type, url_resolver)
     elif data_format == "date":
         data_type = 'date'
         try:
@@ -67,7 +70,20 @@ def get_display_value(value, crud_property, value_type):
     return value
 
 
-def serialize_group_properties(feature, final_properties, editables_properties):
+def prefetch_data_url_properties(feature, url_resolver):
+    """ Resolve all feature data-url property urls at once """
+    storage_file_paths = []
+    for key, schema in feature.layer.schema.get('properties', {}).items():
+        value = feature.properties.get(key)
+        if schema.get('format') == 'data-url' and value:
+            try:
+                storage_file_paths.append(get_storage_path_from_infos(get_info_content(value)[0]))
+            except IndexError:
+                pass
+    url_resolver.prefetch(storage_file_paths)
+
+
+def serialize_group_properties(feature, final_properties, editables_properties, url_resolver=None):
     properties = {}
 
     for key, value in final_properties.items():
@@ -76,7 +92,7 @@ def serialize_group_properties(feature, final_properties, editables_properties):
         # if value associated for property match, and has picto, use it in <img> tag
         value = feature.properties.get(key)
         # find if associated property has explicit values
-        value, data_type = get_data_url_date(value, data_format)
+        value, data_type = get_data_url_date(value, data_format, url_resolver)
 
         crud_property = feature.layer.crud_view.properties.get(key=key)
         data = get_display_value(value, crud_property, str) if not isinstance(value, list) else [get_display_value(val, crud_property, list) for val in value]
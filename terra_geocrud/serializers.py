@@ -5,6 +5,7 @@ from pathlib import Path
 
 from django.template.defaultfilters import date
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import models as django_models
 from django.utils.module_loading import import_string
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
@@ -18,14 +19,42 @@ from template_model.models import Template
 
 from . import models
 from .map.styles import get_default_style
-from .properties.files import store_feature_files
-from .properties.utils import serialize_group_properties
+from .properties.files import store_feature_files, StorageUrlResolver
+from .properties.utils import serialize_group_properties, prefetch_data_url_properties
+from .validators import validate_json_schema_data
 
 # use base serializer as defined in geostore settings. using django-geostore-routing change this value
 
 LayerSerializer = import_string(geostore_settings.GEOSTORE_LAYER_SERIALIZER)
 
 
+def get_url_resolver(context):
+    """ Storage url resolver shared by serializers in same context (request) """
+    return context.setdefault('url_resolver', StorageUrlResolver())
+
+
+class StorageUrlFieldMixin:
+    """ Serialize file url with context url resolver, to cache signed urls """
+    def to_representation(self, value):
+        if not value:
+            return None
+        storage = getattr(value, 'storage', None)
+        # dummy thumbnails have no storage
+        url = get_url_resolver(self.context).url(value.name, storage) if storage else value.url
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class StorageUrlFileField(StorageUrlFieldMixin, serializers.FileField):
+    pass
+
+
+class StorageUrlImageField(StorageUrlFieldMixin, serializers.ImageField):
+    pass
+
+
 class BaseUpdatableMixin(serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
@@ -199,7 +228,7 @@ class FeatureDisplayPropertyGroup(serializers.ModelSerializer):
             for prop in obj.group_properties.all()
         }
         editable = {prop.key: prop.editable for prop in obj.group_properties.all()}
-        return serialize_group_properties(feature, final_properties, editable)
+        return serialize_group_properties(feature, final_properties, editable, get_url_resolver(self.context))
 
     class Meta:
         model = models.FeaturePropertyDisplayGroup
@@ -235,6 +264,14 @@ class CrudFeatureListSerializer(BaseUpdatableMixin, FeatureSerializer):
             if hasattr(relation.destination, 'crud_view')
         }
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if hasattr(instance, 'search_rank'):
+            # annotated by full text search
+            data['search_rank'] = instance.search_rank
+            data['search_headline'] = instance.search_headline
+        return data
+
     class Meta(FeatureSerializer.Meta):
         exclude = ('source', 'target', 'layer', 'geom')
         fields = None
@@ -265,30 +302,49 @@ class DocumentFeatureSerializer(serializers.ModelSerializer):
 
 
 class FeaturePictureSerializer(BaseUpdatableMixin):
-    thumbnail = serializers.ImageField(read_only=True)
+    serializer_field_mapping = {
+        **BaseUpdatableMixin.serializer_field_mapping,
+        django_models.ImageField: StorageUrlImageField,
+    }
+    thumbnail = StorageUrlImageField(read_only=True)
     action_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
 
     def get_action_url(self, obj):
         return reverse('picture-detail', args=(obj.feature.identifier,
                                                obj.pk, ))
 
+    def get_download_url(self, obj):
+        return reverse('picture-download', args=(obj.feature.identifier,
+                                                 obj.pk, ))
+
     class Meta:
         model = models.FeaturePicture
         extra_kwargs = {
         }
-        fields = ('id', 'category', 'legend', 'image', 'thumbnail', 'action_url', 'created_at', 'updated_at')
+        fields = ('id', 'category', 'legend', 'image', 'thumbnail', 'action_url', 'download_url',
+                  'created_at', 'updated_at')
 
 
 class FeatureAttachmentSerializer(BaseUpdatableMixin):
+    serializer_field_mapping = {
+        **BaseUpdatableMixin.serializer_field_mapping,
+        django_models.FileField: StorageUrlFileField,
+    }
     action_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
 
     def get_action_url(self, obj):
         return reverse('attachment-detail', args=(obj.feature.identifier,
                                                   obj.pk, ))
 
+    def get_download_url(self, obj):
+        return reverse('attachment-download', args=(obj.feature.identifier,
+                                                    obj.pk, ))
+
     class Meta:
         model = models.FeatureAttachment
-        fields = ('id', 'category', 'legend', 'file', 'action_url', 'created_at', 'updated_at')
+        fields = ('id', 'category', 'legend', 'file', 'action_url', 'download_url', 'created_at', 'updated_at')
 
 
 class AttachmentCategorySerializer(serializers.ModelSerializer):
@@ -352,6 +408,8 @@ class CrudFeatureDetailSerializer(BaseUpdatableMixin, FeatureSerializer):
 
     def get_pictures(self, obj):
         """ Return feature linked pictures grouped by category, with urls to create / replace / delete """
+        url_resolver = get_url_resolver(self.context)
+        url_resolver.prefetch(obj.pictures.values_list('image', flat=True))
         return [{
             "category": {
                 "id": category.pk,
@@ -359,12 +417,14 @@ class CrudFeatureDetailSerializer(BaseUpdatableMixin, FeatureSerializer):
             },
             "pictogram": category.pictogram.url if category.pictogram else None,
             "pictures": FeaturePictureSerializer(obj.pictures.filter(category=category),
-                                                 many=True).data,
+                                                 many=True, context={'url_resolver': url_resolver}).data,
             "action_url": reverse('picture-list', args=(obj.identifier, ))
         } for category in models.AttachmentCategory.objects.all()]
 
     def get_attachments(self, obj):
         """ Return feature linked pictures grouped by category, with urls to create / replace / delete """
+        url_resolver = get_url_resolver(self.context)
+        url_resolver.prefetch(obj.attachments.values_list('file', flat=True))
         return [{
             "category": {
                 "id": category.pk,
@@ -372,7 +432,7 @@ class CrudFeatureDetailSerializer(BaseUpdatableMixin, FeatureSerializer):
             },
             "pictogram": category.pictogram.url if category.pictogram else None,
             "attachments": FeatureAttachmentSerializer(obj.attachments.filter(category=category),
-                                                       many=True).data,
+                                                       many=True, context={'url_resolver': url_resolver}).data,
             "action_url": reverse('attachment-list', args=(obj.identifier, ))
         } for category in models.AttachmentCategory.objects.all()]
 
@@ -400,12 +460,15 @@ class CrudFeatureDetailSerializer(BaseUpdatableMixin, FeatureSerializer):
         results = {}
         crud_view = obj.layer.crud_view
         groups = crud_view.feature_display_groups.all()
+        url_resolver = get_url_resolver(self.context)
+        prefetch_data_url_properties(obj, url_resolver)
 
         # get ordered groups filled
         for group in groups:
             serializer = FeatureDisplayPropertyGroup(group,
                                                      context={'request': self.context.get('request'),
-                                                              'feature': obj})
+                                                              'feature': obj,
+                                                              'url_resolver': url_resolver})
             results[group.slug] = serializer.data
 
         # add default other properties
@@ -417,7 +480,7 @@ class CrudFeatureDetailSerializer(BaseUpdatableMixin, FeatureSerializer):
                 for prop in remained_properties
             }
             editable = {prop.key: prop.editable for prop in remained_properties}
-            properties = serialize_group_properties(obj, final_properties, editable)
+            properties = serialize_group_properties(obj, final_properties, editable, url_resolver)
 
             results['__default__'] = {
                 "title": "",
@@ -473,8 +536,10 @@ class CrudFeatureDetailSerializer(BaseUpdatableMixin, FeatureSerializer):
                 parsed_data = data.pop(key)
                 for parsed_key, parsed_value in parsed_data.items():
                     data[parsed_key] = parsed_value
-        # keep parent schema validation
-        super().validate_properties(data)
+        # keep parent schema validation, with validator cached by schema version
+        layer = self.get_layer()
+        if layer:
+            validate_json_schema_data(data, layer.schema)
         return data
 
     def save(self, **kwargs):
@@ -506,3 +571,17 @@ class CrudFeatureExtraGeomSerializer(FeatureExtraGeomSerializer):
 
     class Meta(FeatureExtraGeomSerializer.Meta):
         fields = ('geom', )
+
+
+class BackgroundJobSerializer(serializers.ModelSerializer):
+    progress = serializers.IntegerField(read_only=True)
+    download_url = serializers.SerializerMethodField()
+
+    def get_download_url(self, obj):
+        if obj.state == obj.SUCCESS and obj.result.get('path') and not obj.expired:
+            return reverse('backgroundjob-download', args=(obj.pk, ), request=self.context.get('request'))
+
+    class Meta:
+        model = models.BackgroundJob
+        fields = ('id', 'crud_view', 'action', 'state', 'progress', 'done', 'total', 'error', 'result',
+                  'download_url', 'created_at', 'updated_at')
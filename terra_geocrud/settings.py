@@ -39,7 +39,61 @@ _DEFAULT_TERRA_GEOCRUD = {
             }
         },
     },
-    'MAX_ZOOM': 15
+    'MAX_ZOOM': 15,
+    # run background jobs (files purge, ...) with celery. If False, jobs are executed synchronously
+    'JOBS_CELERY_ASYNC': False,
+    # without celery, number of threads running background jobs in web process, after request commit.
+    # 0 to execute jobs synchronously, in request
+    'JOBS_LOCAL_WORKERS': 0,
+    # number of features processed by each background job batch
+    'JOBS_CHUNK_SIZE': 1000,
+    # number of threads used by background jobs to handle storage operations and document rendering in parallel
+    'JOBS_MAX_WORKERS': 4,
+    # pause (seconds) between background job update batches, to reduce load on feature table
+    'JOBS_THROTTLE': 0,
+    # storage urls are kept in cache (seconds). 0 to disable
+    'FILE_URL_CACHE_TIMEOUT': 300,
+    # signed urls are removed from cache this number of seconds before their expiration
+    'FILE_URL_CACHE_MARGIN': 60,
+    # delegate file downloads to front proxy: None, 'x-accel-redirect' (nginx) or 'x-sendfile' (apache, lighttpd)
+    'FILE_DOWNLOAD_OFFLOAD': None,
+    # x-accel-redirect internal location serving storage files
+    'FILE_DOWNLOAD_INTERNAL_URL': '/protected/',
+    # base64 encoded images embedded in documents are kept in cache (seconds). 0 to disable
+    'IMAGE_BASE64_CACHE_TIMEOUT': 3600,
+    # number of compiled layer schema validators kept in each process
+    'SCHEMA_VALIDATOR_CACHE_SIZE': 128,
+    # grouped form and ui schemas are kept in django cache (seconds), 0 to disable
+    'SCHEMA_CACHE_TIMEOUT': 3600,
+    # number of crud view grouped schemas kept in each process
+    'SCHEMA_CACHE_SIZE': 256,
+    # feature list facets are kept in django cache (seconds) for each filter set, 0 to disable
+    'FACETS_CACHE_TIMEOUT': 60,
+    # number of histogram buckets and quantiles in property statistics
+    'STATISTICS_BUCKETS': 10,
+    # django cache alias storing maps rendered by mbglrenderer. Configure it with eviction (max entries), default cache
+    # is used if alias is not in CACHES
+    'MAP_RENDER_CACHE': 'terra_geocrud_maps',
+    # rendered maps are kept in cache (seconds), 0 to disable
+    'MAP_RENDER_CACHE_TIMEOUT': 86400,
+    # maps of a document are rendered concurrently by this number of threads, 1 to render them sequentially
+    'MAP_RENDER_MAX_WORKERS': 4,
+    # geometries sent to map renderer are simplified with this tolerance (pixels at map zoom), 0 to send full geometries
+    'MAP_SIMPLIFY_TOLERANCE': 0.5,
+    # django cache alias storing crud view vector tiles. Configure it with eviction (max entries), default cache
+    # is used if alias is not in CACHES
+    'TILE_CACHE': 'terra_geocrud_tiles',
+    # vector tiles are kept in cache (seconds), 0 to disable
+    'TILE_CACHE_TIMEOUT': 86400,
+    # feature changes invalidate cached tiles intersecting their bbox, or all crud view tiles above this number of tiles
+    'TILE_CACHE_MAX_INVALIDATED': 2000,
+    # base layer styles are kept in cache (seconds), then revalidated with ETag. 0 to disable
+    'BASE_STYLE_CACHE_TIMEOUT': 3600,
+    # timeout (seconds) and connection pool size of http requests to external services
+    'HTTP_TIMEOUT': 10,
+    'HTTP_POOL_SIZE': 10,
+    # files generated by document jobs are kept and reused during this delay (seconds), then purged
+    'DOCUMENTS_EXPIRATION': 86400,
 }
 _DEFAULT_TERRA_GEOCRUD.update(getattr(settings, 'TERRA_GEOCRUD', {}))
 TERRA_GEOCRUD = deepcopy(_DEFAULT_TERRA_GEOCRUD)
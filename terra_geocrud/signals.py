@@ -1,14 +1,27 @@
-from django.db.models.signals import post_delete, post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.dispatch import receiver
 from django.db.models import signals
 
 from geostore import settings as app_settings
 from geostore.helpers import execute_async_func
-from geostore.models import Feature, LayerRelation
+from geostore.models import Feature, FeatureExtraGeom, FeatureRelation, Layer, LayerExtraGeom, LayerRelation
 from geostore.signals import save_feature, save_layer_relation
+from mapbox_baselayer.models import BaseLayerTile, MapBaseLayer
+from terra_geocrud.map.base_layers import invalidate_base_styles
+from terra_geocrud.map.tiles import (get_cached_tiles_crud_view_ids, get_geometry_extent, get_queryset_extent,
+                                     invalidate_feature_relation_tiles, invalidate_layer_tiles, reset_tiles_crud_views,
+                                     tile_cache_enabled)
+from terra_geocrud.models import BackgroundJob, CrudView, CrudViewProperty, FeaturePropertyDisplayGroup
 from terra_geocrud.properties.files import delete_feature_files
+from terra_geocrud.properties.indexes import (drop_property_indexes, get_property_index_state,
+                                              request_property_indexes_sync)
+from terra_geocrud.properties.schema import bump_data_version_on_commit, bump_schema_version_on_commit
+from terra_geocrud.properties.search import (delete_features_search, request_features_search_rebuild,
+                                             update_features_search)
 from terra_geocrud.tasks import (feature_update_relations_and_properties, layer_relations_set_destinations,
-                                 feature_update_relations_origins, feature_update_destination_properties)
+                                 feature_update_relations_origins, feature_update_destination_properties,
+                                 start_background_job)
 
 
 signals.post_save.disconnect(save_feature, sender=Feature)
@@ -58,3 +71,163 @@ def delete_feature(sender, instance, **kwargs):
         for relation_destination in instance.layer.relations_as_destination.all():
             features.extend(relation_destination.origin.features.values_list('id', flat=True))
         execute_async_func(feature_update_relations_origins, (features, kwargs))
+
+
+@receiver(post_save, sender=BackgroundJob, dispatch_uid='start_background_job')
+def start_created_background_job(sender, instance, created, **kwargs):
+    if created:
+        start_background_job(instance)
+
+
+@receiver(post_save, sender=Layer, dispatch_uid='layer_schema_version')
+def layer_schema_version(sender, instance, **kwargs):
+    if hasattr(instance, 'crud_view'):
+        bump_schema_version_on_commit(instance.crud_view)
+
+
+@receiver(post_save, sender=CrudView, dispatch_uid='crud_view_schema_version')
+def crud_view_schema_version(sender, instance, created, **kwargs):
+    if not created:
+        bump_schema_version_on_commit(instance)
+
+
+@receiver(post_save, sender=CrudViewProperty, dispatch_uid='save_property_schema_version')
+@receiver(post_delete, sender=CrudViewProperty, dispatch_uid='delete_property_schema_version')
+def property_schema_version(sender, instance, **kwargs):
+    bump_schema_version_on_commit(instance.view)
+
+
+@receiver(post_save, sender=FeaturePropertyDisplayGroup, dispatch_uid='save_group_schema_version')
+@receiver(post_delete, sender=FeaturePropertyDisplayGroup, dispatch_uid='delete_group_schema_version')
+def group_schema_version(sender, instance, **kwargs):
+    bump_schema_version_on_commit(instance.crud_view)
+
+
+@receiver(post_init, sender=CrudViewProperty, dispatch_uid='property_loaded_index_state')
+def property_loaded_index_state(sender, instance, **kwargs):
+    # index state of loaded property, to sync indexes when it changes. Deferred fields are not loaded
+    loaded = instance.pk and all(field in instance.__dict__ for field in ('key', 'filterable', 'json_schema'))
+    instance._index_previous_state = get_property_index_state(instance) if loaded else None
+
+
+@receiver(post_save, sender=CrudViewProperty, dispatch_uid='save_property_indexes')
+def property_indexes(sender, instance, created, **kwargs):
+    previous_state = None if created else getattr(instance, '_index_previous_state', None)
+    instance._index_previous_state = get_property_index_state(instance)
+    if previous_state is None:
+        # created, or loaded with deferred fields
+        changed = instance.filterable or not created
+    else:
+        changed = instance._index_previous_state != previous_state and (instance.filterable or previous_state[1])
+    if changed:
+        request_property_indexes_sync(instance.view)
+
+
+@receiver(post_delete, sender=CrudView, dispatch_uid='delete_crud_view_indexes')
+def delete_crud_view_indexes(sender, instance, **kwargs):
+    drop_property_indexes(instance.layer_id)
+
+
+@receiver(post_save, sender=Feature, dispatch_uid='save_feature_search')
+def save_feature_search(sender, instance, **kwargs):
+    crud_view = getattr(instance.layer, 'crud_view', None)
+    if crud_view:
+        update_features_search(crud_view, [instance.pk])
+
+
+@receiver(post_save, sender=Feature, dispatch_uid='save_feature_data_version')
+@receiver(post_delete, sender=Feature, dispatch_uid='delete_feature_data_version')
+def feature_data_version(sender, instance, **kwargs):
+    crud_view = getattr(instance.layer, 'crud_view', None)
+    if crud_view:
+        bump_data_version_on_commit(crud_view)
+
+
+@receiver(post_save, sender=CrudView, dispatch_uid='save_crud_view_search')
+@receiver(post_save, sender=CrudViewProperty, dispatch_uid='save_property_search')
+def search_configuration(sender, instance, **kwargs):
+    request_features_search_rebuild(instance if sender is CrudView else instance.view)
+
+
+@receiver(post_delete, sender=CrudView, dispatch_uid='delete_crud_view_search')
+def delete_crud_view_search(sender, instance, **kwargs):
+    delete_features_search(instance.layer_id)
+
+
+@receiver(post_save, sender=MapBaseLayer, dispatch_uid='save_base_layer_styles')
+@receiver(post_delete, sender=MapBaseLayer, dispatch_uid='delete_base_layer_styles')
+@receiver(post_save, sender=BaseLayerTile, dispatch_uid='save_base_layer_tile_styles')
+@receiver(post_delete, sender=BaseLayerTile, dispatch_uid='delete_base_layer_tile_styles')
+def base_layer_styles(sender, **kwargs):
+    invalidate_base_styles()
+
+
+def get_tiles_layer_id(instance):
+    return instance.layer_id if isinstance(instance, Feature) else instance.layer_extra_geom.layer_id
+
+
+@receiver(post_init, sender=Feature, dispatch_uid='feature_tiles_loaded_geometry')
+@receiver(post_init, sender=FeatureExtraGeom, dispatch_uid='extra_geometry_tiles_loaded_geometry')
+def tiles_loaded_geometry(sender, instance, **kwargs):
+    # loaded geometry, to invalidate its tiles when it changes. Deferred geometry is not loaded
+    instance._tiles_previous_geom = instance.__dict__.get('geom')
+
+
+@receiver(pre_save, sender=Feature, dispatch_uid='feature_tiles_previous_extent')
+@receiver(pre_save, sender=FeatureExtraGeom, dispatch_uid='extra_geometry_tiles_previous_extent')
+def tiles_previous_extent(sender, instance, **kwargs):
+    # tiles intersecting previous geometry are invalidated after save
+    if instance.pk and tile_cache_enabled():
+        previous_geom = getattr(instance, '_tiles_previous_geom', None)
+        if previous_geom is not None:
+            instance._tiles_previous_extent = get_geometry_extent(previous_geom)
+        elif get_cached_tiles_crud_view_ids(get_tiles_layer_id(instance)):
+            instance._tiles_previous_extent = get_queryset_extent(sender.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Feature, dispatch_uid='save_feature_tiles')
+@receiver(post_delete, sender=Feature, dispatch_uid='delete_feature_tiles')
+@receiver(post_save, sender=FeatureExtraGeom, dispatch_uid='save_extra_geometry_tiles')
+@receiver(post_delete, sender=FeatureExtraGeom, dispatch_uid='delete_extra_geometry_tiles')
+def feature_tiles(sender, instance, **kwargs):
+    if tile_cache_enabled():
+        layer_id = get_tiles_layer_id(instance)
+        geom = instance.__dict__.get('geom')
+        extents = [get_geometry_extent(geom), getattr(instance, '_tiles_previous_extent', None)]
+        instance._tiles_previous_geom = geom
+        # tiles rendered before commit would be cached with previous data
+        transaction.on_commit(lambda: invalidate_layer_tiles(layer_id, extents))
+
+
+@receiver(post_save, sender=FeatureRelation, dispatch_uid='save_feature_relation_tiles')
+@receiver(post_delete, sender=FeatureRelation, dispatch_uid='delete_feature_relation_tiles')
+def feature_relation_tiles(sender, instance, **kwargs):
+    if tile_cache_enabled():
+        transaction.on_commit(lambda: invalidate_feature_relation_tiles(instance.relation_id, instance.destination_id))
+
+
+@receiver(post_save, sender=LayerExtraGeom, dispatch_uid='save_extra_layer_tiles')
+@receiver(post_delete, sender=LayerExtraGeom, dispatch_uid='delete_extra_layer_tiles')
+def extra_layer_tiles(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_layer_tiles(instance.layer_id))
+
+
+@receiver(post_save, sender=LayerRelation, dispatch_uid='save_layer_relation_tiles')
+@receiver(post_delete, sender=LayerRelation, dispatch_uid='delete_layer_relation_tiles')
+def layer_relation_tiles(sender, instance, **kwargs):
+    reset_tiles_crud_views(instance.destination_id)
+    transaction.on_commit(lambda: invalidate_layer_tiles(instance.origin_id))
+
+
+@receiver(post_save, sender=CrudView, dispatch_uid='save_crud_view_tiles')
+@receiver(post_delete, sender=CrudView, dispatch_uid='delete_crud_view_tiles')
+def crud_view_tiles(sender, instance, **kwargs):
+    reset_tiles_crud_views(instance.layer_id)
+
+
+@receiver(post_save, sender=CrudViewProperty, dispatch_uid='save_property_tiles')
+@receiver(post_delete, sender=CrudViewProperty, dispatch_uid='delete_property_tiles')
+def property_tiles(sender, instance, **kwargs):
+    # tile properties of crud views with relation to this layer
+    layer_id = instance.view.layer_id
+    transaction.on_commit(lambda: invalidate_layer_tiles(layer_id))
@@ -1,11 +1,23 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from celery import shared_task
 
 from django.core.exceptions import ValidationError
+from django.db import connection, transaction
 from django.utils.module_loading import import_string
 
+from geostore import settings as geostore_settings
+from geostore.helpers import execute_async_func
 from geostore.models import Feature, LayerRelation
 
+from . import settings as app_settings
+from .map.tiles import invalidate_layer_tiles, invalidate_relation_tiles
+from .models import BackgroundJob
+from .properties.schema import bump_data_version, bump_data_version_on_commit, clean_properties_not_in_schema_or_null
+from .properties.search import update_features_search
+from .validators import validate_json_schema_data
 
 logger = logging.getLogger(__name__)
 
@@ -36,9 +48,12 @@ def compute_properties(instance, prop):
 
     instance.properties[prop.key] = value
     try:
-        instance.clean()
+        # only properties changed, geometry type check from instance.clean() is not required
+        validate_json_schema_data(instance.properties, instance.layer.schema)
         # Avoiding signal post_save again
         Feature.objects.bulk_update([instance], ['properties'])
+        update_features_search(instance.layer.crud_view, [instance.pk])
+        bump_data_version_on_commit(instance.layer.crud_view)
     except ValidationError:
         logger.warning("The function to update property didn't give the good format, "
                        "fix your function or the schema")
@@ -79,6 +94,7 @@ def feature_update_relations_and_properties(feature_id, kwargs):
     except Feature.DoesNotExist:
         return False
     feature.sync_relations(None)
+    invalidate_relation_tiles(feature)
 
     sync_properties_relations_destination(feature, update_relations=True)
 
@@ -110,3 +126,81 @@ def layer_relations_set_destinations(relation_id):
         feature_update_relations_and_properties.delay(feature_id, kwargs)
 
     return True
+
+
+_local_executor = None
+_local_executor_lock = threading.Lock()
+
+
+def get_local_executor():
+    """ Thread pool running background jobs in web process, shared in process """
+    global _local_executor
+    if _local_executor is None:
+        with _local_executor_lock:
+            if _local_executor is None:
+                _local_executor = ThreadPoolExecutor(max_workers=app_settings.TERRA_GEOCRUD['JOBS_LOCAL_WORKERS'],
+                                                     thread_name_prefix='terra_geocrud_jobs')
+    return _local_executor
+
+
+def run_local_background_job(job_id):
+    """ Execute background job in local executor thread, then close thread database connection """
+    try:
+        run_background_job(job_id)
+    except Exception:
+        logger.exception("Background job %s failed", job_id)
+    finally:
+        connection.close()
+
+
+def start_background_job(job):
+    """
+    Run job in celery if JOBS_CELERY_ASYNC, else in local threads if JOBS_LOCAL_WORKERS, else synchronously.
+    Asynchronous jobs are started once job creation is committed.
+    """
+    if app_settings.TERRA_GEOCRUD['JOBS_CELERY_ASYNC']:
+        transaction.on_commit(lambda: execute_async_func(run_background_job, (job.pk, )))
+    elif app_settings.TERRA_GEOCRUD['JOBS_LOCAL_WORKERS']:
+        transaction.on_commit(lambda: get_local_executor().submit(run_local_background_job, job.pk))
+    else:
+        job.run()
+
+
+@shared_task
+def run_background_job(job_id):
+    """ Execute crud view background job """
+    try:
+        job = BackgroundJob.objects.get(pk=job_id)
+    except BackgroundJob.DoesNotExist:
+        return False
+
+    job.run()
+    return True
+
+
+def sync_features_relations_and_properties(layer, features_id):
+    """ Batched equivalent of feature_update_relations_and_properties for several features of a layer """
+    chunk_size = app_settings.TERRA_GEOCRUD['JOBS_CHUNK_SIZE']
+    features = Feature.objects.filter(pk__in=features_id).select_related('layer__crud_view')
+    for feature in features.iterator(chunk_size=chunk_size):
+        feature.sync_relations(None)
+        change_props(feature)
+
+    # relation destinations are synced once for all features
+    for relation_destination in layer.relations_as_destination.all():
+        for feature in relation_destination.origin.features.iterator(chunk_size=chunk_size):
+            feature.sync_relations(relation_destination.pk)
+            change_props(feature)
+    invalidate_layer_tiles(layer.pk)
+
+
+def clean_feature_properties(job):
+    """ Background job : clean feature properties not in schema or null, then sync relations once """
+    crud_view = job.crud_view
+    updated_ids = clean_properties_not_in_schema_or_null(crud_view, progress=job.set_progress)
+    job.result['updated'] = len(updated_ids)
+    if updated_ids:
+        bump_data_version(crud_view)
+        invalidate_layer_tiles(crud_view.layer_id)
+    if updated_ids and geostore_settings.GEOSTORE_RELATION_CELERY_ASYNC:
+        sync_features_relations_and_properties(crud_view.layer, updated_ids)
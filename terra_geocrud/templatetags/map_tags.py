@@ -1,27 +1,53 @@
 import base64
+import hashlib
 import logging
-import math
-import secrets
-from copy import deepcopy
-from json import dumps, loads
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
 
-import requests
 from django import template
-from django.contrib.gis.geos import GeometryCollection, Point
+from django.core.cache import cache
+from django.template.loader_tags import BlockNode
+from django.utils.safestring import mark_safe
 from geostore.models import LayerExtraGeom
-from geostore.settings import INTERNAL_GEOMETRY_SRID
-from mapbox_baselayer.models import MapBaseLayer
 from template_engines.templatetags.odt_tags import ImageLoaderURLNode as ODTImageUrlNode
 from template_engines.templatetags.pdf_tags import ImageLoaderURLNode as PDFImageUrlNode
-from template_engines.templatetags.utils import parse_tag
+from template_engines.templatetags.utils import parse_tag, resize
+from template_engines.utils import get_content_url, get_extension_picture
+from template_engines.utils.odt import ODT_IMAGE
 
 from terra_geocrud import settings as app_settings
-from terra_geocrud.map.styles import DEFAULT_MBGL_RENDERER_STYLE, get_default_style
-from terra_geocrud.properties.files import get_info_content, get_storage
+from terra_geocrud.cache import get_cache
+from terra_geocrud.map.base_layers import get_base_layer_style
+from terra_geocrud.map.geometries import count_vertices, get_render_extent, get_render_geojson, get_zoom
+from terra_geocrud.map.styles import get_default_style
+from terra_geocrud.properties.files import get_info_content, get_storage, get_storage_path_from_infos
+from terra_geocrud.properties.utils import thumbnail_backend
 
 logger = logging.getLogger(__name__)
 register = template.Library()
 
+# style layer and source ids, constant to get the same style (and cached render) for the same map
+FEATURE_LAYER_ID = 'terra_geocrud_feature'
+EXTRA_LAYER_ID = 'terra_geocrud_extra_{}'
+# render context key of maps rendered concurrently for current template
+PREFETCHED_MAPS_KEY = 'terra_geocrud_prefetched_maps'
+# render context key of map tags data computed while prefetching, by node
+PREFETCHED_DATA_KEY = 'terra_geocrud_prefetched_map_data'
+
+
+def get_render_hash(url, data):
+    return hashlib.sha256(dumps([url, data], sort_keys=True).encode()).hexdigest()
+
+
+def get_unconditional_map_nodes(nodelist):
+    """ Map tag nodes of nodelist, and of its blocks, rendered once with template context """
+    for node in nodelist:
+        if isinstance(node, MapImageLoaderBase):
+            yield node
+        elif isinstance(node, BlockNode):
+            yield from get_unconditional_map_nodes(node.nodelist)
+
 
 class MapImageLoaderBase:
     def get_data(self, context):
@@ -35,86 +61,105 @@ class MapImageLoaderBase:
         base_layer = None if not final_data['base_layer'] else final_data['base_layer'].resolve(context)
 
         feature = context['object']
-        style = self.get_style(feature, feature_included, extras_included, base_layer)
-        token = app_settings.TERRA_GEOCRUD.get('map', {}).get('mapbox_access_token')
         final_style = {
-            'style': dumps(style),
             'width': width,
             'height': height,
-            'token': token
+            'token': app_settings.TERRA_GEOCRUD.get('map', {}).get('mapbox_access_token'),
         }
-        geoms = []
-        if feature_included:
-            geoms.append(feature.geom)
-
-        for feat in feature.extra_geometries.filter(layer_extra_geom__slug__in=extras_included):
-            geoms.append(feat.geom)
-        collections = GeometryCollection(*geoms, srid=INTERNAL_GEOMETRY_SRID)
-        if not collections:
-            return final_style
-        elif len(collections) == 1 and isinstance(collections[0], Point):
-            final_style['zoom'] = app_settings.TERRA_GEOCRUD.get('MAX_ZOOM', 22)
-            final_style['center'] = list(feature.geom.centroid)
-        else:
-            final_style['center'] = list(collections.centroid)
-            zoom = self.get_zoom_bounds(width, height, collections)
-            final_style['zoom'] = zoom
+        extent = get_render_extent(feature, feature_included, extras_included)
+        if extent:
+            xmin, ymin, xmax, ymax = extent['extent']
+            final_style['center'] = [(xmin + xmax) / 2, (ymin + ymax) / 2]
+            if extent['count'] == 1 and extent['points']:
+                final_style['zoom'] = app_settings.TERRA_GEOCRUD.get('MAX_ZOOM', 22)
+            else:
+                final_style['zoom'] = get_zoom(width, height, extent['mercator'])
 
+        # geometries are simplified for map zoom
+        style = self.get_style(feature, feature_included, extras_included, base_layer, final_style.get('zoom'))
+        final_style['style'] = dumps(style)
+        logger.debug("Map render payload of feature %s: %s bytes, %s vertices",
+                     feature.pk, len(final_style['style']), count_vertices(style))
         return final_style
 
-    def get_zoom_bounds(self, width, height, collection):
-        collection = collection.transform('3857', clone=True)
-        extent = collection.extent
-        length_x = (extent[2] - extent[0])
-        length_y = (extent[3] - extent[1])
-        length_per_tile_width = 512 * length_x / width
-        length_per_tile_height = 512 * length_y / height
-        RADIUS = 6378137
-        CIRCUM = 2 * math.pi * RADIUS
-        # Max zoom in most of the maps is 22.
-        zoom_width = 22
-        zoom_height = 22
-        if length_per_tile_width:
-            zoom_width = math.log(CIRCUM / length_per_tile_width, 2)
-        if length_per_tile_height:
-            zoom_height = math.log(CIRCUM / length_per_tile_height, 2)
-        return math.floor(min(zoom_width, zoom_height))
+    def get_rendered_map(self, url, type_request, data, prefetched=None):
+        """
+        Map image rendered by mbglrenderer and its name, from render cache if same map was already rendered.
+        Name is a hash of final style, center, zoom, width and height.
+        """
+        render_hash = get_render_hash(url, data)
+        if prefetched and prefetched.get(render_hash):
+            return prefetched[render_hash], render_hash
+        timeout = app_settings.TERRA_GEOCRUD['MAP_RENDER_CACHE_TIMEOUT']
+        render_cache = get_cache('MAP_RENDER_CACHE')
+        cache_key = f'terra_geocrud_map_render_{render_hash}'
+        content = render_cache.get(cache_key) if timeout else None
+        if content is None:
+            response = get_content_url(url, type_request or "post", data)
+            if not response:
+                return None, render_hash
+            content = response.content
+            if timeout:
+                render_cache.set(cache_key, content, timeout)
+        return content, render_hash
+
+    def prefetch_maps(self, context):
+        """
+        At first map tag of template, render maps of all map tags concurrently, as each render waits for mbglrenderer.
+        Only tags always rendered with template context are prefetched : tags in conditions, loops or other
+        blocks changing context are rendered by their own tag.
+        Return maps by render hash.
+        """
+        prefetched = context.render_context.get(PREFETCHED_MAPS_KEY)
+        if prefetched is not None:
+            return prefetched
+        prefetched = context.render_context[PREFETCHED_MAPS_KEY] = {}
+        prefetched_data = context.render_context[PREFETCHED_DATA_KEY] = {}
+        workers = app_settings.TERRA_GEOCRUD['MAP_RENDER_MAX_WORKERS']
+        template = getattr(context, 'template', None)
+        if workers < 2 or template is None:
+            return prefetched
+
+        render_requests = {}
+        for node in get_unconditional_map_nodes(template.nodelist):
+            try:
+                data = node.get_data(context)
+            except Exception:
+                # error is raised when tag is rendered
+                continue
+            # data is reused when tag is rendered
+            prefetched_data[node] = data
+            render_requests[get_render_hash(node.url, data)] = (node.url, node.request, data)
+        if len(render_requests) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(render_requests))) as executor:
+                results = executor.map(lambda render_request: self.get_rendered_map(*render_request),
+                                       render_requests.values())
+                for content, render_hash in results:
+                    prefetched[render_hash] = content
+        return prefetched
 
     def get_value_context(self, context):
         final_url = self.url
         final_request = self.request
-        final_data = self.get_data(context)
+        final_data = context.render_context.get(PREFETCHED_DATA_KEY, {}).pop(self, None)
+        if final_data is None:
+            final_data = self.get_data(context)
         return final_url, final_request, None, None, final_data
 
     def get_style_base_layer(self, base_layer):
-        try:
-            map_base_layer = MapBaseLayer.objects.get(slug=base_layer)
-        except MapBaseLayer.DoesNotExist:
-            logger.warning(f"MapBaseLayer with slug '{base_layer}' was not found. Try to get another map base layer.")
-            map_base_layer = MapBaseLayer.objects.first()
-
-        if map_base_layer:
-            if map_base_layer.base_layer_type == 'mapbox':
-                response = requests.get(map_base_layer.map_box_url.replace("mapbox://styles",
-                                                                           "https://api.mapbox.com/styles/v1"),
-                                        params={"access_token": app_settings.TERRA_GEOCRUD.get('map', {}).get(
-                                            'mapbox_access_token')})
-                if response.status_code == 200:
-                    return response.json()
-            else:
-                return map_base_layer.tilejson
-        return deepcopy(DEFAULT_MBGL_RENDERER_STYLE)
+        return get_base_layer_style(base_layer)
 
-    def get_style(self, feature, feature_included, extras_included, base_layer):
+    def get_style(self, feature, feature_included, extras_included, base_layer, zoom=None):
         style_map = self.get_style_base_layer(base_layer)
         view = feature.layer.crud_view
         primary_layer = {}
         if feature_included:
-            geojson_id = secrets.token_hex(15)
+            geojson_id = FEATURE_LAYER_ID
             primary_layer = view.map_style_with_default
             primary_layer['id'] = geojson_id
             primary_layer['source'] = geojson_id
-            style_map['sources'].update({geojson_id: {'type': 'geojson', 'data': loads(feature.geom.geojson)}})
+            style_map['sources'].update({geojson_id: {'type': 'geojson',
+                                                      'data': get_render_geojson(feature.geom, zoom)}})
 
         for layer_extra_geom in feature.layer.extra_geometries.filter(slug__in=extras_included):
             extra_feature = feature.extra_geometries.filter(layer_extra_geom=layer_extra_geom).first()
@@ -127,11 +172,11 @@ class MapImageLoaderBase:
             except LayerExtraGeom.style.RelatedObjectDoesNotExist:
                 extra_layer = get_default_style(layer_extra_geom)
 
-            extra_id = secrets.token_hex(15)
+            extra_id = EXTRA_LAYER_ID.format(layer_extra_geom.slug)
             extra_layer['id'] = extra_id
             extra_layer['source'] = extra_id
             style_map['sources'].update({extra_id: {'type': 'geojson',
-                                                    'data': loads(extra_feature.geom.geojson)}})
+                                                    'data': get_render_geojson(extra_feature.geom, zoom)}})
             style_map['layers'].append(extra_layer)
 
         if primary_layer:
@@ -140,6 +185,20 @@ class MapImageLoaderBase:
 
 
 class MapImageLoaderURLODTNode(MapImageLoaderBase, ODTImageUrlNode):
+    def render(self, context):
+        prefetched = self.prefetch_maps(context)
+        url, type_request, max_width, max_height, anchor, data = self.get_value_context(context)
+        picture, name = self.get_rendered_map(url, type_request, data, prefetched)
+        if not picture:
+            return ""
+        width, height = resize(picture, max_width, max_height, odt=True)
+        extension = get_extension_picture(picture)
+        full_name = f'{name[:30]}.{extension}'
+        context.setdefault('images', {})
+        context['images'].update({full_name: picture})
+        return mark_safe(ODT_IMAGE.format(full_name, width, height,
+                                          anchor or "paragraph", f"image/{extension.lower()}"))
+
     def get_value_context(self, context):
         """ Consider anchor as specific context for odt """
         final_url, final_request, x, y, final_data = super().get_value_context(context)
@@ -148,7 +207,14 @@ class MapImageLoaderURLODTNode(MapImageLoaderBase, ODTImageUrlNode):
 
 
 class MapImageLoaderURLPDFNode(MapImageLoaderBase, PDFImageUrlNode):
-    pass
+    def render(self, context):
+        prefetched = self.prefetch_maps(context)
+        url, type_request, max_width, max_height, data = self.get_value_context(context)
+        picture, _name = self.get_rendered_map(url, type_request, data, prefetched)
+        if not picture:
+            return ""
+        extension = get_extension_picture(picture)
+        return mark_safe(f"data:image/{extension};base64,{base64.b64encode(picture).decode('utf-8')}")
 
 
 def get_map_data(kwargs):
@@ -204,19 +270,57 @@ def image_base64_from_url(parser, token):
     return MapImageLoaderURLPDFNode(f"{app_settings.TERRA_GEOCRUD['MBGLRENDERER_URL']}/render", **kwargs)
 
 
+# multiple of 57 bytes, so each encoded chunk ends a complete 76 chars line
+BASE64_CHUNK_SIZE = 57 * 1024
+
+
+def iter_storage_file(storage, name, chunk_size=BASE64_CHUNK_SIZE):
+    with storage.open(name, 'rb') as data_file:
+        while True:
+            chunk = data_file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def get_stored_image_rendition(data_type, data_path, max_size=None):
+    """ Get (data_type, storage, name) of stored image, downscaled to fit in max_size x max_size if required """
+    storage = get_storage()
+    if max_size and data_type.startswith('data:image'):
+        thumbnail = thumbnail_backend.get_thumbnail(data_path, f"{max_size}x{max_size}", upscale=False)
+        # dummy thumbnails have no storage, original file is used
+        if hasattr(thumbnail, 'storage') and thumbnail.exists():
+            mimetype = mimetypes.guess_type(thumbnail.name)[0]
+            data_type = f"data:{mimetype}" if mimetype else data_type
+            return data_type, thumbnail.storage, thumbnail.name
+    return data_type, storage, data_path
+
+
 @register.filter
-def stored_image_base64(value):
-    """ As data-url file are stored in custom storage and not in b64, we need to prepare data to use """
+def stored_image_base64(value, max_size=None):
+    """
+    As data-url file are stored in custom storage and not in b64, we need to prepare data to use.
+    Optional max_size (px) downscale image to fit in a max_size x max_size box : {{ value|stored_image_base64:800 }}
+    """
     infos, content = get_info_content(value)
-    infos = infos.split(';')
-    data_type = infos[0]
-    data_path = infos[1].strip('name=')
-    storage = get_storage()
-    with storage.open(data_path, 'rb') as data_file:
-        file_bytes = data_file.read()
-        file_b64 = base64.encodebytes(file_bytes)
-        result = f"{data_type};base64," + file_b64.decode()
-        return result
+    data_type = infos.split(';')[0]
+    data_path = get_storage_path_from_infos(infos)
+
+    timeout = app_settings.TERRA_GEOCRUD['IMAGE_BASE64_CACHE_TIMEOUT']
+    cache_key = None
+    if timeout:
+        # stored path changes with file content (content hash folder), rendition and storage are read on cache miss
+        cache_key = f"terra_geocrud_b64_{hashlib.md5(f'{data_type}-{data_path}-{max_size}'.encode()).hexdigest()}"
+        result = cache.get(cache_key)
+        if result is not None:
+            return result
+
+    data_type, storage, name = get_stored_image_rendition(data_type, data_path, max_size)
+    file_b64 = "".join(base64.encodebytes(chunk).decode() for chunk in iter_storage_file(storage, name))
+    result = f"{data_type};base64," + file_b64
+    if cache_key:
+        cache.set(cache_key, result, timeout)
+    return result
 
 
 @register.filter
@@ -54,6 +54,7 @@ class CrudViewAdminTestCase(TestCase):
         response = self.client.get(f"/admin/terra_geocrud/crudview/{self.view_1.pk}/actions/clean_feature_properties/",
                                    follow=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.view_1.jobs.filter(action=models.BackgroundJob.CLEAN_FEATURE_PROPERTIES).exists())
 
     def test_clean_sync_tile_content(self):
         response = self.client.get(f"/admin/terra_geocrud/crudview/{self.view_1.pk}/actions/sync_tile_content/",
@@ -1,9 +1,11 @@
 from django.conf import settings
+from django.core.cache import caches
 from django.test import TestCase, override_settings
 
 
 import terra_geocrud
 from terra_geocrud.apps import TerraCrudConfig
+from terra_geocrud.cache import get_cache
 
 
 class AppSettingsTestCase(TestCase):
@@ -16,3 +18,15 @@ class AppSettingsTestCase(TestCase):
                 appconfig.ready()
                 self.assertDictEqual(settings.TERRA_APPLIANCE_SETTINGS,
                                      {'modules': {'CRUD': {'settings': '/api/crud/settings/'}}})
+
+
+class GetCacheTestCase(TestCase):
+    def test_default_cache_without_alias(self):
+        self.assertIs(get_cache('TILE_CACHE'), caches['default'])
+
+    def test_dedicated_cache(self):
+        with override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'terra_geocrud_tiles': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        }):
+            self.assertIs(get_cache('TILE_CACHE'), caches['terra_geocrud_tiles'])
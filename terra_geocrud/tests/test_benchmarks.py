@@ -0,0 +1,180 @@
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import zipfile
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.contrib.gis.geos import Polygon
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import tag, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from geostore import GeometryTypes
+from geostore.models import Feature
+from rest_framework.test import APITestCase
+from template_model.models import Template
+
+from test_terra_geocrud.mbglrenderer import application as renderer, get_server
+from . import factories
+from .settings import FEATURE_PROPERTIES, TEMPLATES_PATH
+from .. import settings as app_settings
+from ..documents import generate_documents
+from ..models import BackgroundJob
+
+ODT_TEMPLATE = os.path.join(TEMPLATES_PATH, 'template.odt')
+# polygon vertices
+FEATURE_SIZES = (10, 1000, 50000)
+MAP_TAGS = (1, 4)
+# documents generated in batch, with polygons of BATCH_VERTICES vertices
+BATCH_FEATURES = 40
+BATCH_VERTICES = 1000
+BATCH_WORKERS = (1, 4)
+
+
+def get_polygon(vertices):
+    coordinates = [(-0.5 + 0.1 * math.cos(2 * math.pi * i / vertices), 44.5 + 0.1 * math.sin(2 * math.pi * i / vertices))
+                   for i in range(vertices)]
+    return Polygon(coordinates + coordinates[:1], srid=4326)
+
+
+def get_odt_template(map_tags):
+    """ Test odt template, with map tags instead of feature identifier """
+    tags = ''.join(f'{{% map_image_url_loader width={400 + i} height=300 %}}' for i in range(map_tags))
+    output = BytesIO()
+    with zipfile.ZipFile(ODT_TEMPLATE) as source, zipfile.ZipFile(output, 'w') as odt:
+        for item in source.infolist():
+            content = source.read(item.filename)
+            if item.filename == 'content.xml':
+                content = content.replace(b'{{ object.identifier }}', tags.encode())
+            odt.writestr(item, content)
+    return ContentFile(output.getvalue(), name=f'benchmark_{map_tags}.odt')
+
+
+def get_pdf_template(map_tags):
+    tags = ''.join(f'<img src="{{% image_base64_from_url width={400 + i} height=300 %}}"/>' for i in range(map_tags))
+    return ContentFile(f'<html><body><h1>{{{{ object.identifier }}}}</h1>{tags}</body></html>'.encode(),
+                       name=f'benchmark_{map_tags}.pdf.html')
+
+
+class RendererServerMixin:
+    """ Local mbglrenderer stand-in, served for test class """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = get_server()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_patch = patch.dict(app_settings.TERRA_GEOCRUD, {
+            'MBGLRENDERER_URL': f'http://127.0.0.1:{cls.server.server_port}',
+            # each document is rendered
+            'MAP_RENDER_CACHE_TIMEOUT': 0,
+        })
+        cls.settings_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_patch.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+
+@tag('benchmark')
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+class DocumentGenerationBenchmark(RendererServerMixin, APITestCase):
+    """
+    generate_template latency, queries, mbglrenderer payload and memory peak, with local mbglrenderer stand-in.
+    Excluded from default test run : ./manage.py test --tag=benchmark
+    """
+    def setUp(self):
+        self.crud_view = factories.CrudViewFactory(layer__geom_type=GeometryTypes.Polygon)
+        self.features = {
+            size: Feature.objects.create(layer=self.crud_view.layer, geom=get_polygon(size),
+                                         properties=FEATURE_PROPERTIES)
+            for size in FEATURE_SIZES
+        }
+        self.templates = {}
+        for map_tags in MAP_TAGS:
+            for template_format, get_template_file in (('odt', get_odt_template), ('pdf', get_pdf_template)):
+                template = Template.objects.create(name=f'{template_format} {map_tags}',
+                                                   template_file=get_template_file(map_tags))
+                self.crud_view.templates.add(template)
+                self.templates[template_format, map_tags] = template
+
+    def measure(self, feature, template):
+        url = reverse('feature-generate-template', args=(self.crud_view.layer_id, feature.identifier, template.pk))
+        renderer.reset()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = self.client.get(url)
+            content = response.content
+            duration = time.perf_counter() - start
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertEqual(response.status_code, 200, content)
+        return {
+            'duration_ms': duration * 1000,
+            'queries': len(queries),
+            'renders': renderer.stats['requests'],
+            'payload_kb': renderer.stats['bytes'] / 1024,
+            'memory_peak_kb': peak / 1024,
+            'size_kb': len(content) / 1024,
+        }
+
+    def test_generate_template(self):
+        results = []
+        for (template_format, map_tags), template in self.templates.items():
+            for size, feature in self.features.items():
+                result = self.measure(feature, template)
+                self.assertEqual(result['renders'], map_tags)
+                results.append((template_format, map_tags, size, result))
+
+        columns = ('duration_ms', 'queries', 'renders', 'payload_kb', 'memory_peak_kb', 'size_kb')
+        sys.stdout.write(f"\n{'format':>6} {'maps':>4} {'vertices':>8} " + ' '.join(f'{c:>14}' for c in columns) + '\n')
+        for template_format, map_tags, size, result in results:
+            sys.stdout.write(f"{template_format:>6} {map_tags:>4} {size:>8} "
+                             + ' '.join(f'{result[c]:>14.1f}' for c in columns) + '\n')
+
+
+@tag('benchmark')
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+class BatchDocumentGenerationBenchmark(RendererServerMixin, TransactionTestCase):
+    """
+    generate_documents throughput (documents per minute) by number of rendering workers, with local mbglrenderer
+    stand-in. Data is committed, so rendering threads can read it. Excluded from default test run.
+    """
+    def setUp(self):
+        self.crud_view = factories.CrudViewFactory(layer__geom_type=GeometryTypes.Polygon)
+        self.feature_ids = [
+            Feature.objects.create(layer=self.crud_view.layer, geom=get_polygon(BATCH_VERTICES),
+                                   properties=FEATURE_PROPERTIES).pk
+            for _ in range(BATCH_FEATURES)
+        ]
+
+    def test_generate_documents(self):
+        results = []
+        for template_format, get_template_file in (('odt', get_odt_template), ('pdf', get_pdf_template)):
+            template = Template.objects.create(name=f'{template_format} batch', template_file=get_template_file(1))
+            self.crud_view.templates.add(template)
+            for workers in BATCH_WORKERS:
+                # bulk_create does not send post_save : job is not started by signal
+                job, = BackgroundJob.objects.bulk_create([BackgroundJob(
+                    crud_view=self.crud_view, action=BackgroundJob.GENERATE_DOCUMENTS,
+                    params={'template': template.pk, 'features': self.feature_ids}
+                )])
+                with patch.dict(app_settings.TERRA_GEOCRUD, {'JOBS_MAX_WORKERS': workers}):
+                    start = time.perf_counter()
+                    generate_documents(job)
+                    duration = time.perf_counter() - start
+                self.assertEqual(job.result['documents'], BATCH_FEATURES, job.result['errors'])
+                results.append((template_format, workers, duration, BATCH_FEATURES * 60 / duration))
+
+        sys.stdout.write(f"\n{'format':>6} {'workers':>7} {'duration_s':>14} {'documents_min':>14}\n")
+        for template_format, workers, duration, throughput in results:
+            sys.stdout.write(f"{template_format:>6} {workers:>7} {duration:>14.1f} {throughput:>14.1f}\n")
@@ -1,9 +1,17 @@
+from io import StringIO
+from unittest.mock import patch
+
+import mercantile
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test.testcases import TestCase
 
 from geostore import GeometryTypes
-from geostore.models import Layer
-from terra_geocrud.models import CrudView
+from geostore.models import Feature, FeatureExtraGeom, Layer, LayerExtraGeom
+from terra_geocrud import settings as app_settings
+from terra_geocrud.map import tiles
+from terra_geocrud.models import BackgroundJob, CrudView, CrudViewProperty
+from terra_geocrud.tests.factories import CrudViewFactory
 
 
 class CreateDefaultCrudViewTestCase(TestCase):
@@ -22,3 +30,95 @@ class CreateDefaultCrudViewTestCase(TestCase):
 
         call_command('create_default_crud_views')
         self.assertEqual(CrudView.objects.count(), 3)
+
+
+class MigratePropertyTestCase(TestCase):
+    def setUp(self):
+        self.crud_view = CrudViewFactory()
+        CrudViewProperty.objects.create(view=self.crud_view, key="name",
+                                        json_schema={'type': "string", "title": "Name"})
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('migrate_property', self.crud_view.pk, 'rename', '--key', 'name', '--new-key', 'title',
+                     '--dry-run', stdout=out)
+        self.assertIn('"to_update": 0', out.getvalue())
+        self.assertTrue(self.crud_view.properties.filter(key='name').exists())
+
+    def test_failure(self):
+        with self.assertRaises(CommandError):
+            call_command('migrate_property', self.crud_view.pk, 'rename', '--key', 'unknown', '--new-key', 'title')
+
+
+class PurgeGeneratedDocumentsTestCase(TestCase):
+    def setUp(self):
+        self.view = CrudViewFactory()
+        self.job = BackgroundJob.objects.create(crud_view=self.view, action=BackgroundJob.GENERATE_DOCUMENT)
+        self.other_job = BackgroundJob.objects.create(crud_view=self.view,
+                                                      action=BackgroundJob.REFRESH_PROPERTY_STATISTICS)
+
+    def test_not_expired(self):
+        call_command('purge_generated_documents', stdout=StringIO())
+        self.assertTrue(BackgroundJob.objects.filter(pk=self.job.pk).exists())
+
+    def test_expired(self):
+        with patch.dict(app_settings.TERRA_GEOCRUD, {'DOCUMENTS_EXPIRATION': 0}):
+            call_command('purge_generated_documents', stdout=StringIO())
+        self.assertFalse(BackgroundJob.objects.filter(pk=self.job.pk).exists())
+        self.assertTrue(BackgroundJob.objects.filter(pk=self.other_job.pk).exists())
+
+
+class SeedTilesTestCase(TestCase):
+    def setUp(self):
+        tiles.get_tile_cache().clear()
+        self.view = CrudViewFactory()
+        Feature.objects.create(layer=self.view.layer, geom='POINT(2 45)', properties={"name": "Mill"})
+        Feature.objects.create(layer=self.view.layer, geom='POINT(2.5 45.5)', properties={"name": "Shed"})
+
+    @patch('terra_geocrud.map.tiles.render_tile', wraps=tiles.render_tile)
+    def test_seed_tiles(self, render_tile):
+        output = StringIO()
+        call_command('seed_tiles', self.view.pk, '--max-zoom', '8', stdout=output)
+        self.assertIn('from zoom 0 to 8', output.getvalue())
+        # empty tiles are not descended
+        self.assertLess(render_tile.call_count, sum(4 ** zoom for zoom in range(9)))
+        self.assertGreater(render_tile.call_count, 8)
+        render_tile.reset_mock()
+        self.assertIn(b'Mill', tiles.get_tile(CrudView.objects.get(pk=self.view.pk), 8, 129, 92))
+        render_tile.assert_not_called()
+
+    def test_seed_tiles_small_polygons(self):
+        # polygon not drawn at low zoom
+        view = CrudViewFactory(layer__geom_type=GeometryTypes.Polygon)
+        Feature.objects.create(layer=view.layer, geom='POLYGON((2 45, 2.0001 45, 2.0001 45.0001, 2 45.0001, 2 45))',
+                               properties={"name": "Barn"})
+        call_command('seed_tiles', view.pk, '--max-zoom', '16', stdout=StringIO())
+        x, y, z = mercantile.tile(2.00005, 45.00005, 16)
+        with patch('terra_geocrud.map.tiles.render_tile') as render_tile:
+            self.assertIn(b'Barn', tiles.get_tile(CrudView.objects.get(pk=view.pk), z, x, y))
+        render_tile.assert_not_called()
+
+    def test_seed_tiles_extra_geometries(self):
+        extra_layer = LayerExtraGeom.objects.create(geom_type=GeometryTypes.Point, title='entrance',
+                                                    layer=self.view.layer)
+        FeatureExtraGeom.objects.create(layer_extra_geom=extra_layer, geom='POINT(20 10)',
+                                        feature=self.view.layer.features.first())
+        call_command('seed_tiles', self.view.pk, '--max-zoom', '6', stdout=StringIO())
+        x, y, z = mercantile.tile(20, 10, 6)
+        with patch('terra_geocrud.map.tiles.render_tile') as render_tile:
+            self.assertIn(extra_layer.name.encode(), tiles.get_tile(CrudView.objects.get(pk=self.view.pk), z, x, y))
+        render_tile.assert_not_called()
+
+    @patch('terra_geocrud.map.tiles.render_tile', wraps=tiles.render_tile)
+    def test_seed_tiles_resumed(self, render_tile):
+        call_command('seed_tiles', '--max-zoom', '4', stdout=StringIO())
+        render_tile.reset_mock()
+        call_command('seed_tiles', '--max-zoom', '6', stdout=StringIO())
+        # only zoom 5 and 6 tiles are rendered
+        self.assertTrue(render_tile.called)
+        self.assertTrue(all(call[0][1] > 4 for call in render_tile.call_args_list))
+
+    def test_tile_cache_disabled(self):
+        with patch.dict(app_settings.TERRA_GEOCRUD, {'TILE_CACHE_TIMEOUT': 0}):
+            with self.assertRaises(CommandError):
+                call_command('seed_tiles', stdout=StringIO())
@@ -5,17 +5,19 @@ from django.core.exceptions import ValidationError
 from django.db.utils import IntegrityError
 from django.test import override_settings
 from django.test.testcases import TestCase
+from unittest import mock
 from geostore.models import Feature
 from geostore.tests.factories import LayerFactory
 
 from terra_geocrud.models import AttachmentCategory, feature_attachment_directory_path, \
-    feature_picture_directory_path, CrudViewProperty, FeatureAttachment, PropertyEnum
+    feature_picture_directory_path, CrudViewProperty, FeatureAttachment, PropertyEnum, BackgroundJob
 from terra_geocrud.properties.files import get_storage
 from terra_geocrud.tests import factories
 from terra_geocrud.tests.factories import CrudViewFactory, FeaturePictureFactory, FeatureAttachmentFactory, \
     RoutingSettingsFactory, RoutingInformationFactory
 from .. import models
 from ..properties.schema import sync_layer_schema, sync_ui_schema
+from .utils import capture_on_commit_callbacks
 
 storage = get_storage()
 
@@ -121,6 +123,32 @@ class FeaturePropertyDisplayGroupTestCase(TestCase):
             }
         })
 
+    def test_grouped_schemas_cached(self):
+        form_schema = models.CrudView.objects.get(pk=self.crud_view.pk).grouped_form_schema
+        crud_view = models.CrudView.objects.get(pk=self.crud_view.pk)
+        with self.assertNumQueries(0):
+            self.assertDictEqual(crud_view.grouped_form_schema, form_schema)
+            self.assertIn('test', crud_view.grouped_ui_schema)
+
+    def test_grouped_schemas_invalidated(self):
+        models.CrudView.objects.get(pk=self.crud_view.pk).grouped_form_schema
+        self.group_1.label = 'other'
+        with capture_on_commit_callbacks(execute=True):
+            self.group_1.save()
+        crud_view = models.CrudView.objects.get(pk=self.crud_view.pk)
+        self.assertIn('other', crud_view.grouped_form_schema['properties'])
+        self.assertNotIn('test', crud_view.grouped_form_schema['properties'])
+        self.assertIn('other', crud_view.grouped_ui_schema)
+
+    def test_outdated_instance_save_keep_schema_version(self):
+        schema_version = models.CrudView.objects.get(pk=self.crud_view.pk).schema_version
+        outdated_crud_view = models.CrudView.objects.get(pk=self.crud_view.pk)
+        with capture_on_commit_callbacks(execute=True):
+            self.group_1.save()
+        with capture_on_commit_callbacks(execute=True):
+            outdated_crud_view.save()
+        self.assertEqual(models.CrudView.objects.get(pk=self.crud_view.pk).schema_version, schema_version + 2)
+
 
 class AttachmentCategoryTestCase(TestCase):
     def setUp(self) -> None:
@@ -385,3 +413,45 @@ class RoutingInformationTestCase(TestCase):
     def test_str(self):
         self.assertEqual(str(self.routing_information),
                          f'Routing infos : {self.routing_information.feature.identifier}')
+
+
+class BackgroundJobTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.crud_view = factories.CrudViewFactory()
+
+    def test_job_executed_at_creation(self):
+        job = BackgroundJob.objects.create(crud_view=self.crud_view,
+                                           action=BackgroundJob.PURGE_PROPERTY_FILES,
+                                           params={'key': 'logo'})
+        job.refresh_from_db()
+        self.assertEqual(job.state, BackgroundJob.SUCCESS)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.result, {'deleted': 0})
+
+    @mock.patch('terra_geocrud.properties.files.purge_property_files', side_effect=ValueError('Oops'))
+    def test_job_failure(self, mocked_purge):
+        job = BackgroundJob.objects.create(crud_view=self.crud_view,
+                                           action=BackgroundJob.PURGE_PROPERTY_FILES,
+                                           params={'key': 'logo'})
+        job.refresh_from_db()
+        self.assertEqual(job.state, BackgroundJob.FAILURE)
+        self.assertEqual(job.error, 'Oops')
+        self.assertIsNone(job.progress)
+
+    def test_job_database_error(self):
+        def create_duplicate(job):
+            BackgroundJob.objects.create(pk=job.pk, crud_view=job.crud_view, action=job.action)
+
+        with mock.patch('terra_geocrud.properties.files.purge_property_files', side_effect=create_duplicate):
+            job = BackgroundJob.objects.create(crud_view=self.crud_view,
+                                               action=BackgroundJob.PURGE_PROPERTY_FILES,
+                                               params={'key': 'logo'})
+        # caller transaction is still usable
+        job.refresh_from_db()
+        self.assertEqual(job.state, BackgroundJob.FAILURE)
+        self.assertIn('duplicate key', job.error)
+
+    def test_str(self):
+        job = BackgroundJob(crud_view=self.crud_view, action=BackgroundJob.PURGE_PROPERTY_FILES)
+        self.assertEqual(str(job), f"Purge property files - {self.crud_view} (Pending)")
@@ -1,16 +1,19 @@
 from tempfile import TemporaryDirectory
+from unittest import mock
 
-from django.test import override_settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.test import override_settings, SimpleTestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
 from geostore.tests.factories import FeatureFactory
 
-from terra_geocrud.models import CrudViewProperty
+from terra_geocrud.models import BackgroundJob, CrudViewProperty
 from terra_geocrud.properties.schema import sync_layer_schema
 from terra_geocrud.properties.files import get_info_content, generate_storage_file_path, get_storage, \
-    get_storage_path_from_value, store_feature_files
+    get_storage_path_from_value, store_feature_files, reset_storages, StorageUrlResolver, get_url_cache_timeout
 from terra_geocrud.tests import factories
 from terra_geocrud.thumbnail_backends import ThumbnailDataFileBackend
 
@@ -111,6 +114,12 @@ class StorageFunctionTestCase(APITestCase):
         new_thumbnail = thumbnail_backend.get_thumbnail(new_storage_file_path, "500x500", crop='noop', upscale=False)
         self.assertFalse(storage.exists(new_thumbnail.name))
 
+    def test_get_storage_is_shared(self):
+        storage = get_storage()
+        self.assertIs(get_storage(), storage)
+        reset_storages()
+        self.assertIsNot(get_storage(), storage)
+
     def test_get_storage_path_from_value(self):
         data = get_storage_path_from_value("test;name=file.jpg;base64,xxxxxxxxx")
         self.assertEqual(data, "file.jpg")
@@ -153,6 +162,15 @@ class CrudViewStorageFunctionTestCase(APITestCase):
         self.assertFalse(storage.exists(old_thumbnail.name))
         self.assertFalse(storage.exists(old_storage_file_path))
 
+    def test_remove_crudviewproperty_purge_job(self):
+        store_feature_files(self.feature_with_file_name, {})
+        self.prop.delete()
+        job = self.crud_view.jobs.get(action=BackgroundJob.PURGE_PROPERTY_FILES)
+        self.assertEqual(job.state, BackgroundJob.SUCCESS)
+        self.assertEqual(job.params, {'key': self.property_key})
+        self.assertEqual((job.done, job.total, job.progress), (1, 1, 100))
+        self.assertEqual(job.result, {'deleted': 1})
+
     def test_same_name_file_crudviewproperty(self):
         store_feature_files(self.feature_with_file_name, self.feature_with_file_name.properties)
         storage = get_storage()
@@ -179,3 +197,34 @@ class CrudViewStorageFunctionTestCase(APITestCase):
 
         self.assertEqual(old_storage_file_path, new_storage_file_path)
         self.assertNotEqual(old_thumbnail.url, new_thumbnail.url)
+
+
+class StorageUrlResolverTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.storage = get_storage()
+
+    def test_urls_are_cached(self):
+        with mock.patch.object(self.storage, 'url', side_effect=lambda path: f'/media/{path}') as mocked_url:
+            StorageUrlResolver().prefetch(['a.png', 'b.png', None], self.storage)
+            self.assertEqual(mocked_url.call_count, 2)
+            # new resolver (request) get urls from cache
+            resolver = StorageUrlResolver()
+            self.assertEqual(resolver.url('a.png', self.storage), '/media/a.png')
+            self.assertEqual(resolver.url('c.png', self.storage), '/media/c.png')
+            self.assertEqual(resolver.url('c.png', self.storage), '/media/c.png')
+            self.assertEqual(mocked_url.call_count, 3)
+
+    def test_urls_cached_by_storage_configuration(self):
+        other_storage = FileSystemStorage(location=self.storage.location, base_url='/other_media/')
+        resolver = StorageUrlResolver()
+        self.assertNotEqual(resolver.url('a.png', self.storage), resolver.url('a.png', other_storage))
+        self.assertEqual(StorageUrlResolver().url('a.png', other_storage), '/other_media/a.png')
+
+    def test_signed_urls_expire_before_signature(self):
+        storage = mock.Mock(querystring_auth=True, querystring_expire=3600)
+        self.assertEqual(get_url_cache_timeout(storage), 300)
+        storage.querystring_expire = 120
+        self.assertEqual(get_url_cache_timeout(storage), 60)
+        storage.querystring_expire = 30
+        self.assertEqual(get_url_cache_timeout(storage), 0)
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from terra_geocrud.models import BackgroundJob, CrudViewProperty
+from terra_geocrud.properties.indexes import get_existing_indexes, get_index_name
+from terra_geocrud.tests.factories import CrudViewFactory
+from terra_geocrud.tests.utils import capture_on_commit_callbacks
+
+
+class PropertyIndexesTestCase(TestCase):
+    def setUp(self) -> None:
+        self.view = CrudViewFactory()
+        self.prop_age = CrudViewProperty.objects.create(
+            view=self.view, key="age",
+            json_schema={'type': "integer", "title": "Age"}
+        )
+
+    def test_index_created(self):
+        self.prop_age.filterable = True
+        with capture_on_commit_callbacks(execute=True):
+            self.prop_age.save()
+        job = self.view.jobs.get(action=BackgroundJob.SYNC_PROPERTY_INDEXES)
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        self.assertSetEqual(get_existing_indexes(self.view.layer_id),
+                            {get_index_name(self.view.layer_id, 'age', 'numeric')})
+
+    def test_index_created_once_committed(self):
+        self.prop_age.filterable = True
+        with capture_on_commit_callbacks() as callbacks:
+            self.prop_age.save()
+        self.assertFalse(self.view.jobs.filter(action=BackgroundJob.SYNC_PROPERTY_INDEXES).exists())
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self.view.jobs.filter(action=BackgroundJob.SYNC_PROPERTY_INDEXES).exists())
+
+    def test_index_dropped(self):
+        self.prop_age.filterable = True
+        with capture_on_commit_callbacks(execute=True):
+            self.prop_age.save()
+        self.prop_age.filterable = False
+        with capture_on_commit_callbacks(execute=True):
+            self.prop_age.save()
+        self.assertSetEqual(get_existing_indexes(self.view.layer_id), set())
+        self.assertEqual(self.view.jobs.filter(action=BackgroundJob.SYNC_PROPERTY_INDEXES).count(), 2)
+
+    def test_index_replaced_when_type_change(self):
+        self.prop_age.filterable = True
+        with capture_on_commit_callbacks(execute=True):
+            self.prop_age.save()
+        self.prop_age.json_schema['type'] = 'string'
+        with capture_on_commit_callbacks(execute=True):
+            self.prop_age.save()
+        self.assertSetEqual(get_existing_indexes(self.view.layer_id),
+                            {get_index_name(self.view.layer_id, 'age', 'text')})
+
+    def test_job_created_while_job_running(self):
+        job = BackgroundJob.objects.create(crud_view=self.view, action=BackgroundJob.SYNC_PROPERTY_INDEXES)
+        BackgroundJob.objects.filter(pk=job.pk).update(state=BackgroundJob.RUNNING)
+        self.prop_age.filterable = True
+        with capture_on_commit_callbacks(execute=True):
+            self.prop_age.save()
+        self.assertEqual(self.view.jobs.filter(action=BackgroundJob.SYNC_PROPERTY_INDEXES).count(), 2)
+        self.assertSetEqual(get_existing_indexes(self.view.layer_id),
+                            {get_index_name(self.view.layer_id, 'age', 'numeric')})
+
+    def test_no_job_without_change(self):
+        self.prop_age.filterable = True
+        with capture_on_commit_callbacks(execute=True):
+            self.prop_age.save()
+        with patch('terra_geocrud.signals.request_property_indexes_sync') as mocked_sync:
+            self.prop_age.save()
+            prop_age = CrudViewProperty.objects.get(pk=self.prop_age.pk)
+            prop_age.json_schema['title'] = "Age in years"
+            prop_age.save()
+        mocked_sync.assert_not_called()
+        self.assertEqual(self.view.jobs.filter(action=BackgroundJob.SYNC_PROPERTY_INDEXES).count(), 1)
+
+    def test_indexes_dropped_with_property_and_view(self):
+        self.prop_age.filterable = True
+        with capture_on_commit_callbacks(execute=True):
+            self.prop_age.save()
+        with capture_on_commit_callbacks(execute=True):
+            self.prop_age.delete()
+        self.assertSetEqual(get_existing_indexes(self.view.layer_id), set())
+        CrudViewProperty.objects.create(view=self.view, key="name", filterable=True,
+                                        json_schema={'type': "string", "title": "Name"})
+        layer_id = self.view.layer_id
+        self.view.delete()
+        self.assertSetEqual(get_existing_indexes(layer_id), set())
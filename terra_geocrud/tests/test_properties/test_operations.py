@@ -0,0 +1,127 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from geostore.models import Feature
+
+from terra_geocrud import settings as app_settings
+from terra_geocrud.models import BackgroundJob, CrudViewProperty, PropertyEnum
+from terra_geocrud.properties.schema import sync_layer_schema
+from terra_geocrud.properties.search import update_features_search
+from terra_geocrud.tests.factories import CrudViewFactory
+
+
+class PropertyOperationTestCase(TestCase):
+    def setUp(self) -> None:
+        self.view = CrudViewFactory()
+        self.prop_name = CrudViewProperty.objects.create(
+            view=self.view, key="name",
+            json_schema={'type': "string", "title": "Name"}
+        )
+        self.prop_age = CrudViewProperty.objects.create(
+            view=self.view, key="age",
+            json_schema={'type': "string", "title": "Age"}
+        )
+        self.prop_level = CrudViewProperty.objects.create(
+            view=self.view, key="level",
+            json_schema={'type': "string", "title": "Level"}
+        )
+        PropertyEnum.objects.create(value="low", property=self.prop_level)
+        PropertyEnum.objects.create(value="high", property=self.prop_level)
+        sync_layer_schema(self.view)
+        self.feature_1 = Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)',
+                                                properties={"name": "John Doe", "age": "12", "level": "low"})
+        self.feature_2 = Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)',
+                                                properties={"name": "Jane", "age": "abc", "level": "high"})
+
+    def migrate(self, **params):
+        job = BackgroundJob.objects.create(crud_view=self.view, action=BackgroundJob.MIGRATE_PROPERTY,
+                                           params=params)
+        job.refresh_from_db()
+        self.feature_1.refresh_from_db()
+        self.feature_2.refresh_from_db()
+        self.view.layer.refresh_from_db()
+        return job
+
+    def test_rename(self):
+        job = self.migrate(operation='rename', key='name', new_key='full_name')
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        self.assertEqual(job.result['updated'], 2)
+        self.assertDictEqual(self.feature_1.properties, {"full_name": "John Doe", "age": "12", "level": "low"})
+        self.assertIn('full_name', self.view.layer.schema['properties'])
+        self.assertNotIn('name', self.view.layer.schema['properties'])
+
+    def test_rename_existing_key(self):
+        job = self.migrate(operation='rename', key='name', new_key='age')
+        self.assertEqual(job.state, BackgroundJob.FAILURE)
+        self.assertEqual(self.feature_1.properties['name'], "John Doe")
+
+    def test_dry_run(self):
+        job = self.migrate(operation='cast', key='age', type='integer', dry_run=True)
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        self.assertDictEqual(job.result, {'features': 2, 'to_update': 2, 'invalid': 1})
+        self.assertEqual(self.feature_1.properties['age'], "12")
+
+    def test_cast_with_invalid_values(self):
+        job = self.migrate(operation='cast', key='age', type='integer')
+        self.assertEqual(job.state, BackgroundJob.FAILURE)
+        self.assertEqual(self.feature_1.properties['age'], "12")
+
+    def test_cast_drop_invalid(self):
+        job = self.migrate(operation='cast', key='age', type='integer', drop_invalid=True)
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        self.assertEqual(self.feature_1.properties['age'], 12)
+        self.assertNotIn('age', self.feature_2.properties)
+        self.assertEqual(self.view.layer.schema['properties']['age']['type'], 'integer')
+
+    def test_map_values(self):
+        job = self.migrate(operation='map_values', key='level', mapping={"low": "small", "high": "small"})
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        self.assertEqual(self.feature_1.properties['level'], "small")
+        self.assertEqual(self.feature_2.properties['level'], "small")
+        self.assertEqual(self.view.layer.schema['properties']['level']['enum'], ["small"])
+
+    def test_split(self):
+        CrudViewProperty.objects.create(view=self.view, key="first_name",
+                                        json_schema={'type': "string", "title": "First name"})
+        CrudViewProperty.objects.create(view=self.view, key="last_name",
+                                        json_schema={'type': "string", "title": "Last name"})
+        job = self.migrate(operation='split', key='name', new_keys=['first_name', 'last_name'], separator=' ')
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        self.assertDictEqual(self.feature_1.properties, {"first_name": "John", "last_name": "Doe",
+                                                         "age": "12", "level": "low"})
+        self.assertDictEqual(self.feature_2.properties, {"first_name": "Jane", "age": "abc", "level": "high"})
+        self.assertFalse(self.view.properties.filter(key='name').exists())
+
+    def test_merge(self):
+        job = self.migrate(operation='merge', keys=['name', 'age'], new_key='name', separator=', ')
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        self.assertDictEqual(self.feature_1.properties, {"name": "John Doe, 12", "level": "low"})
+        self.assertFalse(self.view.properties.filter(key='age').exists())
+
+    def test_resume_after_last_updated_feature(self):
+        job = BackgroundJob.objects.create(crud_view=self.view, action=BackgroundJob.MIGRATE_PROPERTY,
+                                           params={'operation': 'rename', 'key': 'level', 'new_key': 'rank'},
+                                           result={'last_id': self.feature_1.pk})
+        job.refresh_from_db()
+        self.feature_1.refresh_from_db()
+        self.feature_2.refresh_from_db()
+        self.assertEqual(job.result['updated'], 1)
+        self.assertIn('level', self.feature_1.properties)
+        self.assertEqual(self.feature_2.properties['rank'], "high")
+
+    @patch.dict(app_settings.TERRA_GEOCRUD, {'JOBS_CHUNK_SIZE': 1})
+    def test_feature_saved_during_migration(self):
+        def edit_updated_feature(crud_view, ids):
+            update_features_search(crud_view, ids)
+            if ids == [self.feature_1.pk]:
+                # old key saved again, after feature chunk
+                feature = Feature.objects.get(pk=self.feature_1.pk)
+                feature.properties = {"name": "Johnny", "age": "12", "level": "low"}
+                feature.save()
+
+        with patch('terra_geocrud.properties.operations.update_features_search', side_effect=edit_updated_feature):
+            job = self.migrate(operation='rename', key='name', new_key='full_name')
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        self.assertEqual(job.result['updated'], 3)
+        self.assertDictEqual(self.feature_1.properties, {"full_name": "Johnny", "age": "12", "level": "low"})
+        self.assertDictEqual(self.feature_2.properties, {"full_name": "Jane", "age": "abc", "level": "high"})
@@ -1,10 +1,11 @@
 from django.test import TestCase
 from geostore.models import Feature
 
-from terra_geocrud.models import CrudViewProperty
+from terra_geocrud.models import BackgroundJob, CrudViewProperty, PropertyEnum
 from terra_geocrud.properties.schema import sync_layer_schema, sync_ui_schema, clean_properties_not_in_schema_or_null, \
     sync_properties_in_tiles
 from terra_geocrud.tests.factories import CrudViewFactory
+from terra_geocrud.tests.utils import capture_on_commit_callbacks
 
 
 class CleanPropertiesNotInSchemaOrNullTestCase(TestCase):
@@ -50,6 +51,85 @@ class CleanPropertiesNotInSchemaOrNullTestCase(TestCase):
         self.feature.refresh_from_db()
         self.assertNotIn('age', self.feature.properties)
 
+    def test_only_features_to_clean_are_updated(self):
+        clean_feature = Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)',
+                                               properties={"name": "Name", "age": 10})
+        updated_ids = clean_properties_not_in_schema_or_null(self.view)
+        self.assertListEqual(updated_ids, [self.feature.pk])
+        self.feature.refresh_from_db()
+        self.assertDictEqual(self.feature.properties, {"age": 15, "country": "Country"})
+        clean_feature.refresh_from_db()
+        self.assertDictEqual(clean_feature.properties, {"name": "Name", "age": 10})
+
+    def test_clean_job(self):
+        job = BackgroundJob.objects.create(crud_view=self.view, action=BackgroundJob.CLEAN_FEATURE_PROPERTIES)
+        job.refresh_from_db()
+        self.assertEqual(job.state, BackgroundJob.SUCCESS)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.result['updated'], 1)
+        self.feature.refresh_from_db()
+        self.assertNotIn('name', self.feature.properties)
+
+
+class SyncLayerSchemaTestCase(TestCase):
+    def setUp(self) -> None:
+        self.view = CrudViewFactory()
+        self.prop_name = CrudViewProperty.objects.create(
+            view=self.view, key="name",
+            required=True,
+            json_schema={'type': "string", "title": "Name"}
+        )
+        self.prop_level = CrudViewProperty.objects.create(
+            view=self.view, key="level",
+            json_schema={'type': "integer", "title": "Level"}
+        )
+        PropertyEnum.objects.create(value="1", property=self.prop_level)
+        PropertyEnum.objects.create(value="2", property=self.prop_level)
+
+    def test_schema_generated(self):
+        diff = sync_layer_schema(self.view)
+        self.assertEqual(diff['added'], ['level'])
+        self.assertEqual(diff['removed'], ['age', 'country'])
+        self.assertDictEqual(self.view.layer.schema, {
+            "properties": {
+                "name": {'type': "string", "title": "Name"},
+                "level": {'type': "integer", "title": "Level", "enum": [1, 2]},
+            },
+            "required": ["name"]
+        })
+
+    def test_schema_saved_only_if_changed(self):
+        sync_layer_schema(self.view)
+        version = self.view.schema_version
+        # properties and enum values
+        with self.assertNumQueries(2):
+            diff = sync_layer_schema(self.view)
+        self.assertEqual(diff, {'added': [], 'removed': [], 'changed': []})
+        self.assertEqual(self.view.schema_version, version)
+
+    def test_schema_version_bumped(self):
+        sync_layer_schema(self.view)
+        version = self.view.schema_version
+        self.prop_name.json_schema['title'] = "Other name"
+        self.prop_name.save()
+        with capture_on_commit_callbacks(execute=True):
+            diff = sync_layer_schema(self.view)
+        self.assertEqual(diff['changed'], ['name'])
+        self.assertEqual(self.view.schema_version, version + 1)
+        self.view.refresh_from_db()
+        self.assertEqual(self.view.schema_version, version + 1)
+
+    def test_ui_schema_version_bumped(self):
+        sync_ui_schema(self.view)
+        version = self.view.schema_version
+        self.prop_name.ui_schema = {'ui:widget': 'textarea'}
+        self.prop_name.save()
+        with capture_on_commit_callbacks(execute=True):
+            sync_ui_schema(self.view)
+        self.assertEqual(self.view.schema_version, version + 1)
+        self.view.refresh_from_db()
+        self.assertEqual(self.view.schema_version, version + 1)
+
 
 class PropertiesInTilesTestCase(TestCase):
     def setUp(self) -> None:
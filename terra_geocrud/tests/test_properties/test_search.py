@@ -0,0 +1,85 @@
+from django.contrib.postgres.search import SearchQuery
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.urls import reverse
+from geostore.models import Feature
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from terra_geocrud.models import BackgroundJob, CrudViewProperty, FeatureSearch
+from terra_geocrud.properties.schema import sync_layer_schema
+from terra_geocrud.tests.factories import CrudViewFactory, UserFactory
+from terra_geocrud.validators import validate_search_config
+
+
+class FeatureSearchTestCase(TestCase):
+    def setUp(self) -> None:
+        self.view = CrudViewFactory()
+        self.prop_name = CrudViewProperty.objects.create(
+            view=self.view, key="name",
+            json_schema={'type': "string", "title": "Name"}
+        )
+        self.feature = Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)',
+                                              properties={"name": "Old mill"})
+
+    def test_rebuild_when_searchable(self):
+        self.assertFalse(FeatureSearch.objects.exists())
+        self.prop_name.search_weight = 'A'
+        self.prop_name.save()
+        job = self.view.jobs.get(action=BackgroundJob.REBUILD_FEATURES_SEARCH)
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        self.assertEqual(job.done, 1)
+        self.assertTrue(FeatureSearch.objects.filter(feature=self.feature, vector__isnull=False).exists())
+
+    def test_no_rebuild_without_change(self):
+        self.prop_name.search_weight = 'A'
+        self.prop_name.save()
+        self.prop_name.order = 2
+        self.prop_name.save()
+        self.view.save()
+        self.assertEqual(self.view.jobs.filter(action=BackgroundJob.REBUILD_FEATURES_SEARCH).count(), 1)
+        self.view.search_config = 'english'
+        self.view.save()
+        self.assertEqual(self.view.jobs.filter(action=BackgroundJob.REBUILD_FEATURES_SEARCH).count(), 2)
+
+    def test_updated_at_feature_save(self):
+        self.prop_name.search_weight = 'A'
+        self.prop_name.save()
+        self.feature.properties = {"name": "Windmill"}
+        self.feature.save()
+        self.assertTrue(self.view.layer.features.filter(search__vector=SearchQuery('windmill', config='simple')).exists())
+        self.assertFalse(self.view.layer.features.filter(search__vector=SearchQuery('old', config='simple')).exists())
+
+    def test_invalid_search_config(self):
+        with self.assertRaises(ValidationError):
+            validate_search_config('unknown')
+
+
+class FeatureSearchViewTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.view = CrudViewFactory()
+        CrudViewProperty.objects.create(view=self.view, key="name", search_weight='A',
+                                        json_schema={'type': "string", "title": "Name"})
+        CrudViewProperty.objects.create(view=self.view, key="description", search_weight='D',
+                                        json_schema={'type': "string", "title": "Description"})
+        sync_layer_schema(self.view)
+        self.feature_1 = Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)',
+                                                properties={"name": "Bridge", "description": "Near the mill"})
+        self.feature_2 = Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)',
+                                                properties={"name": "Mill", "description": "Stone building"})
+        Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)',
+                               properties={"name": "Church"})
+        self.client.force_authenticate(UserFactory())
+
+    def test_ranked_search(self):
+        response = self.client.get(reverse('feature-list', args=(self.view.layer_id,)), {'q': 'mill'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.json())
+        data = response.json()
+        self.assertListEqual([feature['identifier'] for feature in data],
+                             [str(self.feature_2.identifier), str(self.feature_1.identifier)])
+        self.assertIn('<mark>Mill</mark>', data[0]['search_headline'])
+
+    def test_no_searchable_property(self):
+        self.view.properties.update(search_weight='')
+        response = self.client.get(reverse('feature-list', args=(self.view.layer_id,)), {'q': 'mill'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,94 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+from geostore.models import Feature
+from rest_framework.test import APITestCase
+
+from terra_geocrud import settings as app_settings
+from terra_geocrud.models import BackgroundJob, CrudViewProperty
+from terra_geocrud.properties.statistics import apply_statistics, request_statistics_refresh
+from terra_geocrud.tests.factories import CrudViewFactory, UserFactory
+from terra_geocrud.tests.utils import capture_on_commit_callbacks
+
+
+@patch.dict(app_settings.TERRA_GEOCRUD, {'STATISTICS_BUCKETS': 2})
+class PropertyStatisticsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.view = CrudViewFactory()
+        CrudViewProperty.objects.create(view=self.view, key="age",
+                                        json_schema={'type': "integer", "title": "Age"})
+        CrudViewProperty.objects.create(view=self.view, key="date",
+                                        json_schema={'type': "string", "format": "date", "title": "Date"})
+        CrudViewProperty.objects.create(view=self.view, key="name",
+                                        json_schema={'type': "string", "title": "Name"})
+        for age, date in ((10, "2020-01-02"), (20, "2020-01-20"), (40, "2021-03-01")):
+            Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)',
+                                   properties={"age": age, "date": date, "name": "Name"})
+        Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)', properties={"age": "invalid"})
+        self.view.refresh_from_db()
+
+    def test_refresh(self):
+        self.assertTrue(request_statistics_refresh(self.view))
+        job = self.view.jobs.get(action=BackgroundJob.REFRESH_PROPERTY_STATISTICS)
+        self.assertEqual(job.state, BackgroundJob.SUCCESS, job.error)
+        statistics = self.view.get_property_statistics()
+        self.assertListEqual(sorted(statistics), ['age', 'date'])
+        self.assertAlmostEqual(statistics['age'].pop('mean'), 70 / 3)
+        self.assertDictEqual(statistics['age'], {
+            'count': 3, 'min': 10.0, 'max': 40.0, 'quantiles': [20.0],
+            'histogram': [{'min': 10.0, 'max': 25.0, 'count': 2}, {'min': 25.0, 'max': 40.0, 'count': 1}],
+        })
+        self.assertDictEqual(statistics['date'], {
+            'count': 3, 'min': "2020-01-02", 'max': "2021-03-01", 'quantiles': ["2020-01-20"],
+            'histogram': [{'min': "2020-01", 'max': "2020-01", 'count': 2},
+                          {'min': "2021-03", 'max': "2021-03", 'count': 1}],
+        })
+        # up to date
+        self.assertFalse(request_statistics_refresh(self.view))
+
+    def test_outdated_after_feature_change(self):
+        request_statistics_refresh(self.view)
+        with capture_on_commit_callbacks(execute=True):
+            Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)', properties={"age": 100})
+        self.view.refresh_from_db()
+        self.assertTrue(request_statistics_refresh(self.view))
+        self.assertEqual(self.view.get_property_statistics()['age']['max'], 100.0)
+
+    def test_map_style_with_statistics(self):
+        request_statistics_refresh(self.view)
+        self.view.map_style = {'paint': {'circle-radius': ["interpolate", ["linear"], ["get", "age"],
+                                                           "$stats.age.min", 1, "$stats.age.quantiles.0", 5,
+                                                           "$stats.unknown.max", 10]}}
+        self.assertListEqual(self.view.map_style_with_default['paint']['circle-radius'],
+                             ["interpolate", ["linear"], ["get", "age"], 10.0, 1, 20.0, 5, None, 10])
+
+    def test_apply_statistics_without_placeholder(self):
+        self.assertDictEqual(apply_statistics({'paint': ["get", "age"]}, {}), {'paint': ["get", "age"]})
+
+
+class PropertyStatisticsViewTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.view = CrudViewFactory()
+        CrudViewProperty.objects.create(view=self.view, key="age",
+                                        json_schema={'type': "integer", "title": "Age"})
+        Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)', properties={"age": 5})
+        self.client.force_authenticate(UserFactory())
+
+    def test_statistics_endpoint(self):
+        url = reverse('crudview-statistics', args=(self.view.pk,))
+        self.assertDictEqual(self.client.get(url).json(), {})
+        self.assertFalse(self.view.jobs.filter(action=BackgroundJob.REFRESH_PROPERTY_STATISTICS).exists())
+        data = self.client.post(url).json()
+        self.assertEqual(data['age']['max'], 5.0)
+        self.assertFalse(data['age']['outdated'])
+
+    def test_statistics_endpoint_outdated(self):
+        url = reverse('crudview-statistics', args=(self.view.pk,))
+        self.client.post(url)
+        with capture_on_commit_callbacks(execute=True):
+            Feature.objects.create(layer=self.view.layer, geom='POINT(0 0)', properties={"age": 10})
+        data = self.client.get(url).json()
+        self.assertEqual(data['age']['max'], 5.0)
+        self.assertTrue(data['age']['outdated'])
+        self.assertEqual(self.view.jobs.filter(action=BackgroundJob.REFRESH_PROPERTY_STATISTICS).count(), 1)
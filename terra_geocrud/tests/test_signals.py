@@ -24,6 +24,7 @@ from terra_geocrud.tasks import (
 from terra_geocrud.thumbnail_backends import ThumbnailDataFileBackend
 
 from terra_geocrud.tests.factories import CrudViewFactory
+from terra_geocrud.tests.utils import capture_on_commit_callbacks
 from ..signals import save_feature
 
 thumbnail_backend = ThumbnailDataFileBackend()
@@ -774,3 +775,21 @@ class RelationChangeCalculatedPropertiesTest(AsyncSideEffect, TestCase):
 
         self.feature_long.refresh_from_db()
         self.assertEqual(self.feature_long.properties, {'city': ['Ville 0 0', 'Ville 5 5'], 'name': 'tata'})
+
+
+class FeatureDataVersionTest(TestCase):
+    def setUp(self):
+        self.crud_view = CrudViewFactory()
+
+    def test_data_version_bumped_once_on_commit(self):
+        version = self.crud_view.data_version
+        with capture_on_commit_callbacks() as callbacks:
+            feature = Feature.objects.create(layer=self.crud_view.layer, geom='POINT(0 0)', properties={})
+            feature.properties = {'name': "Mill"}
+            feature.save()
+        self.crud_view.refresh_from_db()
+        self.assertEqual(self.crud_view.data_version, version)
+        for callback in callbacks:
+            callback()
+        self.crud_view.refresh_from_db()
+        self.assertEqual(self.crud_view.data_version, version + 1)
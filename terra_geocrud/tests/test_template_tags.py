@@ -1,10 +1,13 @@
 import json
 import os
+import threading
+import time
 from tempfile import TemporaryDirectory
 from unittest import mock
 
 from django.conf import settings
 from django.contrib.gis.geos import GeometryCollection, LineString, Point
+from django.core.cache import cache
 from django.core.files.base import ContentFile
 from django.template import Context, Template
 from django.template.base import FilterExpression, Parser
@@ -22,6 +25,8 @@ from geostore.models import Feature, FeatureExtraGeom, LayerExtraGeom
 from geostore import GeometryTypes
 
 from mapbox_baselayer.models import BaseLayerTile, MapBaseLayer
+from terra_geocrud.map.geometries import (EARTH_CIRCUMFERENCE, get_coordinates_precision, get_render_extent,
+                                          get_render_geojson, get_zoom)
 from terra_geocrud.models import ExtraLayerStyle, CrudViewProperty, PropertyEnum
 from terra_geocrud.templatetags.map_tags import MapImageLoaderURLODTNode, stored_image_base64
 from terra_geocrud import settings as app_settings
@@ -64,11 +69,12 @@ class MapImageUrlLoaderTestCase(TestCase):
         self.node = MapImageLoaderURLODTNode('http://mbglrenderer/render')
 
         self.token_mapbox = app_settings.TERRA_GEOCRUD.get('map', {}).get('mapbox_access_token')
+        # rendered maps are cached
+        cache.clear()
 
 
-@mock.patch('secrets.token_hex', side_effect=['primary', 'test'])
 class StyleMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
-    def test_get_style_default(self, token):
+    def test_get_style_default(self):
         self.maxDiff = None
         dict_style = {
             "version": 8,
@@ -77,17 +83,17 @@ class StyleMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
                                                  "tiles": ["http://a.tile.openstreetmap.org/{z}/{x}/{y}.png"],
                                                  "tileSize": 256,
                                                  "maxzoom": 18},
-                 "primary": {"type": "geojson",
-                             "data": {"type": "LineString", "coordinates": [[-0.246322800072846, 44.5562461167907],
-                                                                            [0.0, 44.0]]}}},
+                 "terra_geocrud_feature": {"type": "geojson",
+                                           "data": {"type": "LineString", "coordinates": [[-0.2463, 44.5562],
+                                                                                          [0.0, 44.0]]}}},
             "layers": [
                 {"id": "DEFAULT_MBGL_RENDERER_STYLE", "type": "raster", "source": "DEFAULT_MBGL_RENDERER_STYLE"},
                 {"type": "line", "paint": {"line-color": "#000", "line-width": 3},
-                 "id": "primary", "source": "primary"}]
+                 "id": "terra_geocrud_feature", "source": "terra_geocrud_feature"}]
         }
         self.assertDictEqual(dict_style, self.node.get_style(self.line, True, [''], None))
 
-    def test_get_style_no_feature(self, token):
+    def test_get_style_no_feature(self):
         self.maxDiff = None
         dict_style = {
             "version": 8,
@@ -102,7 +108,7 @@ class StyleMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
 
         self.assertDictEqual(dict_style, self.node.get_style(self.line, False, [''], None))
 
-    def test_get_style_no_feature_extra_feature(self, token):
+    def test_get_style_no_feature_extra_feature(self):
         self.maxDiff = None
         dict_style = {
             "version": 8,
@@ -111,16 +117,16 @@ class StyleMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
                                                  "tiles": ["http://a.tile.openstreetmap.org/{z}/{x}/{y}.png"],
                                                  "tileSize": 256,
                                                  "maxzoom": 18},
-                 'primary': {"type": "geojson",
-                             "data": {"type": "Point", "coordinates": [-0.1, 44.2]}}},
+                 'terra_geocrud_extra_test': {"type": "geojson",
+                                              "data": {"type": "Point", "coordinates": [-0.1, 44.2]}}},
             "layers": [
                 {"id": "DEFAULT_MBGL_RENDERER_STYLE", "type": "raster", "source": "DEFAULT_MBGL_RENDERER_STYLE"},
                 {"type": "circle", "paint": {"circle-color": "#000", "circle-radius": 8},
-                 "id": "primary", "source": "primary"}]
+                 "id": "terra_geocrud_extra_test", "source": "terra_geocrud_extra_test"}]
         }
         self.assertDictEqual(dict_style, self.node.get_style(self.line, False, ['test'], None))
 
-    def test_get_style_no_feature_extra_feature_custom_style(self, token):
+    def test_get_style_no_feature_extra_feature_custom_style(self):
         self.maxDiff = None
         custom_style = {"type": "circle", "paint": {"circle-color": "#fff", "circle-radius": 8}}
         ExtraLayerStyle.objects.create(layer_extra_geom=self.extra_layer, crud_view=self.crud_view_line,
@@ -132,16 +138,16 @@ class StyleMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
                                                  "tiles": ["http://a.tile.openstreetmap.org/{z}/{x}/{y}.png"],
                                                  "tileSize": 256,
                                                  "maxzoom": 18},
-                 "primary": {"type": "geojson",
-                             "data": {"type": "Point", "coordinates": [-0.1, 44.2]}}},
+                 "terra_geocrud_extra_test": {"type": "geojson",
+                                              "data": {"type": "Point", "coordinates": [-0.1, 44.2]}}},
             "layers": [
                 {"id": "DEFAULT_MBGL_RENDERER_STYLE", "type": "raster", "source": "DEFAULT_MBGL_RENDERER_STYLE"},
                 {"type": "circle", "paint": {"circle-color": "#fff", "circle-radius": 8},
-                 "id": "primary", "source": "primary"}]
+                 "id": "terra_geocrud_extra_test", "source": "terra_geocrud_extra_test"}]
         }
         self.assertDictEqual(dict_style, self.node.get_style(self.line, False, ['test'], None))
 
-    def test_get_style_no_feature_from_baselayer(self, token):
+    def test_get_style_no_feature_from_baselayer(self):
         self.maxDiff = None
         layer = MapBaseLayer.objects.create(name="BaseLayerCustom", order=0, base_layer_type="raster")
         BaseLayerTile.objects.create(url="test.test", base_layer=layer)
@@ -169,7 +175,7 @@ class StyleMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
 
         self.assertDictEqual(dict_style, self.node.get_style(self.line, False, [''], None))
 
-    def test_get_style_chosen_baselayer(self, token):
+    def test_get_style_chosen_baselayer(self):
         self.maxDiff = None
         MapBaseLayer.objects.create(name="BaseLayerCustom", order=0, base_layer_type="raster")
         layer = MapBaseLayer.objects.create(name="OtherLayerCustom", order=1, base_layer_type="raster")
@@ -197,9 +203,10 @@ class StyleMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
 
         self.assertDictEqual(dict_style, self.node.get_style(self.line, False, [''], 'otherlayercustom'))
 
-    @mock.patch('requests.get')
-    def test_get_style_no_feature_from_mapbox_baselayer(self, mocked_get, token):
+    @mock.patch('requests.Session.get')
+    def test_get_style_no_feature_from_mapbox_baselayer(self, mocked_get):
         mocked_get.return_value.status_code = 200
+        mocked_get.return_value.headers = {}
         mocked_get.return_value.json.return_value = {"custom": "style"}
         self.maxDiff = None
         MapBaseLayer.objects.create(name="BaseLayerCustom", order=0, base_layer_type="mapbox", map_box_url="test.com")
@@ -207,10 +214,30 @@ class StyleMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
 
         self.assertDictEqual({"custom": "style"}, self.node.get_style(self.line, False, [''], None))
 
+    @mock.patch('requests.Session.get')
+    def test_mapbox_baselayer_style_cached(self, mocked_get):
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.headers = {'ETag': 'v1'}
+        mocked_get.return_value.json.return_value = {"custom": "style", "sources": {}, "layers": []}
+        MapBaseLayer.objects.create(name="BaseLayerCustom", order=0, base_layer_type="mapbox", map_box_url="test.com")
+
+        self.node.get_style(self.line, True, [''], 'baselayercustom')
+        style = self.node.get_style(self.line, True, [''], 'baselayercustom')
+        mocked_get.assert_called_once()
+        self.assertIn('terra_geocrud_feature', style['sources'])
+        self.assertEqual(mocked_get.call_args[1]['timeout'], app_settings.TERRA_GEOCRUD['HTTP_TIMEOUT'])
+
+        # revalidated with etag when expired
+        mocked_get.return_value.status_code = 304
+        with mock.patch.dict(app_settings.TERRA_GEOCRUD, {'BASE_STYLE_CACHE_TIMEOUT': 1}), \
+                mock.patch('time.time', return_value=time.time() + 7200):
+            style = self.node.get_style(self.line, False, [''], 'baselayercustom')
+        self.assertEqual(mocked_get.call_args[1]['headers'], {'If-None-Match': 'v1'})
+        self.assertEqual(style['custom'], "style")
+
 
-@mock.patch('secrets.token_hex', side_effect=['primary', 'test'])
 class ContextMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
-    def test_get_value_context_line(self, token):
+    def test_get_value_context_line(self):
         self.maxDiff = None
         self.node = MapImageLoaderURLODTNode('http://mbglrenderer/render', data={'width': None,
                                                                                  'height': None,
@@ -225,23 +252,26 @@ class ContextMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
                                                  "tiles": ["http://a.tile.openstreetmap.org/{z}/{x}/{y}.png"],
                                                  "tileSize": 256,
                                                  "maxzoom": 18},
-                 "primary": {"type": "geojson",
-                             "data": {"type": "LineString", "coordinates": [[-0.246322800072846, 44.5562461167907],
-                                                                            [0.0, 44.0]]}}},
+                 "terra_geocrud_feature": {"type": "geojson",
+                                           "data": {"type": "LineString", "coordinates": [[-0.2463, 44.5562],
+                                                                                          [0.0, 44.0]]}}},
             "layers": [
                 {"id": "DEFAULT_MBGL_RENDERER_STYLE", "type": "raster", "source": "DEFAULT_MBGL_RENDERER_STYLE"},
                 {"type": "line", "paint": {"line-color": "#000", "line-width": 3},
-                 "id": "primary", "source": "primary"}]
+                 "id": "terra_geocrud_feature", "source": "terra_geocrud_feature"}]
         }
         dict_style_post = {'style': json.dumps(dict_style),
-                           'center': [-0.12316140003642298, 44.27812305839535],
                            'zoom': 8,
                            'width': 1024,
                            'height': 512,
                            'token': self.token_mapbox}
+        # center of extent
+        center = style.pop('center')
+        self.assertAlmostEqual(center[0], -0.123161400036423)
+        self.assertAlmostEqual(center[1], 44.27812305839535)
         self.assertDictEqual(dict_style_post, style)
 
-    def test_get_value_context_point(self, token):
+    def test_get_value_context_point(self):
         self.maxDiff = None
         settings_terra = app_settings.TERRA_GEOCRUD
         settings_terra['MAX_ZOOM'] = 20
@@ -260,12 +290,12 @@ class ContextMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
                                                  "tiles": ["http://a.tile.openstreetmap.org/{z}/{x}/{y}.png"],
                                                  "tileSize": 256,
                                                  "maxzoom": 18},
-                 "primary": {"type": "geojson",
-                             "data": {"type": "Point", "coordinates": [-0.246322800072846, 44.5562461167907]}}},
+                 "terra_geocrud_feature": {"type": "geojson",
+                                           "data": {"type": "Point", "coordinates": [-0.2463228, 44.55624612]}}},
             "layers": [
                 {"id": "DEFAULT_MBGL_RENDERER_STYLE", "type": "raster", "source": "DEFAULT_MBGL_RENDERER_STYLE"},
-                {"type": "circle", "paint": {"circle-color": "#000", "circle-radius": 8}, "id": "primary",
-                 "source": "primary"}]
+                {"type": "circle", "paint": {"circle-color": "#000", "circle-radius": 8}, "id": "terra_geocrud_feature",
+                 "source": "terra_geocrud_feature"}]
         }
         dict_style_post = {'style': json.dumps(dict_style),
                            'center': [-0.246322800072846, 44.5562461167907],
@@ -275,7 +305,7 @@ class ContextMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
                            'token': self.token_mapbox}
         self.assertDictEqual(dict_style_post, style)
 
-    def test_get_value_context_line_with_extra_features(self, token):
+    def test_get_value_context_line_with_extra_features(self):
         self.maxDiff = None
         self.node = MapImageLoaderURLODTNode(
             'http://mbglrenderer/render',
@@ -294,30 +324,41 @@ class ContextMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
                                                  "tiles": ["http://a.tile.openstreetmap.org/{z}/{x}/{y}.png"],
                                                  "tileSize": 256,
                                                  "maxzoom": 18},
-                 "primary": {"type": "geojson",
-                             "data": {"type": "LineString", "coordinates": [[-0.246322800072846, 44.5562461167907],
-                                                                            [0.0, 44.0]]}},
-                 "test": {"type": "geojson",
-                          "data": {"type": "Point", "coordinates": [-0.1, 44.2]}}},
+                 "terra_geocrud_feature": {"type": "geojson",
+                                           "data": {"type": "LineString", "coordinates": [[-0.246322800072846, 44.5562461167907],
+                                                                                          [0.0, 44.0]]}},
+                 "terra_geocrud_extra_test": {"type": "geojson",
+                                              "data": {"type": "Point", "coordinates": [-0.1, 44.2]}}},
             "layers": [
                 {"id": "DEFAULT_MBGL_RENDERER_STYLE", "type": "raster", "source": "DEFAULT_MBGL_RENDERER_STYLE"},
-                {"type": "circle", "paint": {"circle-color": "#000", "circle-radius": 8}, "id": "test",
-                 "source": "test"},
+                {"type": "circle", "paint": {"circle-color": "#000", "circle-radius": 8}, "id": "terra_geocrud_extra_test",
+                 "source": "terra_geocrud_extra_test"},
                 {"type": "line", "paint": {"line-color": "#000", "line-width": 3},
-                 "id": "primary", "source": "primary"}]
+                 "id": "terra_geocrud_feature", "source": "terra_geocrud_feature"}]
         }
         dict_style_post = {'style': json.dumps(dict_style),
-                           'center': [-0.12316140003642298, 44.27812305839535],
                            'zoom': 8,
                            'width': 1024,
                            'height': 512,
                            'token': self.token_mapbox}
-
+        center = style.pop('center')
+        self.assertAlmostEqual(center[0], -0.123161400036423)
+        self.assertAlmostEqual(center[1], 44.27812305839535)
         self.assertDictEqual(dict_style_post, style)
 
-    @mock.patch('requests.get')
-    def test_get_style_extra_layer_no_extra_feature(self, mocked_get, token):
+    def test_render_extent(self):
+        with self.assertNumQueries(1):
+            extent = get_render_extent(self.line, True, ['test'])
+        self.assertEqual(extent['count'], 2)
+        self.assertFalse(extent['points'])
+        for value, expected in zip(extent['extent'], (-0.246322800072846, 44, 0, 44.5562461167907)):
+            self.assertAlmostEqual(value, expected)
+        self.assertIsNone(get_render_extent(self.line, False, []))
+
+    @mock.patch('requests.Session.get')
+    def test_get_style_extra_layer_no_extra_feature(self, mocked_get):
         mocked_get.return_value.status_code = 200
+        mocked_get.return_value.headers = {}
         mocked_get.return_value.json.return_value = {"custom": "style"}
         self.extra_layer.features.all().delete()
         self.maxDiff = None
@@ -327,29 +368,106 @@ class ContextMapImageUrlLoaderTestCase(MapImageUrlLoaderTestCase):
         self.assertDictEqual({"custom": "style"}, self.node.get_style(self.line, False, ['test'], None))
 
 
-@mock.patch('secrets.token_hex', side_effect=['primary', 'test'])
+class RenderGeometryTestCase(TestCase):
+    def setUp(self):
+        # zigzag of 1 meter along a 1 km line
+        self.line = LineString([(i / 100000, 44 + (i % 2) / 100000) for i in range(1000)], srid=4326)
+
+    def test_simplified_for_zoom(self):
+        geojson = get_render_geojson(self.line, 10)
+        self.assertEqual(len(geojson['coordinates']), 2)
+        self.assertListEqual(geojson['coordinates'][0], [0.0, 44.0])
+        self.assertGreater(len(get_render_geojson(self.line, 22)['coordinates']), 2)
+
+    def test_full_geometry_without_zoom(self):
+        self.assertEqual(len(get_render_geojson(self.line)['coordinates']), 1000)
+
+    @mock.patch.dict(app_settings.TERRA_GEOCRUD, {'MAP_SIMPLIFY_TOLERANCE': 0})
+    def test_simplification_disabled(self):
+        self.assertEqual(len(get_render_geojson(self.line, 10)['coordinates']), 1000)
+
+    def test_coordinates_precision(self):
+        self.assertEqual(get_coordinates_precision(8), 4)
+        self.assertEqual(get_coordinates_precision(20), 8)
+
+
 class RenderMapImageUrlLoaderODTTestCase(MapImageUrlLoaderTestCase):
     @mock.patch('requests.post')
-    def test_image_url_loader_object(self, mocked_post, token):
+    def test_image_url_loader_object(self, mocked_post):
         mocked_post.return_value.status_code = 200
         mocked_post.return_value.content = SMALL_PICTURE
         context = Context({'object': self.line})
         template_to_render = Template('{% load map_tags %}{% map_image_url_loader %}')
 
         rendered_template = template_to_render.render(context)
-        self.assertEqual('<draw:frame draw:name="test.png" svg:width="15.0" svg:height="15.0" '
+        name = list(context['images'])[0]
+        self.assertRegex(name, r'^[0-9a-f]{30}\.png$')
+        self.assertEqual(f'<draw:frame draw:name="{name}" svg:width="15.0" svg:height="15.0" '
                          'text:anchor-type="paragraph" draw:z-index="37">'
-                         '<draw:image xlink:href="Pictures/test.png" xlink:type="simple" xlink:show="embed" '
+                         f'<draw:image xlink:href="Pictures/{name}" xlink:type="simple" xlink:show="embed" '
                          'xlink:actuate="onLoad" draw:mime-type="image/png" />'
                          '</draw:frame>', rendered_template)
 
-    def test_map_image_url_loader_usage(self, token):
+    @mock.patch('requests.post')
+    def test_image_url_loader_render_cached(self, mocked_post):
+        mocked_post.return_value.status_code = 200
+        mocked_post.return_value.content = SMALL_PICTURE
+        template_to_render = Template('{% load map_tags %}{% map_image_url_loader width=200 %}')
+
+        first_render = template_to_render.render(Context({'object': self.line}))
+        second_render = template_to_render.render(Context({'object': self.line}))
+        self.assertEqual(first_render, second_render)
+        mocked_post.assert_called_once()
+        # map changes with feature geometry
+        self.line.geom = LineString((0, 44), (1, 45))
+        self.line.save()
+        template_to_render.render(Context({'object': Feature.objects.get(pk=self.line.pk)}))
+        self.assertEqual(mocked_post.call_count, 2)
+
+    @mock.patch.dict(app_settings.TERRA_GEOCRUD, {'MAP_RENDER_CACHE_TIMEOUT': 0})
+    @mock.patch('requests.post')
+    def test_image_url_loaders_rendered_concurrently(self, mocked_post):
+        threads = []
+
+        def render(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return mock.Mock(status_code=200, content=SMALL_PICTURE)
+
+        mocked_post.side_effect = render
+        context = Context({'object': self.line})
+        template_to_render = Template('{% load map_tags %}{% map_image_url_loader width=200 %}'
+                                      '{% block map %}{% map_image_url_loader width=300 %}{% endblock %}')
+        rendered_template = template_to_render.render(context)
+        self.assertEqual(mocked_post.call_count, 2)
+        self.assertNotIn(threading.main_thread(), threads)
+        self.assertEqual(len(context['images']), 2)
+        self.assertEqual(rendered_template.count('<draw:frame'), 2)
+
+    @mock.patch.dict(app_settings.TERRA_GEOCRUD, {'MAP_RENDER_CACHE_TIMEOUT': 0})
+    @mock.patch('requests.post')
+    def test_image_url_loaders_in_conditions_not_prefetched(self, mocked_post):
+        mocked_post.return_value.status_code = 200
+        mocked_post.return_value.content = SMALL_PICTURE
+        context = Context({'object': self.line, 'slugs': ['a', 'b']})
+        template_to_render = Template('{% load map_tags %}{% map_image_url_loader width=200 %}'
+                                      '{% map_image_url_loader width=250 %}'
+                                      '{% if missing %}{% map_image_url_loader width=300 %}{% endif %}'
+                                      '{% for slug in slugs %}{% map_image_url_loader extra_features=slug %}{% endfor %}')
+        with mock.patch.object(MapImageLoaderURLODTNode, 'get_data', autospec=True,
+                               side_effect=MapImageLoaderURLODTNode.get_data) as get_data:
+            rendered_template = template_to_render.render(context)
+        # top level tags prefetched and rendered once, loop tags rendered by their tag, false branch not rendered
+        self.assertEqual(mocked_post.call_count, 4)
+        self.assertEqual(get_data.call_count, 4)
+        self.assertEqual(rendered_template.count('<draw:frame'), 4)
+
+    def test_map_image_url_loader_usage(self):
         with self.assertRaises(TemplateSyntaxError) as cm:
             Template('{% load map_tags %}{% map_image_url_loader wrong_key="test" %}')
         self.assertEqual('Usage: {% map_image_url_loader width="5000" height="5000" feature_included=False '
                          'extra_features="feature_1" base_layer="mapbaselayer_1" anchor="as-char" %}', str(cm.exception))
 
-    def test_image_url_loader_no_object(self, token):
+    def test_image_url_loader_no_object(self):
         context = Context({'object': self.line})
         template_to_render = Template('{% load map_tags %}{% map_image_url_loader feature_included=False %}')
 
@@ -385,19 +503,21 @@ class RenderMapImageUrlLoaderPDFTestCase(MapImageUrlLoaderTestCase):
 
 class ZoomLineMapImageUrlLoaderTestCase(TestCase):
     def test_get_zoom(self):
-        node = MapImageLoaderURLODTNode('http://mbglrenderer/render')
         collection = GeometryCollection(LineString([[-180, -85.06], [180, 85.06]]), srid=4326)
-        self.assertEqual(0, node.get_zoom_bounds(1024, 1024, collection))
+        self.assertEqual(0, get_zoom(1024, 1024, collection.transform(3857, clone=True).extent))
 
     def test_get_zoom_no_width(self):
-        node = MapImageLoaderURLODTNode('http://mbglrenderer/render')
         collection = GeometryCollection(LineString([[0, -85.06], [0, 85.06]]), srid=4326)
-        self.assertEqual(0, node.get_zoom_bounds(1024, 1024, collection))
+        self.assertEqual(0, get_zoom(1024, 1024, collection.transform(3857, clone=True).extent))
 
     def test_get_zoom_no_height(self):
-        node = MapImageLoaderURLODTNode('http://mbglrenderer/render')
         collection = GeometryCollection(LineString([[-180, 0], [180, 0]]), srid=4326)
-        self.assertEqual(0, node.get_zoom_bounds(1024, 1024, collection))
+        self.assertEqual(0, get_zoom(1024, 1024, collection.transform(3857, clone=True).extent))
+
+    def test_get_zoom_extent(self):
+        self.assertEqual(0, get_zoom(512, 512, (0, 0, EARTH_CIRCUMFERENCE, EARTH_CIRCUMFERENCE)))
+        self.assertEqual(16, get_zoom(1024, 512, (0, 0, 1000, 0)))
+        self.assertEqual(22, get_zoom(1024, 512, (0, 0, 0, 0)))
 
 
 @override_settings(MEDIA_ROOT=TemporaryDirectory().name)
@@ -443,6 +563,42 @@ class StoredBase64FileTestCase(APITestCase):
         data = stored_image_base64(self.feature.properties['logo'])
         self.assertTrue(data.startswith("data;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9"))
 
+    def test_rendering_cached(self):
+        """ encoded content is cached """
+        self.feature.refresh_from_db()
+        data = stored_image_base64(self.feature.properties['logo'])
+        with mock.patch('terra_geocrud.templatetags.map_tags.base64.encodebytes') as mocked_encode:
+            self.assertEqual(stored_image_base64(self.feature.properties['logo']), data)
+        mocked_encode.assert_not_called()
+
+    def test_rendering_cached_without_reading_file(self):
+        """ cache key is computed from stored value, without rendition lookup or storage access """
+        self.feature.refresh_from_db()
+        data = stored_image_base64(self.feature.properties['logo'], 10)
+        with mock.patch('terra_geocrud.templatetags.map_tags.iter_storage_file') as mocked_iter, \
+                mock.patch('terra_geocrud.templatetags.map_tags.get_stored_image_rendition') as mocked_rendition:
+            self.assertEqual(stored_image_base64(self.feature.properties['logo'], 10), data)
+        mocked_iter.assert_not_called()
+        mocked_rendition.assert_not_called()
+
+    def test_rendering_cache_invalidated_by_new_file(self):
+        """ file uploaded again with same name is stored in another path """
+        self.feature.refresh_from_db()
+        data = stored_image_base64(self.feature.properties['logo'])
+        response = self.client.patch(reverse('feature-detail', args=(self.crud_view.layer_id, self.feature.identifier)),
+                                     data={"properties": {"logo": "data:image/png;name=titre_laromieu-fondblanc.jpg;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkqAcAAIUAgUW0RjgAAAAASUVORK5CYII="}},
+                                     format="json")
+        self.assertEqual(response.status_code, 200, response.__dict__)
+        self.feature.refresh_from_db()
+        self.assertNotEqual(stored_image_base64(self.feature.properties['logo']), data)
+
+    def test_rendering_max_size(self):
+        """ downscaled rendition is used with max size """
+        self.feature.refresh_from_db()
+        data = stored_image_base64(self.feature.properties['logo'], 10)
+        self.assertTrue(data.startswith("data:image/"))
+        self.assertNotEqual(data, stored_image_base64(self.feature.properties['logo']))
+
 
 @override_settings(MEDIA_ROOT=TemporaryDirectory().name)
 class PictogramURLForValueTestCase(TestCase):
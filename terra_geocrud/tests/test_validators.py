@@ -1,7 +1,11 @@
+from unittest import mock
+
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
+from jsonschema.validators import validator_for
 
-from terra_geocrud.validators import validate_schema_property, validate_function_path
+from terra_geocrud.validators import validate_schema_property, validate_function_path, validate_json_schema_data, \
+    get_schema_validator, reset_schema_validators
 
 
 class ValidateFunctionPathTestCase(TestCase):
@@ -26,3 +30,38 @@ class ValidateSchemaPropertyTestCase(TestCase):
     def test_validator_with_wrong_schema(self):
         with self.assertRaises(ValidationError):
             validate_schema_property({"type": "unknown"})
+
+
+class ValidateJsonSchemaDataTestCase(SimpleTestCase):
+    schema = {
+        "properties": {
+            "name": {"type": "string", "title": "Name"},
+            "level": {"type": "integer", "title": "Level", "enum": [1, 2, 3]},
+        }
+    }
+
+    def setUp(self):
+        reset_schema_validators()
+
+    def test_valid_data(self):
+        self.assertEqual(validate_json_schema_data({"name": "toto", "level": 2}, self.schema),
+                         {"name": "toto", "level": 2})
+
+    def test_invalid_data(self):
+        with self.assertRaisesMessage(ValidationError, "4 is not one of [1, 2, 3]"):
+            validate_json_schema_data({"level": 4}, self.schema)
+
+    def test_unexpected_property(self):
+        with self.assertRaises(ValidationError):
+            validate_json_schema_data({"other": 4}, self.schema)
+
+    def test_schema_is_checked_once(self):
+        with mock.patch('terra_geocrud.validators.validator_for', wraps=validator_for) as mocked_validator_for:
+            for i in range(3):
+                validate_json_schema_data({"level": 1}, self.schema)
+        mocked_validator_for.assert_called_once()
+
+    def test_validator_by_schema_version(self):
+        validator = get_schema_validator(self.schema)
+        self.assertIs(get_schema_validator(dict(self.schema)), validator)
+        self.assertIsNot(get_schema_validator({"properties": {"name": {"type": "string"}}}), validator)
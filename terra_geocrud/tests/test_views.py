@@ -1,16 +1,24 @@
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
 from tempfile import TemporaryDirectory
-from unittest.mock import patch, PropertyMock
+from unittest.mock import Mock, patch, PropertyMock
 
+import mercantile
 from django.contrib.gis.geos import Point
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import tag, TestCase
+from django.db import connection, transaction
+from django.test import RequestFactory, tag, TestCase
 from django.test.utils import override_settings
 from django.urls import reverse
+from django.utils.text import slugify
 from geostore import GeometryTypes
-from geostore.models import Feature, LayerExtraGeom, FeatureExtraGeom, LayerRelation
+from geostore.models import Feature, LayerExtraGeom, FeatureExtraGeom, FeatureRelation, LayerRelation
 from geostore.tests.factories import LayerFactory, LayerSchemaFactory
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APITestCase, APITransactionTestCase
 from terra_geocrud.properties.schema import sync_layer_schema
 
 from terra_geocrud.tests.factories import AttachmentCategoryFactory, UserFactory, RoutingSettingsFactory
@@ -18,7 +26,9 @@ from terra_geocrud.tests.factories import AttachmentCategoryFactory, UserFactory
 from terra_geocrud.models import CrudViewProperty, PropertyEnum
 from . import factories
 from .settings import FEATURE_PROPERTIES, LAYER_SCHEMA
-from .. import models, settings as app_settings
+from .utils import capture_on_commit_callbacks
+from .. import models, settings as app_settings, tasks, views
+from ..map import tiles
 from ..properties.schema import sync_ui_schema
 
 
@@ -354,6 +364,244 @@ class CrudRenderPointTemplateDetailViewTestCase(APITestCase):
                          'application/pdf')
 
 
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+class CrudGenerateTemplateAsyncViewTestCase(APITestCase):
+    def setUp(self):
+        self.crud_view = factories.CrudViewFactory(layer__schema=LAYER_SCHEMA,
+                                                   layer__geom_type=GeometryTypes.Point)
+        self.feature = Feature.objects.create(layer=self.crud_view.layer, geom=Point(x=-0.24, y=44.55),
+                                              properties=FEATURE_PROPERTIES)
+        self.template = factories.TemplatePDFFactory.create(name='Template PDF')
+        self.crud_view.templates.add(self.template)
+        self.url = reverse('feature-generate-template',
+                           args=(self.feature.layer.pk, self.feature.identifier, self.template.pk))
+        self.client.force_authenticate(UserFactory())
+
+    @patch.object(views.CrudFeatureViewSet, 'permission_classes', [IsAuthenticated])
+    def test_generate_template_permissions(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.assertIn(self.client.post(self.url).status_code,
+                      (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+        self.assertFalse(models.BackgroundJob.objects.exists())
+
+    @patch('django.db.transaction.on_commit', new=lambda func, using=None: func())
+    @patch('terra_geocrud.tasks.get_local_executor')
+    def test_generate_template_local_workers(self, get_local_executor):
+        with patch.dict(app_settings.TERRA_GEOCRUD, {'JOBS_LOCAL_WORKERS': 2}):
+            data = self.client.post(self.url).json()
+        self.assertEqual(data['state'], models.BackgroundJob.PENDING)
+        get_local_executor.return_value.submit.assert_called_once_with(tasks.run_local_background_job, data['id'])
+
+    def test_generate_template_async(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        data = response.json()
+        self.assertEqual(data['state'], models.BackgroundJob.SUCCESS, data['error'])
+        response = self.client.get(data['download_url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['content-type'], 'application/pdf')
+
+    def test_job_only_available_to_owner_and_staff(self):
+        job_id = self.client.post(self.url).json()['id']
+        self.client.force_authenticate(UserFactory())
+        self.assertEqual(self.client.get(reverse('backgroundjob-detail', args=(job_id, ))).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('backgroundjob-download', args=(job_id, ))).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        # other user gets its own job
+        self.assertNotEqual(self.client.post(self.url).json()['id'], job_id)
+        self.client.force_authenticate(UserFactory(is_staff=True))
+        self.assertEqual(self.client.get(reverse('backgroundjob-detail', args=(job_id, ))).status_code,
+                         status.HTTP_200_OK)
+
+    def test_same_feature_version_reuse_job(self):
+        job_id = self.client.post(self.url).json()['id']
+        self.assertEqual(self.client.post(self.url).json()['id'], job_id)
+        self.feature.properties = dict(FEATURE_PROPERTIES, name="Updated")
+        self.feature.save()
+        self.assertNotEqual(self.client.post(self.url).json()['id'], job_id)
+
+    def test_expired_document(self):
+        job_id = self.client.post(self.url).json()['id']
+        with patch.dict(app_settings.TERRA_GEOCRUD, {'DOCUMENTS_EXPIRATION': 0}):
+            data = self.client.get(reverse('backgroundjob-detail', args=(job_id, ))).json()
+            self.assertIsNone(data['download_url'])
+            response = self.client.get(reverse('backgroundjob-download', args=(job_id, )))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertNotEqual(self.client.post(self.url).json()['id'], job_id)
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+class CrudGenerateTemplateLockTestCase(APITransactionTestCase):
+    def setUp(self):
+        self.crud_view = factories.CrudViewFactory(layer__schema=LAYER_SCHEMA,
+                                                   layer__geom_type=GeometryTypes.Point)
+        self.feature = Feature.objects.create(layer=self.crud_view.layer, geom=Point(x=-0.24, y=44.55),
+                                              properties=FEATURE_PROPERTIES)
+        self.template = factories.TemplatePDFFactory.create(name='Template PDF')
+        self.crud_view.templates.add(self.template)
+        self.client.force_authenticate(UserFactory())
+
+    def test_feature_lock_released_before_rendering(self):
+        def lock_feature():
+            try:
+                with transaction.atomic():
+                    return len(Feature.objects.select_for_update(nowait=True).filter(pk=self.feature.pk))
+            finally:
+                connection.close()
+
+        def render(job):
+            # feature can be locked by another connection while document is rendered
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(lock_feature).result()
+
+        with patch('terra_geocrud.documents.generate_document', side_effect=render) as mocked_render:
+            response = self.client.post(reverse('feature-generate-template',
+                                                args=(self.feature.layer.pk, self.feature.identifier,
+                                                      self.template.pk)))
+        mocked_render.assert_called_once()
+        data = response.json()
+        self.assertEqual(data['state'], models.BackgroundJob.SUCCESS, data['error'])
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+class CrudGenerateDocumentsViewTestCase(APITestCase):
+    def setUp(self):
+        self.crud_view = factories.CrudViewFactory(layer__schema=LAYER_SCHEMA,
+                                                   layer__geom_type=GeometryTypes.Point)
+        for name in ("Feature 1", "Feature 2"):
+            Feature.objects.create(layer=self.crud_view.layer, geom=Point(x=-0.24, y=44.55),
+                                   properties=dict(FEATURE_PROPERTIES, name=name))
+        self.template = factories.TemplateDocxFactory.create(name='Template ODT')
+        self.crud_view.templates.add(self.template)
+        self.client.force_authenticate(UserFactory())
+
+    def test_generate_documents_zip(self):
+        response = self.client.post(reverse('feature-generate-documents',
+                                            args=(self.crud_view.layer_id, self.template.pk)))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, response.content)
+        data = response.json()
+        self.assertEqual(data['state'], models.BackgroundJob.SUCCESS, data['error'])
+        self.assertEqual(data['result']['documents'], 2)
+        self.assertEqual(data['progress'], 100)
+
+        response = self.client.get(data['download_url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            names = archive.namelist()
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all(name.startswith('Template ODT_') and name.endswith('.docx') for name in names))
+
+    def test_generate_documents_filtered(self):
+        url = reverse('feature-generate-documents', args=(self.crud_view.layer_id, self.template.pk))
+        response = self.client.post(f"{url}?properties__name=Feature 2")
+        self.assertEqual(response.json()['total'], 1)
+
+    def test_generate_documents_without_feature(self):
+        url = reverse('feature-generate-documents', args=(self.crud_view.layer_id, self.template.pk))
+        response = self.client.post(f"{url}?properties__name=Unknown")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_generate_documents_unknown_template(self):
+        response = self.client.post(reverse('feature-generate-documents', args=(self.crud_view.layer_id, 0)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CrudViewTilesTestCase(APITestCase):
+    def setUp(self):
+        tiles.get_tile_cache().clear()
+        self.crud_view = factories.CrudViewFactory()
+        CrudViewProperty.objects.create(view=self.crud_view, key="name", include_in_tile=True,
+                                        json_schema={'type': "string", "title": "Name"})
+        CrudViewProperty.objects.create(view=self.crud_view, key="country",
+                                        json_schema={'type': "string", "title": "Country"})
+        self.feature = Feature.objects.create(layer=self.crud_view.layer, geom='POINT(2 45)',
+                                              properties={"name": "Mill", "country": "France"})
+        self.tile = mercantile.tile(2, 45, 10)
+        self.url = reverse('crudview-tiles', args=(self.crud_view.pk, self.tile.z, self.tile.x, self.tile.y))
+        self.client.force_authenticate(UserFactory())
+
+    def test_tile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], tiles.TILE_CONTENT_TYPE)
+        self.assertIn(self.crud_view.layer.name.encode(), response.content)
+        # only include_in_tile properties
+        self.assertIn(b'Mill', response.content)
+        self.assertNotIn(b'France', response.content)
+
+    def test_tile_without_features(self):
+        response = self.client.get(reverse('crudview-tiles', args=(self.crud_view.pk, 10, 0, 0)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'')
+
+    def test_tile_out_of_range(self):
+        response = self.client.get(reverse('crudview-tiles', args=(self.crud_view.pk, 1, 2, 0)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tile_relation_and_extra_geometry_layers(self):
+        extra_layer = LayerExtraGeom.objects.create(geom_type=GeometryTypes.Point, title='entrance',
+                                                    layer=self.crud_view.layer)
+        FeatureExtraGeom.objects.create(layer_extra_geom=extra_layer, feature=self.feature, geom='POINT(2.001 45)')
+        destination_crud_view = factories.CrudViewFactory()
+        relation = LayerRelation.objects.create(name='mills', relation_type='intersects', origin=self.crud_view.layer,
+                                                destination=destination_crud_view.layer)
+        destination = Feature.objects.create(layer=destination_crud_view.layer, geom='POINT(2.002 45)',
+                                             properties={"name": "Shed"})
+        FeatureRelation.objects.create(origin=self.feature, destination=destination, relation=relation)
+        response = self.client.get(self.url)
+        self.assertIn(extra_layer.name.encode(), response.content)
+        self.assertIn(f'relation-{slugify(self.crud_view.layer.name)}-mills'.encode(), response.content)
+        self.assertIn(b'Shed', response.content)
+
+    @patch('terra_geocrud.map.tiles.render_tile', wraps=tiles.render_tile)
+    def test_tile_cached(self, render_tile):
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertIn(b'Mill', response.content)
+        render_tile.assert_called_once()
+
+    @patch('terra_geocrud.map.tiles.render_tile', wraps=tiles.render_tile)
+    def test_tile_invalidated_after_commit(self, render_tile):
+        self.client.get(self.url)
+        self.feature.geom = 'POINT(-60 -20)'
+        self.feature.save()
+        # test transaction is not committed
+        self.client.get(self.url)
+        render_tile.assert_called_once()
+
+    @patch('terra_geocrud.signals.get_queryset_extent')
+    def test_tile_previous_geometry_not_queried(self, get_queryset_extent):
+        self.client.get(self.url)
+        feature = Feature.objects.get(pk=self.feature.pk)
+        feature.geom = 'POINT(-60 -20)'
+        feature.save()
+        get_queryset_extent.assert_not_called()
+        self.assertEqual(feature._tiles_previous_extent, (2, 45, 2, 45))
+
+    @patch('django.db.transaction.on_commit', new=lambda func, using=None: func())
+    @patch('terra_geocrud.map.tiles.render_tile', wraps=tiles.render_tile)
+    def test_tile_invalidated_by_feature_in_tile(self, render_tile):
+        self.client.get(self.url)
+        # feature out of tile
+        Feature.objects.create(layer=self.crud_view.layer, geom='POINT(-60 -20)', properties={"name": "Hut"})
+        self.client.get(self.url)
+        self.assertEqual(render_tile.call_count, 1)
+        # feature moved out of tile
+        self.feature.geom = 'POINT(-60 -20)'
+        self.feature.save()
+        response = self.client.get(self.url)
+        self.assertEqual(render_tile.call_count, 2)
+        self.assertEqual(response.content, b'')
+
+    def test_tiles_range(self):
+        self.assertEqual(tiles.get_tiles_range((-180, -90, 180, 90), 2), (0, 0, 3, 3))
+        self.assertEqual(tiles.get_tiles_range((2, 45, 2, 45), 10), (self.tile.x, self.tile.y) * 2)
+        # buffer reaches neighbour tiles
+        self.assertEqual(tiles.get_tiles_range((0, 0, 0, 0), 3, 4), (3, 3, 4, 4))
+
+
 @override_settings(MEDIA_ROOT=TemporaryDirectory().name)
 class CrudLayerViewsSetTestCase(APITestCase):
     def setUp(self):
@@ -698,6 +946,121 @@ class CrudFeatureViewsSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+class CrudFeaturePropertyFilterTestCase(APITestCase):
+    def setUp(self):
+        self.crud_view = factories.CrudViewFactory()
+        CrudViewProperty.objects.create(view=self.crud_view, key="name",
+                                        json_schema={'type': "string", "title": "Name"})
+        CrudViewProperty.objects.create(view=self.crud_view, key="age",
+                                        json_schema={'type': "integer", "title": "Age"})
+        CrudViewProperty.objects.create(view=self.crud_view, key="tags",
+                                        json_schema={'type': "array", "title": "Tags", "items": {"type": "string"}})
+        sync_layer_schema(self.crud_view)
+        self.feature_1 = Feature.objects.create(layer=self.crud_view.layer, geom='POINT(0 0)',
+                                                properties={"name": "Paris", "age": 9, "tags": ["a"]})
+        self.feature_2 = Feature.objects.create(layer=self.crud_view.layer, geom='POINT(0 0)',
+                                                properties={"name": "Lyon", "age": 10, "tags": ["a", "b"]})
+        self.feature_3 = Feature.objects.create(layer=self.crud_view.layer, geom='POINT(0 0)',
+                                                properties={"name": "Nice"})
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+
+    def get_identifiers(self, **params):
+        response = self.client.get(reverse('feature-list', args=(self.crud_view.layer_id,)), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.json())
+        return [feature['identifier'] for feature in response.json()]
+
+    def test_numeric_filters(self):
+        # numeric comparison, not text comparison ("10" < "9")
+        self.assertEqual(self.get_identifiers(property__age__gt='9'), [str(self.feature_2.identifier)])
+        self.assertEqual(self.get_identifiers(property__age='9'), [str(self.feature_1.identifier)])
+        self.assertEqual(len(self.get_identifiers(property__age__in='9,10')), 2)
+
+    def test_text_filters(self):
+        self.assertEqual(self.get_identifiers(property__name__contains='ly'), [str(self.feature_2.identifier)])
+        self.assertEqual(self.get_identifiers(property__age__isnull='true'), [str(self.feature_3.identifier)])
+
+    def test_array_filter(self):
+        self.assertEqual(self.get_identifiers(property__tags__contains='b'), [str(self.feature_2.identifier)])
+
+    def test_isnull_filter_with_json_null(self):
+        feature_4 = Feature.objects.create(layer=self.crud_view.layer, geom='POINT(0 0)',
+                                           properties={"name": "Nantes", "age": None})
+        self.assertEqual(sorted(self.get_identifiers(property__age__isnull='true')),
+                         sorted([str(self.feature_3.identifier), str(feature_4.identifier)]))
+        self.assertEqual(sorted(self.get_identifiers(property__age__isnull='false')),
+                         sorted([str(self.feature_1.identifier), str(self.feature_2.identifier)]))
+
+    def test_invalid_filters(self):
+        url = reverse('feature-list', args=(self.crud_view.layer_id,))
+        for params in ({'property__age': 'abc'}, {'property__unknown': '1'}, {'property__age__regex': '1'},
+                       {'property__tags__gt': 'a'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_ordering(self):
+        self.assertEqual(self.get_identifiers(ordering='-property__age'),
+                         [str(self.feature_2.identifier), str(self.feature_1.identifier),
+                          str(self.feature_3.identifier)])
+        self.assertEqual(self.get_identifiers(ordering='property__age'),
+                         [str(self.feature_1.identifier), str(self.feature_2.identifier),
+                          str(self.feature_3.identifier)])
+
+
+class CrudFeatureFacetsTestCase(APITestCase):
+    def setUp(self):
+        self.crud_view = factories.CrudViewFactory()
+        level = CrudViewProperty.objects.create(view=self.crud_view, key="level",
+                                                json_schema={'type': "string", "title": "Level"})
+        PropertyEnum.objects.create(value="low", property=level)
+        PropertyEnum.objects.create(value="high", property=level)
+        CrudViewProperty.objects.create(view=self.crud_view, key="active",
+                                        json_schema={'type': "boolean", "title": "Active"})
+        CrudViewProperty.objects.create(view=self.crud_view, key="tags",
+                                        json_schema={'type': "array", "title": "Tags",
+                                                     "items": {"type": "string", "enum": ["a", "b"]}})
+        CrudViewProperty.objects.create(view=self.crud_view, key="age",
+                                        json_schema={'type': "integer", "title": "Age"})
+        sync_layer_schema(self.crud_view)
+        Feature.objects.create(layer=self.crud_view.layer, geom='POINT(0 0)',
+                               properties={"level": "low", "active": True, "tags": ["a", "b"], "age": 1})
+        Feature.objects.create(layer=self.crud_view.layer, geom='POINT(0 0)',
+                               properties={"level": "low", "active": False, "tags": ["a"], "age": 2})
+        self.url = reverse('feature-facets', args=(self.crud_view.layer_id,))
+        self.client.force_authenticate(UserFactory())
+
+    def test_facets(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.json())
+        self.assertDictEqual(response.json(), {
+            'level': [{'value': 'low', 'count': 2}, {'value': 'high', 'count': 0}],
+            'active': [{'value': True, 'count': 1}, {'value': False, 'count': 1}],
+            'tags': [{'value': 'a', 'count': 2}, {'value': 'b', 'count': 1}],
+        })
+
+    def test_facets_with_filters(self):
+        response = self.client.get(self.url, {'facets': 'tags', 'property__age__gte': '2'})
+        self.assertDictEqual(response.json(), {'tags': [{'value': 'a', 'count': 1}, {'value': 'b', 'count': 0}]})
+
+    def test_facets_cache_invalidated_by_feature_change(self):
+        self.client.get(self.url, {'facets': 'level'})
+        with capture_on_commit_callbacks(execute=True):
+            Feature.objects.create(layer=self.crud_view.layer, geom='POINT(0 0)', properties={"level": "high"})
+        response = self.client.get(self.url, {'facets': 'level'})
+        self.assertDictEqual(response.json(), {'level': [{'value': 'low', 'count': 2}, {'value': 'high', 'count': 1}]})
+
+    def test_facets_without_facet_properties(self):
+        crud_view = factories.CrudViewFactory()
+        Feature.objects.create(layer=crud_view.layer, geom='POINT(0 0)', properties={"name": "Mill"})
+        response = self.client.get(reverse('feature-facets', args=(crud_view.layer_id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertDictEqual(response.json(), {})
+
+    def test_facets_unavailable(self):
+        response = self.client.get(self.url, {'facets': 'age'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 @override_settings(MEDIA_ROOT=TemporaryDirectory().name)
 class FeatureAttachmentViewsetTesCase(APITestCase):
     def setUp(self) -> None:
@@ -716,3 +1079,62 @@ class FeatureAttachmentViewsetTesCase(APITestCase):
                                      "legend": "file_test",
                                      "file": file}, format='multipart')
         self.assertEqual(response.status_code, 201, response.json())
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+class FileDownloadTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.crud_view = factories.CrudViewFactory()
+        self.feature = Feature.objects.create(layer=self.crud_view.layer,
+                                              geom='POINT(0 0)',
+                                              properties={"name": "toto"})
+        self.attachment = factories.FeatureAttachmentFactory(feature=self.feature, file__data=b'0123456789')
+        self.user = UserFactory()
+        self.client.force_authenticate(self.user)
+
+    def test_download_attachment(self):
+        response = self.client.get(reverse('attachment-download', args=(self.feature.identifier, self.attachment.pk)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="{Path(self.attachment.file.name).name}"')
+
+    def test_download_attachment_range(self):
+        response = self.client.get(reverse('attachment-download', args=(self.feature.identifier, self.attachment.pk)),
+                                   HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+        response = self.client.get(reverse('attachment-download', args=(self.feature.identifier, self.attachment.pk)),
+                                   HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_download_attachment_x_accel_redirect(self):
+        with patch.dict(app_settings.TERRA_GEOCRUD, {'FILE_DOWNLOAD_OFFLOAD': 'x-accel-redirect'}):
+            response = self.client.get(reverse('attachment-download',
+                                               args=(self.feature.identifier, self.attachment.pk)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.attachment.file.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_download_x_sendfile_remote_storage(self):
+        storage = Mock(**{'exists.return_value': True, 'size.return_value': 10,
+                          'open.side_effect': lambda name, mode: BytesIO(b'0123456789'),
+                          'path.side_effect': NotImplementedError})
+        with patch.dict(app_settings.TERRA_GEOCRUD, {'FILE_DOWNLOAD_OFFLOAD': 'x-sendfile'}):
+            response = views.file_download_response(RequestFactory().get('/'), storage, 'remote/file.txt')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Sendfile', response)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    def test_download_property_not_file(self):
+        response = self.client.get(reverse('feature-download-file',
+                                           args=(self.crud_view.layer_id, self.feature.identifier, 'name')))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_download_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse('attachment-download', args=(self.feature.identifier, self.attachment.pk)))
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
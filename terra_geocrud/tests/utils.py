@@ -0,0 +1,19 @@
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from django.test import TestCase
+
+
+@contextmanager
+def capture_on_commit_callbacks(execute=False):
+    """ TestCase.captureOnCommitCallbacks, with a fallback for django < 3.2 collecting transaction.on_commit calls """
+    if hasattr(TestCase, 'captureOnCommitCallbacks'):
+        with TestCase.captureOnCommitCallbacks(execute=execute) as callbacks:
+            yield callbacks
+        return
+    callbacks = []
+    with patch('django.db.transaction.on_commit', side_effect=lambda func, using=None: callbacks.append(func)):
+        yield callbacks
+    if execute:
+        for callback in callbacks:
+            callback()
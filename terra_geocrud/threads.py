@@ -0,0 +1,58 @@
+import queue
+import threading
+
+from django.db import connection
+
+
+def map_in_threads(func, items, workers):
+    """
+    Yield func result for each item, in items order, computed by workers threads. Each thread uses its own
+    database connection, closed once when thread has no more items. Items are handled in current thread
+    if workers is 1. Exceptions raised by func are raised when their result is reached.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        yield from map(func, items)
+        return
+
+    tasks = queue.Queue()
+    for index, item in enumerate(items):
+        tasks.put((index, item))
+    results = queue.Queue()
+
+    def work():
+        try:
+            while True:
+                try:
+                    index, item = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results.put((index, func(item), None))
+                except Exception as exc:
+                    results.put((index, None, exc))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=work, daemon=True) for _i in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.start()
+    done = {}
+    try:
+        for index in range(len(items)):
+            while index not in done:
+                result_index, result, exc = results.get()
+                done[result_index] = (result, exc)
+            result, exc = done.pop(index)
+            if exc is not None:
+                raise exc
+            yield result
+    finally:
+        # remaining items are dropped if iteration is stopped
+        while True:
+            try:
+                tasks.get_nowait()
+            except queue.Empty:
+                break
+        for thread in threads:
+            thread.join()
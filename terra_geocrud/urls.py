@@ -7,6 +7,7 @@ router = DefaultRouter()
 router.register('groups', views.CrudGroupViewSet)
 router.register('views', views.CrudViewViewSet)
 router.register('attachment-categories', views.CrudAttachmentCategoryViewSet)
+router.register('jobs', views.BackgroundJobViewSet)
 router.register(r'layers', views.CrudLayerViewSet, basename='layer')
 router.register(r'layers/(?P<layer>[\d\w\-_]+)/features', views.CrudFeatureViewSet, basename='feature')
 router.register(r'features/(?P<identifier>[0-9a-f-]+)/pictures',
@@ -1,8 +1,19 @@
+import hashlib
+import json
+
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
 
 from geostore.validators import validate_json_schema
 
+from .cache import LocalLRUCache
+
+_schema_validators = LocalLRUCache('SCHEMA_VALIDATOR_CACHE_SIZE')
+
 
 def validate_schema_property(value):
     """ check if schema property is valid """
@@ -21,3 +32,49 @@ def validate_function_path(value):
         except ImportError:
             raise ValidationError(message=f"function {value} does not exist")
     return value
+
+
+def validate_search_config(value):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = %s", [value])
+        if not cursor.fetchone():
+            raise ValidationError(message=_("Text search configuration %(value)s does not exist") % {'value': value})
+    return value
+
+
+def get_schema_hash(schema):
+    return hashlib.md5(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+
+
+def get_schema_validator(schema):
+    """
+    Get json schema validator, checked and instantiated once per process for each schema version.
+    Least recently used validators are dropped above SCHEMA_VALIDATOR_CACHE_SIZE.
+    """
+    schema_hash = get_schema_hash(schema)
+    validator = _schema_validators.get(schema_hash)
+    if validator is None:
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        # validator keeps its own copy, as layer schema can be modified in place
+        validator = cls(json.loads(json.dumps(schema)))
+        _schema_validators.set(schema_hash, validator)
+    return validator
+
+
+def reset_schema_validators():
+    _schema_validators.clear()
+
+
+def validate_json_schema_data(value, schema):
+    """ Same as geostore validate_json_schema_data, with cached validator """
+    if value and schema:
+        unexpected_properties = value.keys() - schema.get('properties').keys()
+        if unexpected_properties:
+            # value key(s) not in expected properties
+            raise ValidationError(message=_("%(properties)s not in schema properties")
+                                  % {'properties': unexpected_properties})
+        error = best_match(get_schema_validator(schema).iter_errors(value))
+        if error is not None:
+            raise ValidationError(message=error.message)
+    return value
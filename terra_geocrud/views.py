@@ -1,33 +1,123 @@
 import mimetypes
+import re
 from copy import deepcopy
 from pathlib import Path
+from urllib.parse import quote
 
 import reversion
 from django.conf import settings
 from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
-from django.utils import formats, timezone
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext as _
 from geostore import settings as geostore_settings
+from geostore.filters import JSONFieldFilterBackend, JSONSearchField
 from geostore.models import Feature, Layer
 from geostore.serializers import FeatureSerializer
 from geostore.views import FeatureViewSet
 from mapbox_baselayer.models import MapBaseLayer
-from rest_framework import viewsets, filters
+from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 from . import models, serializers, settings as app_settings
+from .documents import get_document_content_type, get_document_name, request_document_generation
+from .filters import CrudFullTextSearchFilter, CrudPropertyFilterBackend, CrudPropertyOrderingFilter
+from .map.tiles import TILE_CONTENT_TYPE, get_tile
+from .properties.facets import get_facet_properties, get_facets
+from .properties.statistics import request_statistics_refresh
+from .properties.files import get_storage, get_storage_path_from_value
 
 # use BaseViewsSet as defined in geostore settings. using django-geostore-routing change this value
 LayerViewSet = import_string(geostore_settings.GEOSTORE_LAYER_VIEWSSET)
 
 
+RANGE_RE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+
+def get_range(range_header, size):
+    """ Parse single range http header. Return (start, end) included, or None if not handled """
+    match = RANGE_RE.match(range_header or '')
+    if not match or not (match.group('start') or match.group('end')):
+        return None
+    if not match.group('start'):
+        # suffix range : last bytes
+        start, end = max(size - int(match.group('end')), 0), size - 1
+    else:
+        start = int(match.group('start'))
+        end = min(int(match.group('end')), size - 1) if match.group('end') else size - 1
+    if end < start < size:
+        # invalid range is ignored
+        return None
+    return start, end
+
+
+def iter_file_range(file, length, chunk_size=FileResponse.block_size):
+    try:
+        while length > 0:
+            data = file.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def file_download_response(request, storage, name):
+    """
+    Serve storage file. Transfer is delegated to front proxy if FILE_DOWNLOAD_OFFLOAD is defined,
+    x-sendfile only for storages with local paths.
+    """
+    if not name or not storage.exists(name):
+        raise Http404
+    filename = Path(name).name
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    offload = app_settings.TERRA_GEOCRUD['FILE_DOWNLOAD_OFFLOAD']
+
+    response = None
+    if offload == 'x-accel-redirect':
+        # nginx serves internal location and handles range requests
+        response = HttpResponse(content_type=content_type)
+        internal_url = app_settings.TERRA_GEOCRUD['FILE_DOWNLOAD_INTERNAL_URL'].rstrip('/')
+        response['X-Accel-Redirect'] = f"{internal_url}/{quote(name)}"
+    elif offload == 'x-sendfile':
+        try:
+            path = storage.path(name)
+        except NotImplementedError:
+            # remote storage files have no local path, they are streamed
+            path = None
+        if path:
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = path
+    if response is None:
+        size = storage.size(name)
+        byte_range = get_range(request.META.get('HTTP_RANGE'), size)
+        if byte_range and byte_range[0] >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        file = storage.open(name, 'rb')
+        if byte_range:
+            start, end = byte_range
+            file.seek(start)
+            response = StreamingHttpResponse(iter_file_range(file, end - start + 1), status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(file, content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 def set_reversion_user(_reversion, user):
     if not user.is_anonymous:
         _reversion.set_user(user)
@@ -56,6 +146,55 @@ class CrudViewViewSet(ReversionMixin, viewsets.ModelViewSet):
     queryset = models.CrudView.objects.prefetch_related('routing_settings')
     serializer_class = serializers.CrudViewSerializer
 
+    @action(detail=True, methods=['get', 'post'])
+    def statistics(self, request, *args, **kwargs):
+        """
+        Stored statistics of numeric and date properties, flagged outdated after feature changes.
+        POST starts a refresh job if they are outdated.
+        """
+        crud_view = self.get_object()
+        if request.method == 'POST':
+            request_statistics_refresh(crud_view)
+        return Response({
+            statistics.property.key: dict(statistics.values, outdated=statistics.data_version != crud_view.data_version)
+            for statistics in crud_view.statistics.select_related('property')
+        })
+
+    @action(detail=True, methods=['get'], url_path=r'tiles/(?P<z>\d{1,2})/(?P<x>\d+)/(?P<y>\d+)', url_name='tiles')
+    def tiles(self, request, z, x, y, *args, **kwargs):
+        """ Cached vector tile of crud view layer, with its relation and extra geometry layers """
+        crud_view = self.get_object()
+        z, x, y = int(z), int(x), int(y)
+        if x >= 2 ** z or y >= 2 ** z:
+            raise Http404
+        return HttpResponse(get_tile(crud_view, z, x, y), content_type=TILE_CONTENT_TYPE)
+
+
+class BackgroundJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Background jobs status. Files generated by jobs are served by download action.
+    Users only get their own jobs, staff members get all jobs.
+    """
+    queryset = models.BackgroundJob.objects.all()
+    serializer_class = serializers.BackgroundJobSerializer
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        user = self.request.user
+        if not user.is_authenticated:
+            return qs.none()
+        if user.is_staff:
+            return qs
+        return qs.filter(owner=user)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.state != job.SUCCESS or job.expired:
+            raise Http404
+        return file_download_response(request, get_storage(), job.result.get('path'))
+
 
 class CrudSettingsApiView(APIView):
     def get_menu_section(self):
@@ -111,6 +250,8 @@ class CrudLayerViewSet(LayerViewSet):
 class CrudFeatureViewSet(ReversionMixin, FeatureViewSet):
     serializer_class_extra_geom = serializers.CrudFeatureExtraGeomSerializer
     permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    filter_backends = (JSONFieldFilterBackend, CrudPropertyOrderingFilter, JSONSearchField,
+                       CrudPropertyFilterBackend, CrudFullTextSearchFilter)
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -118,6 +259,12 @@ class CrudFeatureViewSet(ReversionMixin, FeatureViewSet):
                                    'layer__extra_geometries',
                                    'extra_geometries')
 
+    def get_permissions(self):
+        if self.action == 'generate_template' and self.request.method == 'GET':
+            # documents are served without authentication, jobs are created with crud api permissions
+            return []
+        return super().get_permissions()
+
     def get_serializer_class(self):
         if self.action in ('retrieve', 'update', 'partial_update', 'create'):
             return serializers.CrudFeatureDetailSerializer
@@ -125,23 +272,22 @@ class CrudFeatureViewSet(ReversionMixin, FeatureViewSet):
             return self.transform_serializer_geojson(FeatureSerializer)
         return serializers.CrudFeatureListSerializer
 
-    @action(detail=True, methods=['get'], permission_classes=[],
+    @action(detail=True, methods=['get', 'post'],
             url_path=r'generate-template/(?P<id_template>\d+)', url_name='generate-template')
     def generate_template(self, request, *args, **kwargs):
-        """ Custom action to serve generated document from templates """
+        """
+        Custom action to serve generated document from templates.
+        With POST, document is generated in a background job, to be downloaded when ready.
+        """
         feature = self.get_object()
         template = get_object_or_404(feature.layer.crud_view.templates.all(),
                                      pk=self.kwargs.get('id_template'))
-        content_type, _encoding = mimetypes.guess_type(template.template_file.name)
-        path = Path(template.template_file.name)
-        original_suffix = path.suffix
-        for suffix in path.suffixes:
-            if 'pdf' in suffix:
-                content_type = "application/pdf"
-                original_suffix = ".pdf"
-        feature_name = feature.layer.crud_view.get_feature_title(feature)
-        date_formatted = formats.date_format(timezone.localtime(), "SHORT_DATETIME_FORMAT")
-        new_name = f"{template.name}_{feature_name}_{date_formatted}{original_suffix}"
+        if request.method == 'POST':
+            job = request_document_generation(feature.layer.crud_view, template, feature, owner=request.user)
+            serializer = serializers.BackgroundJobSerializer(job, context=self.get_serializer_context())
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        content_type, _suffix = get_document_content_type(template)
+        new_name = get_document_name(template, feature)
 
         response = TemplateResponse(
             request=self.request,
@@ -152,6 +298,54 @@ class CrudFeatureViewSet(ReversionMixin, FeatureViewSet):
         response['Content-Disposition'] = f'attachment; filename="{new_name}"'
         return response
 
+    @action(detail=False, methods=['post'],
+            url_path=r'generate-documents/(?P<id_template>\d+)', url_name='generate-documents')
+    def generate_documents(self, request, *args, **kwargs):
+        """ Start background job generating template documents of filtered features in a zip """
+        crud_view = getattr(self.get_layer(), 'crud_view', None)
+        if not crud_view:
+            raise Http404
+        template = get_object_or_404(crud_view.templates.all(), pk=self.kwargs.get('id_template'))
+        features = list(self.filter_queryset(self.get_queryset()).values_list('pk', flat=True))
+        if not features:
+            raise ValidationError({'features': _("No feature selected")})
+        owner = request.user if request.user.is_authenticated else None
+        job = models.BackgroundJob.objects.create(crud_view=crud_view, action=models.BackgroundJob.GENERATE_DOCUMENTS,
+                                                  owner=owner, params={'template': template.pk, 'features': features})
+        job.refresh_from_db()
+        serializer = serializers.BackgroundJobSerializer(job, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], url_path=r'files/(?P<property_key>[\w-]+)', url_name='download-file')
+    def download_file(self, request, *args, **kwargs):
+        """ Download file stored in data-url property """
+        feature = self.get_object()
+        property_key = self.kwargs.get('property_key')
+        schema = feature.layer.schema.get('properties', {}).get(property_key, {})
+        value = feature.properties.get(property_key)
+        if schema.get('format') != 'data-url' or not value:
+            raise Http404
+        try:
+            storage_file_path = get_storage_path_from_value(value)
+        except IndexError:
+            raise Http404
+        return file_download_response(request, get_storage(), storage_file_path)
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request, *args, **kwargs):
+        """ Value counts of enum and boolean properties in filtered features. Select them with facets param """
+        crud_view = getattr(self.get_layer(), 'crud_view', None)
+        if not crud_view:
+            raise Http404
+        available = get_facet_properties(crud_view)
+        keys = [key for key in request.query_params.get('facets', '').split(',') if key] or list(available)
+        unknown = set(keys) - available.keys()
+        if unknown:
+            raise ValidationError({'facets': _("Unable to compute facets of %s") % ', '.join(sorted(unknown))})
+        filters = {key: value for key, value in request.query_params.items() if key not in ('facets', 'format')}
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(get_facets(crud_view, queryset, {key: available[key] for key in keys}, filters))
+
 
 class CrudAttachmentCategoryViewSet(ReversionMixin, viewsets.ModelViewSet):
     queryset = models.AttachmentCategory.objects.all()
@@ -183,9 +377,19 @@ class CrudFeaturePictureViewSet(ReversionMixin, BehindFeatureMixin, viewsets.Mod
     def get_queryset(self):
         return self.get_feature().pictures.all()
 
+    @action(detail=True, methods=['get'])
+    def download(self, request, *args, **kwargs):
+        picture = self.get_object()
+        return file_download_response(request, picture.image.storage, picture.image.name)
+
 
 class CrudFeatureAttachmentViewSet(ReversionMixin, BehindFeatureMixin, viewsets.ModelViewSet):
     serializer_class = serializers.FeatureAttachmentSerializer
 
     def get_queryset(self):
         return self.get_feature().attachments.all()
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, *args, **kwargs):
+        attachment = self.get_object()
+        return file_download_response(request, attachment.file.storage, attachment.file.name)
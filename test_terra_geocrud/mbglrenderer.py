@@ -0,0 +1,100 @@
+"""
+Local stand-in of mbglrenderer, to develop and benchmark document generation without map rendering service.
+/render returns a deterministic PNG of requested size, and records received payload sizes, served by /stats.
+
+    python -m test_terra_geocrud.mbglrenderer --port 8080
+"""
+import argparse
+import json
+import struct
+import threading
+import zlib
+from functools import lru_cache
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+MAX_SIZE = 4096
+
+
+@lru_cache(maxsize=32)
+def get_png(width, height):
+    """ Grey PNG of width x height pixels """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    rows = (b'\x00' + b'\xdd' * width * 3) * height
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows))
+            + chunk(b'IEND', b''))
+
+
+def get_size(params, key, default):
+    try:
+        return min(MAX_SIZE, max(1, int(float(params[key][0]))))
+    except (KeyError, ValueError):
+        return default
+
+
+class MBGLRendererStandIn:
+    def __init__(self):
+        self.payloads = []
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.payloads = []
+
+    @property
+    def stats(self):
+        with self.lock:
+            return {'requests': len(self.payloads), 'bytes': sum(self.payloads),
+                    'max_bytes': max(self.payloads, default=0)}
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == '/render' and environ['REQUEST_METHOD'] == 'POST':
+            body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+            with self.lock:
+                self.payloads.append(len(body))
+            params = parse_qs(body.decode())
+            content = get_png(get_size(params, 'width', 1024), get_size(params, 'height', 512))
+            content_type = 'image/png'
+        elif path == '/stats':
+            content = json.dumps(self.stats).encode()
+            content_type = 'application/json'
+        else:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not found']
+        start_response('200 OK', [('Content-Type', content_type), ('Content-Length', str(len(content)))])
+        return [content]
+
+
+application = MBGLRendererStandIn()
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    # map tags of a document are rendered concurrently
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def get_server(host='127.0.0.1', port=0, quiet=True):
+    """ Server of stand-in application, on a free port by default """
+    return make_server(host, port, application, server_class=ThreadingWSGIServer,
+                       handler_class=QuietHandler if quiet else WSGIRequestHandler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    server = get_server(args.host, args.port, quiet=False)
+    print(f"mbglrenderer stand-in listening on {args.host}:{args.port}")
+    server.serve_forever()
@@ -15,3 +15,8 @@ DEBUG_TOOLBAR_CONFIG = {
     'SHOW_TOOLBAR_CALLBACK': lambda x: True,
 }
 MEDIA_ROOT = os.path.join(BASE_DIR, 'public', 'media')
+
+TERRA_GEOCRUD = {
+    # local stand-in with docker-compose: python -m test_terra_geocrud.mbglrenderer
+    'MBGLRENDERER_URL': os.getenv('MBGLRENDERER_URL', 'http://mbglrenderer:8080'),
+}